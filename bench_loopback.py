@@ -0,0 +1,230 @@
+"""Loopback "supercomputer" for benchmark.py: ``ssh`` and ``scp`` stand-ins.
+
+benchmark.py puts shims named ``ssh`` and ``scp`` first on the server's PATH that run
+``python bench_loopback.py ssh|scp ...``. Remote commands run locally with ``sh -c`` and
+scp copies locally, both through a ``LinkShaper`` configured from ``BENCH_SSH_*``
+variables, so latency and upload bandwidth can be injected without a real sshd.
+
+This runs once per ssh/scp call, so it sticks to cheap imports: interpreter startup
+is part of what every remote command costs in a benchmark.
+"""
+import fcntl
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import List, Optional
+
+CHUNK_SIZE = 256 * 1024
+# ssh/scp options that take a value; everything else starting with "-" is a flag
+SSH_VALUE_OPTIONS = set("bcDEeFIiJLlmOopQRSWw")
+SCP_VALUE_OPTIONS = set("cDFiJloPS")
+
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024:
+            return f"{size:.1f}{unit}" if unit != "B" else f"{int(size)}B"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+class LinkShaper:
+    """One network link: a fixed latency and a byte rate shared by everything using it.
+
+    Transfers reserve time on a virtual clock (the moment the link is next free), so
+    concurrent connections split the bandwidth instead of each getting all of it. With
+    ``state_path`` the clock lives in a file under ``flock``, shared across processes
+    (the ssh/scp shims); otherwise it is shared across threads (the fake Hub).
+    """
+
+    def __init__(self, latency: float = 0.0, rate: float = 0.0, state_path: Optional[str] = None):
+        self.latency = latency
+        self.rate = rate
+        self.state_path = state_path
+        self._next_free = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prefix: str) -> "LinkShaper":
+        return cls(
+            float(os.environ.get(f"{prefix}_LATENCY", 0)),
+            float(os.environ.get(f"{prefix}_RATE", 0)),
+            os.environ.get(f"{prefix}_STATE"),
+        )
+
+    def delay(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _reserve(self, seconds: float) -> float:
+        now = time.monotonic()
+        if self.state_path is None:
+            with self._lock:
+                start = max(now, self._next_free)
+                self._next_free = start + seconds
+                return self._next_free - now
+        with open(self.state_path, "a+") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            handle.seek(0)
+            try:
+                next_free = float(handle.read() or 0)
+            except ValueError:
+                next_free = 0.0
+            start = max(now, next_free)
+            handle.seek(0)
+            handle.truncate()
+            handle.write(repr(start + seconds))
+            return start + seconds - now
+
+    def send(self, amount: int, limit: float = 0.0):
+        """Block until ``amount`` bytes have crossed the link (``limit`` caps this sender further)."""
+        wait = self._reserve(amount / self.rate) if self.rate else 0.0
+        if limit:
+            wait = max(wait, amount / limit)
+        if wait > 0:
+            time.sleep(wait)
+
+
+def ssh(argv: List[str]) -> int:
+    """Run the remote command locally; control commands and masters are no-ops."""
+    index = 0
+    control = master = False
+    while index < len(argv) and argv[index].startswith("-"):
+        flags = argv[index][1:]
+        index += 1
+        for position, flag in enumerate(flags):
+            if flag in SSH_VALUE_OPTIONS:
+                control = control or flag == "O"
+                if position == len(flags) - 1:
+                    index += 1
+                break
+            master = master or flag == "M"
+    command = " ".join(argv[index + 1:])
+    # The loopback has no connection to keep, check or close
+    if control or master or not command:
+        return 0
+
+    link = LinkShaper.from_env("BENCH_SSH")
+    link.delay()
+    if not link.rate:
+        return subprocess.call(["sh", "-c", command])
+
+    process = subprocess.Popen(["sh", "-c", command], stdin=subprocess.PIPE)
+
+    def pump():
+        try:
+            while True:
+                chunk = sys.stdin.buffer.read1(CHUNK_SIZE)
+                if not chunk:
+                    break
+                link.send(len(chunk))
+                process.stdin.write(chunk)
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError, ValueError):
+            pass
+
+    # The command may finish without draining stdin; don't wait on the pump then
+    threading.Thread(target=pump, daemon=True).start()
+    return process.wait()
+
+
+def scp(argv: List[str]) -> int:
+    """Copy sources to the (local) target through the link, drawing scp's meter on a TTY."""
+    index = 0
+    recursive = False
+    limit = 0.0
+    operands = []
+    while index < len(argv):
+        argument = argv[index]
+        index += 1
+        if not argument.startswith("-") or argument == "-":
+            operands.append(argument)
+            continue
+        flags = argument[1:]
+        for position, flag in enumerate(flags):
+            if flag in SCP_VALUE_OPTIONS:
+                value = flags[position + 1:]
+                if not value:
+                    value = argv[index]
+                    index += 1
+                if flag == "l":
+                    # Kbit/s, as the server passes it
+                    limit = float(value) * 1000 / 8
+                break
+            recursive = recursive or flag == "r"
+    if len(operands) < 2:
+        print("usage: scp [-r] source ... target", file=sys.stderr)
+        return 1
+    *sources, target = operands
+    host, separator, path = target.partition(":")
+    if separator and "/" not in host:
+        target = path
+
+    link = LinkShaper.from_env("BENCH_SSH")
+    link.delay()
+    meter = sys.stdout.isatty()
+    for source in sources:
+        source = source.rstrip("/") or "/"
+        destination = os.path.join(target, os.path.basename(source)) if os.path.isdir(target) else target
+        if os.path.isdir(source):
+            if not recursive:
+                print(f"scp: {source}: not a regular file", file=sys.stderr)
+                return 1
+            files = sorted(
+                os.path.join(root, name) for root, _, names in os.walk(source) for name in names
+            )
+        else:
+            files = [source]
+        for path in files:
+            out_path = os.path.join(destination, os.path.relpath(path, source)) if path != source else destination
+            os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+            copy_file(path, out_path, link, limit, meter)
+    return 0
+
+
+def copy_file(path: str, out_path: str, link: LinkShaper, limit: float, meter: bool):
+    name = os.path.basename(path)
+    size = os.path.getsize(path)
+    started = last_draw = time.monotonic()
+    sent = 0
+    with open(path, "rb") as reader, open(out_path, "wb") as writer:
+        while True:
+            chunk = reader.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            link.send(len(chunk), limit)
+            writer.write(chunk)
+            sent += len(chunk)
+            if meter and time.monotonic() - last_draw >= 0.25:
+                last_draw = time.monotonic()
+                draw_meter(name, sent, size, last_draw - started)
+    if meter:
+        draw_meter(name, sent, size, time.monotonic() - started, final=True)
+
+
+def draw_meter(name: str, sent: int, size: int, elapsed: float, final: bool = False):
+    """One redraw of scp's progress meter (name, percent, amount, rate, ETA)."""
+    percent = sent * 100 // size if size else 100
+    rate = sent / elapsed if elapsed > 0 else 0.0
+    eta = int((size - sent) / rate) if rate else 0
+    amount = str(sent) if sent < 1024 else format_bytes(sent)
+    sys.stdout.write(
+        f"\r{name}  {percent:3d}%  {amount}  {format_bytes(rate)}/s   {eta // 60:02d}:{eta % 60:02d} ETA"
+        + ("\n" if final else "")
+    )
+    sys.stdout.flush()
+
+
+def main(argv: List[str]) -> int:
+    if argv[:1] == ["ssh"]:
+        return ssh(argv[1:])
+    if argv[:1] == ["scp"]:
+        return scp(argv[1:])
+    print("usage: bench_loopback.py ssh|scp ARGS...", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,727 @@
+"""Offline end-to-end benchmark for the download proxy server.
+
+Runs ``server.py`` as a subprocess against local stand-ins for both ends of a transfer:
+
+- a fake Hub serving model info and ``resolve`` (with Range) for synthetic repos of a
+  configurable shape, e.g. ``1x50GB``, ``200x500MB`` or ``20000x1KB``;
+- a loopback "supercomputer": ``ssh``/``scp`` shims put first on the server's PATH that
+  run the remote side locally under a scratch directory (see ``bench_loopback.py``).
+
+Both links take an injected latency (per request / per ssh or scp invocation) and a
+bandwidth cap shared by all connections on that link. Each run records end-to-end
+throughput, time per phase (from the job timeline), peak RSS of the server, event-loop
+lag (from ``/metrics``) and peak local disk usage, and is stored as JSON so runs can be
+compared::
+
+    python benchmark.py run --shape sharded --scale 0.01 --mode pipelined
+    python benchmark.py run --shape tiny-files --ssh-latency-ms 20 --label before
+    python benchmark.py list
+    python benchmark.py compare bench_results/<before>.json bench_results/<after>.json
+    python benchmark.py hub --shape mixed --port 8765   # serve the fake Hub only
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional
+
+from bench_loopback import CHUNK_SIZE, LinkShaper, format_bytes
+
+ROOT = Path(__file__).resolve().parent
+SERVER_SCRIPT = ROOT / "server.py"
+LOOPBACK_SCRIPT = ROOT / "bench_loopback.py"
+DEFAULT_RESULTS_DIR = ROOT / "bench_results"
+AUTHOR = "bench"
+
+# Named repo shapes; any "COUNTxSIZE[,COUNTxSIZE...]" spec works as well
+SHAPES = {
+    "single-large": "1x50GB",
+    "sharded": "200x500MB",
+    "tiny-files": "20000x1KB",
+    "mixed": "4x2GB,50x20MB,500x10KB",
+}
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+
+
+def parse_shape(spec: str, scale: float = 1.0) -> List[tuple]:
+    """``"200x500MB,10x1KB"`` -> ``[(200, 524288000), (10, 1024)]``, sizes multiplied by ``scale``."""
+    groups = []
+    for part in SHAPES.get(spec, spec).split(","):
+        match = re.fullmatch(r"\s*(\d+)\s*x\s*(\d+(?:\.\d+)?)\s*([KMGT]?B)?\s*", part, re.IGNORECASE)
+        if match is None:
+            raise ValueError(f"Invalid shape {part!r}: expected COUNTxSIZE such as 200x500MB")
+        unit = SIZE_UNITS[(match.group(3) or "B").upper()]
+        groups.append((int(match.group(1)), max(1, int(float(match.group(2)) * unit * scale))))
+    return groups
+
+
+class SyntheticRepo:
+    """A repo whose file contents are generated on demand, so any size costs no disk.
+
+    Every file starts with its own path (so contents, and therefore oids, are unique)
+    followed by a shared random block read cyclically from a per-file offset. The data
+    is incompressible, like model weights.
+    """
+
+    BLOCK_SIZE = 4 * 1024 * 1024
+    # The Hub stores files from 10 MB up in LFS; those get a sha256 oid
+    LFS_THRESHOLD = 10 * 1024 * 1024
+
+    def __init__(self, name: str, groups: List[tuple], seed: int = 0):
+        self.name = name
+        self.groups = groups
+        self.seed = seed
+        generator = random.Random(seed)
+        self.block = generator.getrandbits(self.BLOCK_SIZE * 8).to_bytes(self.BLOCK_SIZE, "little")
+        self.sha = hashlib.sha1(json.dumps([groups, seed]).encode()).hexdigest()
+        self.files: dict = {}
+        for index, (count, size) in enumerate(groups):
+            prefix = f"group{index}/" if len(groups) > 1 else ""
+            for number in range(count):
+                if size >= 1024 * 1024:
+                    name = f"model-{number + 1:05d}-of-{count:05d}.safetensors" if count > 1 else "model.safetensors"
+                else:
+                    name = f"data/{number:06d}.json"
+                path = prefix + name
+                header = f"{path}\n".encode()[:size]
+                offset = int.from_bytes(hashlib.sha1(path.encode()).digest()[:4], "big") % self.BLOCK_SIZE
+                self.files[path] = (size, header, offset)
+        self.oids: dict = {}
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(size for size, _, _ in self.files.values())
+
+    def iter_range(self, path: str, start: int, length: int):
+        """Yield the bytes of ``path`` from ``start``, ``length`` in total, in chunks."""
+        _, header, offset = self.files[path]
+        block = memoryview(self.block)
+        position = start
+        remaining = length
+        while remaining > 0:
+            if position < len(header):
+                piece = header[position:position + remaining]
+            else:
+                block_position = (offset + position - len(header)) % self.BLOCK_SIZE
+                piece = block[block_position:block_position + min(remaining, CHUNK_SIZE)]
+            yield piece
+            position += len(piece)
+            remaining -= len(piece)
+
+    def file_oid(self, path: str) -> dict:
+        size = self.files[path][0]
+        if size >= self.LFS_THRESHOLD:
+            digest = hashlib.sha256()
+            for piece in self.iter_range(path, 0, size):
+                digest.update(piece)
+            pointer = f"version https://git-lfs.github.com/spec/v1\noid sha256:{digest.hexdigest()}\nsize {size}\n"
+            return {
+                "blobId": hashlib.sha1(b"blob %d\0" % len(pointer) + pointer.encode()).hexdigest(),
+                "lfs": {"sha256": digest.hexdigest(), "size": size, "pointerSize": len(pointer)},
+            }
+        digest = hashlib.sha1(b"blob %d\0" % size)
+        for piece in self.iter_range(path, 0, size):
+            digest.update(piece)
+        return {"blobId": digest.hexdigest()}
+
+    def compute_oids(self, cache_dir: Path, workers: int = 4):
+        """Hash every file (as the Hub would report it), cached per shape under ``cache_dir``."""
+        key = hashlib.sha256(json.dumps([self.groups, self.seed, self.BLOCK_SIZE]).encode()).hexdigest()[:16]
+        cache_path = cache_dir / f"oids-{key}.json"
+        try:
+            self.oids = json.loads(cache_path.read_text())
+            if set(self.oids) == set(self.files):
+                return
+        except (OSError, ValueError):
+            pass
+        print(f"Hashing {len(self.files)} files ({format_bytes(self.total_bytes)}) for Hub oids...")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            self.oids = dict(zip(self.files, executor.map(self.file_oid, self.files)))
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        cache_path.write_text(json.dumps(self.oids))
+
+    def model_info(self, repo_id: str) -> dict:
+        siblings = []
+        for path, (size, _, _) in self.files.items():
+            siblings.append({"rfilename": path, "size": size, **self.oids.get(path, {})})
+        return {"id": repo_id, "modelId": repo_id, "sha": self.sha, "private": False, "siblings": siblings}
+
+
+class FakeHubHandler(BaseHTTPRequestHandler):
+    server_version = "FakeHub/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def do_GET(self):
+        self.handle_request(head=False)
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def handle_request(self, head: bool):
+        hub = self.server
+        hub.link.delay()
+        path = urllib.parse.urlsplit(self.path).path
+
+        match = re.fullmatch(r"/api/models/([^/]+)/([^/]+)(?:/revision/[^/]+)?", path)
+        if match:
+            repo = hub.repos.get(match.group(2)) if match.group(1) == AUTHOR else None
+            if repo is None:
+                self.send_json(404, {"error": "Repository not found"})
+            else:
+                self.send_json(200, repo.model_info(f"{AUTHOR}/{repo.name}"))
+            return
+
+        match = re.fullmatch(r"/([^/]+)/([^/]+)/resolve/([^/]+)/(.+)", path)
+        repo = hub.repos.get(match.group(2)) if match and match.group(1) == AUTHOR else None
+        file_path = urllib.parse.unquote(match.group(4)) if repo else None
+        if repo is None or file_path not in repo.files:
+            self.send_json(404, {"error": "Entry not found"})
+            return
+
+        size = repo.files[file_path][0]
+        start, end = 0, size - 1
+        requested = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if requested:
+            start = int(requested.group(1))
+            end = min(size - 1, int(requested.group(2))) if requested.group(2) else size - 1
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", f'"{repo.oids.get(file_path, {}).get("blobId", repo.sha)}"')
+        self.end_headers()
+        if head:
+            return
+        try:
+            for piece in repo.iter_range(file_path, start, end - start + 1):
+                hub.link.send(len(piece))
+                self.wfile.write(piece)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class FakeHub(ThreadingHTTPServer):
+    """Hub stand-in: ``/api/models/bench/<repo>`` and ``/bench/<repo>/resolve/<rev>/<path>``."""
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple, repos: List[SyntheticRepo], link: LinkShaper):
+        super().__init__(address, FakeHubHandler)
+        self.repos = {repo.name: repo for repo in repos}
+        self.link = link
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def write_shims(bin_dir: Path):
+    """``ssh`` and ``scp`` executables that hand over to ``bench_loopback.py``."""
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for name in ("ssh", "scp"):
+        shim = bin_dir / name
+        shim.write_text(
+            f"#!/bin/sh\nexec {shlex.quote(sys.executable)} {shlex.quote(str(LOOPBACK_SCRIPT))} {name} \"$@\"\n"
+        )
+        shim.chmod(0o755)
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def http_json(url: str, payload: Optional[dict] = None, timeout: float = 30) -> dict:
+    data = json.dumps(payload).encode() if payload is not None else None
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def directory_usage(path: Path) -> int:
+    total = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_blocks * 512
+                except OSError:
+                    pass
+    return total
+
+
+def directory_files(path: Path) -> tuple:
+    files = [item for item in path.rglob("*") if item.is_file()] if path.exists() else []
+    return len(files), sum(item.stat().st_size for item in files)
+
+
+class Sampler(threading.Thread):
+    """Samples the server while a run is in flight: RSS, local disk use and event-loop lag."""
+
+    def __init__(self, pid: int, base_url: str, disk_path: Path, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.base_url = base_url
+        self.disk_path = disk_path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.peak_rss = 0
+        self.peak_disk = 0
+        self.lag = {"0.5": [], "0.99": [], "1": []}
+
+    def read_rss(self) -> int:
+        """Peak RSS (VmHWM) of the server process in bytes, 0 where /proc is unavailable."""
+        try:
+            status = Path(f"/proc/{self.pid}/status").read_text()
+        except OSError:
+            return 0
+        match = re.search(r"^VmHWM:\s+(\d+) kB", status, re.MULTILINE)
+        return int(match.group(1)) * 1024 if match else 0
+
+    def scrape_lag(self):
+        try:
+            with urllib.request.urlopen(f"{self.base_url}/metrics", timeout=5) as response:
+                text = response.read().decode()
+        except (OSError, urllib.error.URLError):
+            return
+        for quantile, value in re.findall(r'^hf_proxy_event_loop_lag_seconds\{quantile="([^"]+)"\} (\S+)$', text, re.MULTILINE):
+            if quantile in self.lag:
+                self.lag[quantile].append(float(value))
+
+    def run(self):
+        ticks = 0
+        while not self.stopped.wait(self.interval):
+            ticks += 1
+            self.peak_rss = max(self.peak_rss, self.read_rss())
+            # Walking the tree and scraping cost more; do those once a second
+            if ticks % max(1, int(1 / self.interval)) == 0:
+                self.peak_disk = max(self.peak_disk, directory_usage(self.disk_path))
+                self.scrape_lag()
+
+    def stop(self) -> dict:
+        self.stopped.set()
+        self.join()
+        self.peak_rss = max(self.peak_rss, self.read_rss())
+        self.scrape_lag()
+        medians = sorted(self.lag["0.5"])
+        return {
+            "peak_rss_bytes": self.peak_rss or None,
+            "peak_disk_bytes": self.peak_disk,
+            "event_loop_lag_seconds": {
+                "p50": medians[len(medians) // 2] if medians else None,
+                "p99": max(self.lag["0.99"], default=None),
+                "max": max(self.lag["1"], default=None),
+            },
+        }
+
+
+def git_revision() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def start_server(work_dir: Path, env: dict, port: int, timeout: float = 60) -> subprocess.Popen:
+    with open(work_dir / "server.log", "wb") as log:
+        process = subprocess.Popen(
+            [sys.executable, str(SERVER_SCRIPT)],
+            cwd=work_dir, env=env, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT
+        )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            tail = (work_dir / "server.log").read_text(errors="ignore")[-2000:]
+            raise RuntimeError(f"Server exited with code {process.returncode}:\n{tail}")
+        try:
+            http_json(f"http://127.0.0.1:{port}/health", timeout=2)
+            return process
+        except (OSError, urllib.error.URLError, ValueError):
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"Server did not become healthy within {timeout:.0f}s")
+
+
+def stop_server(process: subprocess.Popen):
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def run_benchmark(args, repo: SyntheticRepo, hub: FakeHub, run_number: int) -> dict:
+    work_dir = Path(tempfile.mkdtemp(prefix="hf-proxy-bench-", dir=args.work_dir))
+    local_dir = work_dir / "local"
+    remote_dir = work_dir / "remote"
+    remote_dir.mkdir()
+    port = free_port()
+
+    env = dict(os.environ)
+    env.pop("HUGGINGFACE_TOKEN", None)
+    env.update({
+        "HUGGINGFACE_ENDPOINT": hub.url,
+        "LOCAL_DOWNLOAD_PATH": str(local_dir),
+        "DOWNLOAD_PROXY_PORT": str(port),
+        "SSH_CONTROL_DIR": str(work_dir / "cm"),
+        "PYTHONUNBUFFERED": "1",
+    })
+    if args.ssh_target:
+        user, _, host = args.ssh_target.rpartition("@")
+        env.update({"SUPERCOMPUTER_HOST": host, "SUPERCOMPUTER_USER": user or os.environ.get("USER", "root")})
+        env["SUPERCOMPUTER_PATH"] = args.remote_path or str(remote_dir)
+    else:
+        write_shims(work_dir / "bin")
+        env.update({
+            "SUPERCOMPUTER_HOST": "loopback",
+            "SUPERCOMPUTER_USER": "bench",
+            "SUPERCOMPUTER_PATH": str(remote_dir),
+            "PATH": f"{work_dir / 'bin'}{os.pathsep}{env.get('PATH', '')}",
+            "BENCH_SSH_LATENCY": str(args.ssh_latency_ms / 1000),
+            "BENCH_SSH_RATE": str(args.ssh_bandwidth_mb * 1024 * 1024),
+            "BENCH_SSH_STATE": str(work_dir / "ssh-link"),
+        })
+    env.update(args.env)
+
+    result = {"status": None, "error": None}
+    process = start_server(work_dir, env, port)
+    base_url = f"http://127.0.0.1:{port}"
+    sampler = Sampler(process.pid, base_url, local_dir)
+    sampler.start()
+    try:
+        started = time.monotonic()
+        response = http_json(f"{base_url}/download", {
+            "author": AUTHOR, "repo_name": repo.name, "mode": args.mode, **args.request
+        })
+        job_id = response.get("job_id")
+        if job_id is None:
+            raise RuntimeError(f"Download was not queued: {response}")
+        deadline = started + args.timeout
+        while True:
+            job = http_json(f"{base_url}/jobs/{job_id}")
+            if job["status"] in ("completed", "failed"):
+                break
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Job {job_id} did not finish within {args.timeout:.0f}s")
+            time.sleep(0.2)
+        wall_seconds = time.monotonic() - started
+        timeline = http_json(f"{base_url}/jobs/{job_id}/timeline")["summary"]
+
+        result.update({
+            "status": job["status"],
+            "error": job.get("error"),
+            "wall_seconds": round(wall_seconds, 3),
+            "job_seconds": round(job["finished_at"] - job["started_at"], 3),
+            "throughput_bytes_per_second": round(repo.total_bytes / wall_seconds),
+            "phase_seconds": timeline["phase_seconds"],
+            "idle_seconds": timeline["idle_seconds"],
+        })
+    except Exception as e:
+        result.update({"status": "error", "error": str(e)})
+    finally:
+        result.update(sampler.stop())
+        stop_server(process)
+
+    if not args.ssh_target:
+        remote_files, remote_bytes = directory_files(remote_dir / AUTHOR / repo.name)
+        result.update({"remote_files": remote_files, "remote_bytes": remote_bytes})
+        if result["status"] == "completed" and (remote_files, remote_bytes) != (len(repo.files), repo.total_bytes):
+            result["error"] = (
+                f"Remote copy has {remote_files} files / {remote_bytes} bytes, "
+                f"expected {len(repo.files)} / {repo.total_bytes}"
+            )
+    if args.keep:
+        print(f"Kept work directory {work_dir}")
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "label": args.label or f"{args.shape}-{args.mode}",
+        "run": run_number,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git": git_revision(),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {
+            "shape": args.shape,
+            "spec": SHAPES.get(args.shape, args.shape),
+            "scale": args.scale,
+            "files": len(repo.files),
+            "total_bytes": repo.total_bytes,
+            "mode": args.mode,
+            "request": args.request,
+            "env": args.env,
+            "oids": not args.no_oids,
+            "hub": {"latency_ms": args.hub_latency_ms, "bandwidth_mb": args.hub_bandwidth_mb},
+            "ssh": {
+                "target": args.ssh_target or "loopback",
+                "latency_ms": args.ssh_latency_ms,
+                "bandwidth_mb": args.ssh_bandwidth_mb,
+            },
+        },
+        "result": result,
+    }
+
+
+def save_result(results_dir: Path, record: dict) -> Path:
+    results_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    label = re.sub(r"[^A-Za-z0-9_.-]+", "_", record["label"])
+    path = results_dir / f"{stamp}-{label}-{record['run']}.json"
+    path.write_text(json.dumps(record, indent=2))
+    return path
+
+
+def summary_line(record: dict) -> str:
+    result = record["result"]
+    if result.get("wall_seconds") is None:
+        return f"{record['label']} #{record['run']}: {result['status']} ({result['error']})"
+    lag = result["event_loop_lag_seconds"]
+    text = (
+        f"{record['label']} #{record['run']}: {result['status']} in {result['wall_seconds']:.2f}s, "
+        f"{format_bytes(result['throughput_bytes_per_second'])}/s, "
+        f"peak RSS {format_bytes(result['peak_rss_bytes'] or 0)}, peak disk {format_bytes(result['peak_disk_bytes'])}, "
+        f"loop lag p99 {1000 * (lag['p99'] or 0):.1f}ms / max {1000 * (lag['max'] or 0):.1f}ms"
+    )
+    return text + (f" [{result['error']}]" if result.get("error") else "")
+
+
+def command_run(args) -> int:
+    groups = parse_shape(args.shape, args.scale)
+    repo = SyntheticRepo(re.sub(r"[^A-Za-z0-9_.-]+", "_", args.shape), groups, args.seed)
+    print(f"Repo {AUTHOR}/{repo.name}: {len(repo.files)} files, {format_bytes(repo.total_bytes)}")
+    if not args.no_oids:
+        repo.compute_oids(args.results_dir / ".oids")
+
+    link = LinkShaper(args.hub_latency_ms / 1000, args.hub_bandwidth_mb * 1024 * 1024)
+    hub = FakeHub(("127.0.0.1", 0), [repo], link)
+    threading.Thread(target=hub.serve_forever, daemon=True).start()
+    failures = 0
+    try:
+        for run_number in range(1, args.repeat + 1):
+            record = run_benchmark(args, repo, hub, run_number)
+            path = save_result(args.results_dir, record)
+            print(summary_line(record))
+            print(f"  saved {path}")
+            if record["result"]["status"] != "completed" or record["result"].get("error"):
+                failures += 1
+    finally:
+        hub.shutdown()
+    return 1 if failures else 0
+
+
+def load_results(paths: List[str]) -> List[dict]:
+    records = []
+    for name in paths:
+        path = Path(name)
+        files = sorted(path.glob("*.json")) if path.is_dir() else [path]
+        for item in files:
+            record = json.loads(item.read_text())
+            record["_path"] = item.name
+            records.append(record)
+    return records
+
+
+def command_list(args) -> int:
+    records = load_results([str(args.results_dir)]) if args.results_dir.exists() else []
+    for record in records:
+        config = record["config"]
+        print(f"{record['_path']}  {config['spec']} x{config['scale']}  {config['mode']}  {summary_line(record)}")
+    if not records:
+        print(f"No results under {args.results_dir}")
+    return 0
+
+
+def command_compare(args) -> int:
+    """Print the metrics of each run side by side, with the change against the first."""
+    records = load_results(args.results)
+    if len(records) < 2:
+        print("compare needs at least two results")
+        return 1
+
+    def metric(record: dict, key: str):
+        result = record["result"]
+        if key.startswith("phase:"):
+            return (result.get("phase_seconds") or {}).get(key[6:])
+        if key.startswith("lag:"):
+            value = (result.get("event_loop_lag_seconds") or {}).get(key[4:])
+            return value * 1000 if value is not None else None
+        value = result.get(key)
+        if value is not None and key.endswith("_bytes"):
+            return value / 1024 ** 2
+        if value is not None and key == "throughput_bytes_per_second":
+            return value / 1024 ** 2
+        return value
+
+    rows = [
+        ("wall_seconds", "wall (s)", False),
+        ("throughput_bytes_per_second", "throughput (MB/s)", True),
+        ("peak_rss_bytes", "peak RSS (MB)", False),
+        ("peak_disk_bytes", "peak disk (MB)", False),
+        ("lag:p99", "loop lag p99 (ms)", False),
+        ("lag:max", "loop lag max (ms)", False),
+        ("idle_seconds", "idle (s)", False),
+    ]
+    phases = []
+    for record in records:
+        for phase in record["result"].get("phase_seconds") or {}:
+            if phase not in phases:
+                phases.append(phase)
+    rows += [(f"phase:{phase}", f"phase {phase} (s)", False) for phase in phases]
+
+    baseline = records[0]
+    width = max(20, *(len(record["label"]) + 6 for record in records))
+    print(f"{'':20}" + "".join(f"{record['label'] + ' #' + str(record['run']):>{width}}" for record in records))
+    for key, title, higher_is_better in rows:
+        cells = []
+        base = metric(baseline, key)
+        for record in records:
+            value = metric(record, key)
+            if value is None:
+                cells.append(f"{'-':>{width}}")
+                continue
+            cell = f"{value:.2f}"
+            if record is not baseline and base:
+                change = (value - base) / base * 100
+                better = change > 0 if higher_is_better else change < 0
+                cell += f" ({change:+.0f}%{'' if abs(change) < 1 else ' ✓' if better else ' ✗'})"
+            cells.append(f"{cell:>{width}}")
+        print(f"{title:20}" + "".join(cells))
+
+    configs = {json.dumps(record["config"], sort_keys=True) for record in records}
+    if len(configs) > 1:
+        print("\nNote: the runs used different configurations (shape, mode, links or env)")
+    return 0
+
+
+def command_hub(args) -> int:
+    groups = parse_shape(args.shape, args.scale)
+    repo = SyntheticRepo(re.sub(r"[^A-Za-z0-9_.-]+", "_", args.shape), groups, args.seed)
+    if not args.no_oids:
+        repo.compute_oids(args.results_dir / ".oids")
+    hub = FakeHub(("127.0.0.1", args.port), [repo], LinkShaper(
+        args.hub_latency_ms / 1000, args.hub_bandwidth_mb * 1024 * 1024
+    ))
+    print(f"Serving {AUTHOR}/{repo.name} ({len(repo.files)} files, {format_bytes(repo.total_bytes)}) on {hub.url}")
+    try:
+        hub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def key_value(text: str) -> tuple:
+    if "=" not in text:
+        raise argparse.ArgumentTypeError(f"expected KEY=VALUE, got {text!r}")
+    key, value = text.split("=", 1)
+    return key, value
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark for the download proxy")
+    parser.add_argument("--results-dir", type=Path, default=DEFAULT_RESULTS_DIR, help="Where results are stored")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_repo_arguments(command):
+        command.add_argument(
+            "--shape", default="sharded",
+            help=f"Repo shape: {', '.join(f'{name} ({spec})' for name, spec in SHAPES.items())} or COUNTxSIZE[,...]"
+        )
+        command.add_argument("--scale", type=float, default=1.0, help="Multiply every file size (e.g. 0.01)")
+        command.add_argument("--seed", type=int, default=0, help="Seed of the synthetic contents")
+        command.add_argument("--no-oids", action="store_true", help="Serve no hashes (skips checksum verification)")
+        command.add_argument("--hub-latency-ms", type=float, default=0.0, help="Added to every Hub request")
+        command.add_argument("--hub-bandwidth-mb", type=float, default=0.0, help="Hub link cap in MB/s (0 = none)")
+
+    run = commands.add_parser("run", help="Run the benchmark and store the result")
+    add_repo_arguments(run)
+    run.add_argument("--mode", default="staged", choices=["staged", "pipelined", "relay"])
+    run.add_argument("--request", type=json.loads, default={}, help="Extra /download fields as JSON")
+    run.add_argument("--env", type=key_value, action="append", default=[], help="Server setting KEY=VALUE")
+    run.add_argument("--ssh-latency-ms", type=float, default=0.0, help="Added to every ssh/scp invocation")
+    run.add_argument("--ssh-bandwidth-mb", type=float, default=0.0, help="Upload link cap in MB/s (0 = none)")
+    run.add_argument("--ssh-target", help="user@host of a real ssh target instead of the loopback shims")
+    run.add_argument("--remote-path", help="Remote directory on --ssh-target")
+    run.add_argument("--repeat", type=int, default=1, help="Number of runs")
+    run.add_argument("--label", help="Name of the run in results (default: SHAPE-MODE)")
+    run.add_argument("--timeout", type=float, default=3600, help="Seconds before a run is abandoned")
+    run.add_argument("--work-dir", help="Parent of the per-run scratch directories (default: system temp)")
+    run.add_argument("--keep", action="store_true", help="Keep the scratch directory and server log")
+
+    commands.add_parser("list", help="List stored results")
+
+    compare = commands.add_parser("compare", help="Compare stored results (the first is the baseline)")
+    compare.add_argument("results", nargs="+", help="Result files or directories of them")
+
+    hub = commands.add_parser("hub", help="Only serve the fake Hub")
+    add_repo_arguments(hub)
+    hub.add_argument("--port", type=int, default=8765)
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        args.env = dict(args.env)
+        if args.ssh_target and (args.ssh_latency_ms or args.ssh_bandwidth_mb):
+            parser.error("--ssh-latency-ms/--ssh-bandwidth-mb only apply to the loopback target")
+        return command_run(args)
+    if args.command == "list":
+        return command_list(args)
+    if args.command == "compare":
+        return command_compare(args)
+    return command_hub(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -163,8 +163,8 @@ class PopupController {
                 })
             });
 
-            // Start progress polling
-            await this.pollProgress(downloadBtn);
+            // Follow progress (event stream, or polling as a fallback)
+            await this.watchProgress(downloadBtn);
 
         } catch (error) {
             this.addLogEntry(`Error: ${error.message}`, 'error');
@@ -172,6 +172,87 @@ class PopupController {
         }
     }
 
+    async watchProgress(downloadBtn) {
+        // Prefer the server's push stream; fall back to polling if it is unavailable
+        if (!window.EventSource) {
+            await this.pollProgress(downloadBtn);
+            return;
+        }
+
+        const url = `http://localhost:8000/events/${this.repoInfo.author}/${this.repoInfo.repo_name}`;
+        const source = new EventSource(url);
+        let finished = false;
+
+        source.addEventListener('progress', (event) => {
+            const progress = JSON.parse(event.data);
+            this.updateSizeInfo(progress);
+            const hadNewLogs = this.appendLogEntries(progress.logs);
+            if (this.handleProgressUpdate(downloadBtn, progress, hadNewLogs) === 'done') {
+                finished = true;
+                source.close();
+            }
+        });
+
+        source.onerror = () => {
+            if (finished) return;
+            console.log('Progress stream unavailable, falling back to polling');
+            source.close();
+            // Polling returns the full log list, so rebuild it from scratch
+            this.clearLogSection();
+            this.logCursor = 0;
+            this.pollProgress(downloadBtn);
+        };
+    }
+
+    handleProgressUpdate(downloadBtn, progress, hadNewLogs) {
+        if (progress.status === 'queued') {
+            this.applyProgressState(downloadBtn, progress);
+            return 'continue';
+        } else if (progress.status === 'cloning') {
+            this.applyProgressState(downloadBtn, progress);
+            if (!hadNewLogs) {
+                const hasPercent = progress.progress !== undefined && progress.progress !== null;
+                const fallback = hasPercent ? `Git clone progress: ${progress.progress}%` : 'Cloning repository...';
+                this.addLogEntry(fallback, 'info');
+            }
+            return 'continue';
+        } else if (progress.status === 'clone_complete') {
+            this.applyProgressState(downloadBtn, progress);
+            if (!hadNewLogs) {
+                this.addLogEntry('Git clone completed, preparing transfer...', 'info');
+            }
+            return 'continue';
+        } else if (progress.status === 'transferring') {
+            this.applyProgressState(downloadBtn, progress);
+            if (!hadNewLogs) {
+                this.addLogEntry('Transferring files to supercomputer...', 'info');
+            }
+            return 'continue';
+        } else if (progress.status === 'transfer_complete') {
+            this.applyProgressState(downloadBtn, progress);
+            if (!hadNewLogs) {
+                this.addLogEntry('Download completed successfully!', 'success');
+            }
+            this.downloadInProgress = false;
+            return 'done';
+        } else if (progress.status === 'exists') {
+            this.applyProgressState(downloadBtn, progress);
+            if (!hadNewLogs) {
+                this.addLogEntry('Model already exists on supercomputer', 'success');
+            }
+            this.downloadInProgress = false;
+            return 'done';
+        } else if (progress.status === 'error') {
+            const fallback = progress.message ? `Error: ${progress.message}` : 'An error occurred during download';
+            if (!hadNewLogs) {
+                this.addLogEntry(fallback, 'error');
+            }
+            this.showDownloadError(downloadBtn, progress.message || fallback);
+            return 'done';
+        }
+        return 'unknown';
+    }
+
     async pollProgress(downloadBtn) {
         const pollInterval = 1000; // Poll every 1 second
         let pollCount = 0;
@@ -194,44 +275,11 @@ class PopupController {
                     return;
                 }
 
-                if (progress.status === 'cloning') {
-                    this.applyProgressState(downloadBtn, progress);
-                    if (!hadNewLogs) {
-                        const hasPercent = progress.progress !== undefined && progress.progress !== null;
-                        const fallback = hasPercent ? `Git clone progress: ${progress.progress}%` : 'Cloning repository...';
-                        this.addLogEntry(fallback, 'info');
-                    }
-                    setTimeout(poll, pollInterval);
-                } else if (progress.status === 'clone_complete') {
-                    this.applyProgressState(downloadBtn, progress);
-                    if (!hadNewLogs) {
-                        this.addLogEntry('Git clone completed, preparing transfer...', 'info');
-                    }
-                    setTimeout(poll, pollInterval);
-                } else if (progress.status === 'transferring') {
-                    this.applyProgressState(downloadBtn, progress);
-                    if (!hadNewLogs) {
-                        this.addLogEntry('Transferring files to supercomputer...', 'info');
-                    }
+                const outcome = this.handleProgressUpdate(downloadBtn, progress, hadNewLogs);
+                if (outcome === 'continue') {
                     setTimeout(poll, pollInterval);
-                } else if (progress.status === 'transfer_complete') {
-                    this.applyProgressState(downloadBtn, progress);
-                    if (!hadNewLogs) {
-                        this.addLogEntry('Download completed successfully!', 'success');
-                    }
-                    this.downloadInProgress = false;
-                } else if (progress.status === 'exists') {
-                    this.applyProgressState(downloadBtn, progress);
-                    if (!hadNewLogs) {
-                        this.addLogEntry('Model already exists on supercomputer', 'success');
-                    }
-                    this.downloadInProgress = false;
-                } else if (progress.status === 'error') {
-                    const fallback = progress.message ? `Error: ${progress.message}` : 'An error occurred during download';
-                    if (!hadNewLogs) {
-                        this.addLogEntry(fallback, 'error');
-                    }
-                    this.showDownloadError(downloadBtn, progress.message || fallback);
+                } else if (outcome === 'done') {
+                    return;
                 } else if (pollCount < maxPolls) {
                     // Continue polling
                     pollCount++;
@@ -310,11 +358,11 @@ class PopupController {
 
                 this.clearLogSection();
                 this.logCursor = 0;
-                this.processProgressLogs(progress);
                 this.addLogEntry('Resuming ongoing download...', 'info');
                 this.updateSizeInfo(progress);
                 this.applyProgressState(downloadBtn, progress);
-                await this.pollProgress(downloadBtn);
+                // The event stream (or the first poll) replays the existing log lines
+                await this.watchProgress(downloadBtn);
             }
         } catch (error) {
             console.log('Popup: No ongoing download found or server unavailable');
@@ -368,6 +416,21 @@ class PopupController {
         return appended;
     }
 
+    appendLogEntries(logEntries) {
+        // Event stream payloads carry only log lines not sent before
+        if (!Array.isArray(logEntries) || logEntries.length === 0) {
+            return false;
+        }
+
+        let appended = false;
+        for (const entry of logEntries) {
+            if (!entry || !entry.message) continue;
+            this.addLogEntry(entry.message, entry.type || 'info');
+            appended = true;
+        }
+        return appended;
+    }
+
     formatBytes(bytes) {
         if (bytes === undefined || bytes === null) return null;
         if (bytes === 0) return '0 B';
@@ -433,6 +496,16 @@ class PopupController {
             return;
         }
 
+        if (status === 'queued') {
+            downloadBtn.innerHTML = `
+                <div class="spinner"></div>
+                Queued...
+            `;
+            downloadBtn.disabled = true;
+            downloadBtn.className = 'download-btn';
+            return;
+        }
+
         if (status === 'clone_complete') {
             downloadBtn.innerHTML = `
                 <div class="spinner"></div>
@@ -1,23 +1,61 @@
 #!/usr/bin/env python3
 import os
+import posixpath
+import queue
+import re
+import shlex
 import shutil
-import subprocess
+import struct
+import tarfile
+import termios
 import asyncio
+import bisect
+import contextvars
+import ctypes
+import ctypes.util
+import fcntl
+import fnmatch
+import hashlib
+import heapq
+import itertools
 import json
+import math
+import threading
 import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, nullcontext
 from pathlib import Path
-from typing import Optional, List
-from fastapi import FastAPI, HTTPException
+from typing import Awaitable, Callable, Iterator, Optional, List
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 from dotenv import load_dotenv
 from huggingface_hub import HfApi
-from huggingface_hub.utils import HfHubHTTPError
+from huggingface_hub.utils import HfHubHTTPError, build_hf_headers
+
+try:
+    import zstandard
+except ImportError:  # Optional: zstd wire compression for uploads (UPLOAD_COMPRESSION)
+    zstandard = None
 
 load_dotenv()
 
-app = FastAPI(title="HuggingFace Download Proxy Server")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await proxy_server.start()
+    try:
+        yield
+    finally:
+        await proxy_server.stop()
+
+app = FastAPI(title="HuggingFace Download Proxy Server", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -31,565 +69,5704 @@ class DownloadRequest(BaseModel):
     author: str
     repo_name: str
     url: str = None
+    mode: Optional[str] = None
+    include: Optional[List[str]] = None
+    exclude: Optional[List[str]] = None
+    format_policy: Optional[str] = None
+    priority: int = 0
+    download_rate_limit_mb: Optional[float] = None
+    upload_rate_limit_mb: Optional[float] = None
+    upload_streams: Optional[int] = None
+    sync: bool = False
+    revision: Optional[str] = None
+    compression: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    repos: List[DownloadRequest]
+
+class BandwidthSettings(BaseModel):
+    download_rate_limit_mb: Optional[float] = None
+    upload_rate_limit_mb: Optional[float] = None
+    schedule: Optional[str] = None
+
+class JobBandwidthSettings(BaseModel):
+    priority: Optional[int] = None
+    download_rate_limit_mb: Optional[float] = None
+    upload_rate_limit_mb: Optional[float] = None
 
 class DownloadResponse(BaseModel):
     status: str
     message: str
     local_path: str = None
     supercomputer_path: str = None
+    job_id: Optional[str] = None
+
+class ByteCounter:
+    """Thread-safe running total of bytes written by download workers.
+
+    A subscriber on the event loop is notified when the total changes; at most one
+    notification is outstanding, so a busy counter costs one loop callback per read.
+    """
 
-class DownloadProxyServer:
     def __init__(self):
-        self.local_download_path = Path(os.getenv("LOCAL_DOWNLOAD_PATH", "/tmp/huggingface_downloads"))
-        self.supercomputer_host = os.getenv("SUPERCOMPUTER_HOST")
-        self.supercomputer_user = os.getenv("SUPERCOMPUTER_USER")
-        self.supercomputer_path = os.getenv("SUPERCOMPUTER_PATH")
-        self.hf_token = os.getenv("HUGGINGFACE_TOKEN")
-        self.hf_api = HfApi(token=self.hf_token) if self.hf_token else HfApi()
+        self._lock = threading.Lock()
+        self._value = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._callback: Optional[Callable[[], None]] = None
+        self._notified = False
 
-        # Create local download directory if it doesn't exist
-        self.local_download_path.mkdir(parents=True, exist_ok=True)
+    def subscribe(self, loop: asyncio.AbstractEventLoop, callback: Callable[[], None]):
+        self._loop = loop
+        self._callback = callback
 
-        # Progress tracking
-        self.progress_file = self.local_download_path / "download_progress.json"
-        self.download_progress = self.load_progress_from_file()
-
-    def load_progress_from_file(self):
-        """Load progress from file"""
-        try:
-            if self.progress_file.exists():
-                with open(self.progress_file, 'r') as f:
-                    data = json.load(f)
-                    # Clean up old entries (older than 24 hours)
-                    current_time = time.time()
-                    cleaned_data = {}
-                    for key, progress in data.items():
-                        if current_time - progress.get('timestamp', 0) < 86400:  # 24 hours
-                            cleaned_data[key] = progress
-                    return cleaned_data
-        except Exception as e:
-            print(f"Failed to load progress file: {e}")
-        return {}
+    def unsubscribe(self):
+        self._callback = None
 
-    def save_progress_to_file(self):
-        """Save progress to file"""
-        try:
-            with open(self.progress_file, 'w') as f:
-                json.dump(self.download_progress, f, indent=2)
-        except Exception as e:
-            print(f"Failed to save progress file: {e}")
+    def _notify(self):
+        with self._lock:
+            self._notified = False
+        if self._callback is not None:
+            self._callback()
 
-    def update_progress(
-        self,
-        key: str,
-        status: str,
-        message: str,
-        progress: Optional[int] = None,
-        *,
-        downloaded_bytes: Optional[int] = None,
-        total_bytes: Optional[int] = None,
-        log_type: Optional[str] = None,
-        append_log: bool = True
-    ):
-        """Update download progress"""
+    def add(self, amount: int):
+        with self._lock:
+            self._value += amount
+            if self._callback is None or self._notified:
+                return
+            self._notified = True
+        self._loop.call_soon_threadsafe(self._notify)
 
-        current_entry = self.download_progress.get(key, {})
+    def get(self) -> int:
+        with self._lock:
+            return self._value
 
-        if progress is None:
-            progress = current_entry.get("progress", 0)
+class UploadMeter:
+    """Upload telemetry for one job: bytes sent against the known total, and per file.
 
-        logs = list(current_entry.get("logs", []))
-        normalized_message = None
-        if isinstance(message, str):
-            normalized_message = message.strip()
+    Counting is a couple of additions per chunk; ``sample`` (called on a timer) turns the
+    counts into the rate since the previous sample, an EWMA-smoothed rate and the ETA
+    it implies.
+    """
 
-        updated_entry = {
-            **current_entry,
-            "status": status,
-            "message": message,
-            "progress": progress,
-            "timestamp": time.time(),
+    # One redraw of scp's progress meter: "name  45%   23MB  11.5MB/s   00:02 ETA"
+    SCP_METER = re.compile(
+        r"^(?P<name>.+?)\s+(?P<percent>\d{1,3})%\s+(?P<amount>\d+(?:\.\d+)?(?:[KMGTP]B)?)\s+"
+        r"\d+(?:\.\d+)?\s?[KMGTP]?B?/s"
+    )
+    SIZE_UNITS = " KMGTP"
+
+    def __init__(self, total: Optional[int], smoothing: float, drive_progress: bool = True):
+        self.total = total
+        self.smoothing = smoothing
+        # Whether published stats set the transferring message and percentage
+        self.drive_progress = drive_progress
+        self.sent = 0
+        self.files: dict = {}
+        self.files_done = 0
+        self.started = time.monotonic()
+        self.rate = 0.0
+        self.smoothed_rate: Optional[float] = None
+        self._last_sample = (self.started, 0)
+
+    def advance(self, path: str, amount: int, size: Optional[int] = None):
+        state = self.files.get(path)
+        if state is None:
+            state = self.files[path] = {"size": size, "sent": 0, "started": time.monotonic()}
+        state["sent"] += amount
+        self.sent += amount
+
+    def set_sent(self, path: str, sent: int, size: Optional[int] = None):
+        """Set the bytes sent of ``path`` from an absolute count (e.g. a parsed scp meter)."""
+        state = self.files.get(path)
+        self.advance(path, sent - (state["sent"] if state else 0), size)
+
+    def finish(self, path: str):
+        if self.files.pop(path, None) is not None:
+            self.files_done += 1
+
+    @classmethod
+    def parse_size(cls, text: str) -> int:
+        """Bytes of a meter amount such as ``23MB`` or ``70`` (rounded, 1024-based)."""
+        number = text.rstrip("B")
+        unit = number[-1] if number[-1] in cls.SIZE_UNITS else " "
+        return int(float(number.rstrip(cls.SIZE_UNITS)) * 1024 ** cls.SIZE_UNITS.index(unit))
+
+    def sample(self) -> dict:
+        now = time.monotonic()
+        last_time, last_sent = self._last_sample
+        if now > last_time:
+            self.rate = (self.sent - last_sent) / (now - last_time)
+            if self.smoothed_rate is None:
+                self.smoothed_rate = self.rate
+            else:
+                self.smoothed_rate = self.smoothing * self.rate + (1 - self.smoothing) * self.smoothed_rate
+            self._last_sample = (now, self.sent)
+
+        remaining = max(0, self.total - self.sent) if self.total else None
+        files = {}
+        for path, state in self.files.items():
+            elapsed = now - state["started"]
+            files[path] = {
+                "size": state["size"],
+                "sent_bytes": state["sent"],
+                "percent": min(100, int(state["sent"] / state["size"] * 100)) if state["size"] else None,
+                "rate": state["sent"] / elapsed if elapsed > 0 else 0.0,
+            }
+        return {
+            "sent_bytes": self.sent,
+            "total_bytes": self.total,
+            "percent": min(100, int(self.sent / self.total * 100)) if self.total else None,
+            "rate": self.rate,
+            "smoothed_rate": self.smoothed_rate,
+            "eta_seconds": round(remaining / self.smoothed_rate, 1)
+            if remaining is not None and self.smoothed_rate else None,
+            "elapsed_seconds": round(now - self.started, 3),
+            "files_done": self.files_done,
+            "files": files,
         }
 
-        if downloaded_bytes is not None:
-            updated_entry["downloaded_bytes"] = downloaded_bytes
-        if total_bytes is not None:
-            updated_entry["total_bytes"] = total_bytes
+class DirectoryGrowthWatcher:
+    """Follows bytes written under a directory tree by an external tool, via Linux inotify.
 
-        if append_log and normalized_message:
-            inferred_type = log_type
-            if inferred_type is None:
-                if status in {"transfer_complete", "exists"}:
-                    inferred_type = "success"
-                elif status == "error":
-                    inferred_type = "error"
-                else:
-                    inferred_type = "info"
+    Only files named in events are stat'ed, so cost scales with write activity rather than
+    tree size. ``start`` returns False where inotify is unavailable (e.g. macOS).
+    """
 
-            last_message = logs[-1]["message"] if logs else None
-            if normalized_message != last_message:
-                logs.append(
-                    {
-                        "message": normalized_message,
-                        "type": inferred_type,
-                        "timestamp": time.time(),
-                    }
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct("iIII")
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, root: Path, on_change: Callable[[], None]):
+        self.root = root
+        self.on_change = on_change
+        self.total = 0
+        self.sizes: dict = {}
+        self.watches: dict = {}
+        self._libc = None
+        self._fd: Optional[int] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> bool:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        except (OSError, AttributeError):
+            return False
+        if fd < 0:
+            return False
+
+        self._libc = libc
+        self._fd = fd
+        self._loop = loop
+        self.watch_tree(self.root)
+        loop.add_reader(fd, self.read_events)
+        return True
+
+    def stop(self):
+        if self._fd is None:
+            return
+        self._loop.remove_reader(self._fd)
+        os.close(self._fd)
+        self._fd = None
+
+    def watch_tree(self, directory: Path):
+        """Watch ``directory`` and everything already inside it (files may predate the watch)."""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            return
+        self.watches[wd] = directory
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                self.watch_tree(Path(entry.path))
+            else:
+                self.record_size(Path(entry.path))
+
+    def record_size(self, path: Path):
+        try:
+            size = path.stat().st_size
+        except OSError:
+            size = 0
+        self.total += size - self.sizes.get(path, 0)
+        self.sizes[path] = size
+
+    def forget(self, path: Path):
+        self.total -= self.sizes.pop(path, 0)
+
+    def read_events(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        # Many IN_MODIFY events per file arrive in one read; stat each file once
+        touched = set()
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = directory / os.fsdecode(name)
+
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    self.watch_tree(path)
+            elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                touched.discard(path)
+                self.forget(path)
+            else:
+                touched.add(path)
+
+        for path in touched:
+            self.record_size(path)
+        self.on_change()
+
+class StreamingHasher:
+    """Hashes a file in offset order while parallel range workers write it out of order.
+
+    Bytes that land exactly at the hash cursor are hashed straight from memory. When the
+    cursor reaches data another range wrote ahead of it, it catches up with ``pread`` of
+    those just-written bytes, which come from the page cache rather than a second pass
+    over the disk. Git blob ids (``sha1``) hash a ``blob <size>\\0`` header first.
+    """
+
+    def __init__(self, path: Path, algo: str, size: int, ranges: List[tuple]):
+        self.path = path
+        self.size = size
+        self.hasher = hashlib.sha256() if algo == "sha256" else hashlib.sha1()
+        if algo == "sha1":
+            self.hasher.update(f"blob {size}\0".encode())
+        self.starts = [start for start, _ in ranges]
+        self.reached = {start: start for start in self.starts}
+        self.cursor = 0
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def seed(self, start: int, reached: int):
+        """Declare bytes a previous attempt left on disk for the range at ``start``."""
+        self.reached[start] = reached
+
+    def update(self, start: int, chunk: bytes, offset: int):
+        with self._lock:
+            self.reached[start] = offset + len(chunk)
+            if offset == self.cursor:
+                self.hasher.update(chunk)
+                self.cursor += len(chunk)
+            self._catch_up()
+
+    def _catch_up(self):
+        while self.cursor < self.size:
+            range_start = self.starts[bisect.bisect_right(self.starts, self.cursor) - 1]
+            available = self.reached[range_start]
+            if available <= self.cursor:
+                return
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDONLY)
+            chunk = os.pread(self._fd, min(available - self.cursor, 1024 * 1024), self.cursor)
+            if not chunk:
+                return
+            self.hasher.update(chunk)
+            self.cursor += len(chunk)
+
+    def finish(self) -> str:
+        with self._lock:
+            try:
+                self._catch_up()
+            finally:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+            if self.cursor != self.size:
+                raise Exception(f"Hashed {self.cursor} of {self.size} bytes")
+            return self.hasher.hexdigest()
+
+class BufferPool:
+    """Fixed set of reusable byte buffers shared by relay readers and the relay writer."""
+
+    def __init__(self, count: int, buffer_size: int):
+        self.buffer_size = buffer_size
+        self._free: queue.Queue = queue.Queue()
+        for _ in range(count):
+            self._free.put(bytearray(buffer_size))
+
+    def acquire(self, abort_event: Optional[threading.Event] = None) -> bytearray:
+        """Block until a buffer is free (or ``abort_event`` is set)."""
+        while True:
+            if abort_event is not None and abort_event.is_set():
+                raise Exception("Relay aborted")
+            try:
+                return self._free.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def release(self, buffer: bytearray):
+        self._free.put(buffer)
+
+class TokenBucket:
+    """Token bucket that lets callers go into debt.
+
+    Consumers take tokens for bytes they already moved and then wait until the bucket is
+    back out of debt, re-checking ``deficit`` so a rate change takes effect mid-wait.
+    Threads and coroutines can share one bucket without blocking inside it. A rate of
+    ``None`` means unlimited.
+    """
+
+    MIN_BURST = 1024 * 1024
+
+    def __init__(self, rate: Optional[float] = None):
+        self.rate = rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    @property
+    def burst(self) -> float:
+        return max(self.MIN_BURST, (self.rate or 0) * 0.25)
+
+    def refill(self, now: float):
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate: Optional[float]):
+        self.refill(time.monotonic())
+        self.rate = rate
+        self.tokens = min(self.tokens, self.burst) if rate else self.burst
+
+    def reserve(self, amount: int):
+        if self.rate:
+            self.refill(time.monotonic())
+            self.tokens -= amount
+
+    def deficit(self) -> float:
+        """Seconds until the bucket is out of debt at the current rate."""
+        if not self.rate:
+            return 0.0
+        self.refill(time.monotonic())
+        return max(0.0, -self.tokens / self.rate)
+
+class BandwidthGovernor:
+    """Shapes download and upload bandwidth across jobs with token buckets.
+
+    Each direction has a global bucket (base limit, overridden by time-of-day schedule
+    windows) and every job has its own bucket per direction. ``rebalance`` splits the
+    global limit among jobs that moved bytes recently, weighted by ``2 ** priority`` and
+    capped by per-job limits, with any share a capped job cannot use handed to the rest.
+    Rates are bytes per second; ``None`` is unlimited.
+    """
+
+    DIRECTIONS = ("download", "upload")
+    ACTIVE_WINDOW = 3.0
+    RATE_SMOOTHING = 0.3
+    MAX_SLEEP = 0.25
+
+    def __init__(self, limits: dict, job_limits: dict, schedule: str = ""):
+        self.limits = dict(limits)
+        self.job_limits = dict(job_limits)
+        self.schedule_text = ""
+        self.schedule: list = []
+        self.global_buckets = {direction: TokenBucket() for direction in self.DIRECTIONS}
+        self.global_bytes = {direction: 0 for direction in self.DIRECTIONS}
+        self.global_rates = {direction: 0.0 for direction in self.DIRECTIONS}
+        self.jobs: dict = {}
+        self._last_sample = {direction: 0 for direction in self.DIRECTIONS}
+        self._last_rebalance = time.monotonic()
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        try:
+            self.set_schedule(schedule)
+        except ValueError as e:
+            print(f"Ignoring invalid BANDWIDTH_SCHEDULE: {e}")
+        self.rebalance()
+
+    @staticmethod
+    def mb_to_rate(value: Optional[float]) -> Optional[float]:
+        """Convert a MB/s setting to bytes/s; ``0`` or less means unlimited."""
+        if value is None or value <= 0:
+            return None
+        return value * 1024 * 1024
+
+    @staticmethod
+    def parse_minute(text: str) -> int:
+        """Minutes since midnight for ``"HH:MM"``."""
+        hour, minute = (int(part) for part in text.split(":"))
+        if not (0 <= minute < 60 and 0 <= hour * 60 + minute <= 24 * 60):
+            raise ValueError(f"time out of range: {text}")
+        return hour * 60 + minute
+
+    @classmethod
+    def parse_schedule(cls, text: str) -> list:
+        """Parse ``"HH:MM-HH:MM download=MB,upload=MB; ..."`` into schedule windows.
+
+        Windows may wrap past midnight; the first one covering the current local time
+        overrides the base limit of each direction it names (``0`` lifts the limit).
+        """
+        windows = []
+        for spec in filter(None, (part.strip() for part in (text or "").split(";"))):
+            span, _, assignments = spec.partition(" ")
+            try:
+                start_text, end_text = span.split("-")
+                start, end = (cls.parse_minute(text) for text in (start_text, end_text))
+                limits = {}
+                for assignment in filter(None, (item.strip() for item in assignments.split(","))):
+                    direction, _, value = assignment.partition("=")
+                    direction = direction.strip()
+                    if direction not in cls.DIRECTIONS:
+                        raise ValueError(f"unknown direction {direction!r}")
+                    limits[direction] = cls.mb_to_rate(float(value))
+            except ValueError as e:
+                raise ValueError(f"bad schedule window {spec!r}: {e}")
+            windows.append({
+                "spec": spec,
+                "start": start,
+                "end": end,
+                "limits": limits,
+            })
+        return windows
+
+    def set_schedule(self, text: str):
+        windows = self.parse_schedule(text)
+        with self._lock:
+            self.schedule = windows
+            self.schedule_text = text or ""
+
+    def active_window(self) -> Optional[dict]:
+        now = time.localtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        for window in self.schedule:
+            if window["start"] <= window["end"]:
+                if window["start"] <= minute < window["end"]:
+                    return window
+            elif minute >= window["start"] or minute < window["end"]:
+                return window
+        return None
+
+    def global_limit(self, direction: str) -> Optional[float]:
+        window = self.active_window()
+        if window is not None and direction in window["limits"]:
+            return window["limits"][direction]
+        return self.limits.get(direction)
+
+    def set_limit(self, direction: str, rate: Optional[float]):
+        self.limits[direction] = rate
+
+    def register(self, key: str, priority: int = 0, limits: Optional[dict] = None) -> dict:
+        """Track a job; returns its public state, which ``rebalance`` keeps up to date."""
+        limits = {direction: (limits or {}).get(direction, self.job_limits.get(direction)) for direction in self.DIRECTIONS}
+        view = {"priority": priority}
+        for direction in self.DIRECTIONS:
+            view[direction] = {"limit": limits[direction], "effective_rate": None, "rate": 0.0, "bytes": 0}
+        with self._lock:
+            self.jobs[key] = {
+                "priority": priority,
+                "limits": limits,
+                "buckets": {direction: TokenBucket() for direction in self.DIRECTIONS},
+                "bytes": {direction: 0 for direction in self.DIRECTIONS},
+                "sampled": {direction: 0 for direction in self.DIRECTIONS},
+                "last_active": {direction: float("-inf") for direction in self.DIRECTIONS},
+                "holds": {direction: 0 for direction in self.DIRECTIONS},
+                "view": view,
+            }
+        self.rebalance()
+        return view
+
+    def unregister(self, key: str):
+        # Settle the job's final figures before it leaves the shares
+        self.rebalance()
+        with self._lock:
+            self.jobs.pop(key, None)
+        self.rebalance()
+
+    def update_job(self, key: str, priority: Optional[int] = None, limits: Optional[dict] = None) -> bool:
+        with self._lock:
+            job = self.jobs.get(key)
+            if job is None:
+                return False
+            if priority is not None:
+                job["priority"] = priority
+                job["view"]["priority"] = priority
+            for direction, rate in (limits or {}).items():
+                job["limits"][direction] = rate
+                job["view"][direction]["limit"] = rate
+        self.rebalance()
+        return True
+
+    def priority(self, key: Optional[str]) -> int:
+        job = self.jobs.get(key) if key is not None else None
+        return job["priority"] if job is not None else 0
+
+    def reserve(self, key: Optional[str], direction: str, amount: int):
+        """Charge ``amount`` bytes moved by job ``key`` to its bucket and the global one."""
+        with self._lock:
+            self.global_bytes[direction] += amount
+            self.global_buckets[direction].reserve(amount)
+            job = self.jobs.get(key) if key is not None else None
+            if job is not None:
+                job["bytes"][direction] += amount
+                job["last_active"][direction] = time.monotonic()
+                job["buckets"][direction].reserve(amount)
+
+    def delay(self, key: Optional[str], direction: str) -> float:
+        with self._lock:
+            wait = self.global_buckets[direction].deficit()
+            job = self.jobs.get(key) if key is not None else None
+            if job is not None:
+                wait = max(wait, job["buckets"][direction].deficit())
+        return wait
+
+    def pace(self, key: Optional[str], direction: str, amount: int, abort_event: threading.Event):
+        """Blocking ``throttle`` for worker threads; returns early once ``abort_event`` is set."""
+        self.reserve(key, direction, amount)
+        while not abort_event.is_set():
+            wait = self.delay(key, direction)
+            if wait <= 0:
+                return
+            abort_event.wait(min(wait, self.MAX_SLEEP))
+
+    async def throttle(self, key: Optional[str], direction: str, amount: int):
+        self.reserve(key, direction, amount)
+        while True:
+            wait = self.delay(key, direction)
+            if wait <= 0:
+                return
+            await asyncio.sleep(min(wait, self.MAX_SLEEP))
+
+    @asynccontextmanager
+    async def hold(self, key: str, direction: str):
+        """Count job ``key`` as active in ``direction`` while bytes move outside the buckets."""
+        with self._lock:
+            job = self.jobs.get(key)
+            if job is not None:
+                job["holds"][direction] += 1
+        self.rebalance()
+        try:
+            yield
+        finally:
+            with self._lock:
+                job = self.jobs.get(key)
+                if job is not None:
+                    job["holds"][direction] -= 1
+            self.rebalance()
+
+    def effective_rate(self, key: str, direction: str) -> Optional[float]:
+        with self._lock:
+            job = self.jobs.get(key)
+            return job["buckets"][direction].rate if job is not None else self.global_buckets[direction].rate
+
+    def rebalance(self):
+        """Recompute bucket rates and sample the measured transfer rates."""
+        now = time.monotonic()
+        with self._lock:
+            elapsed = now - self._last_rebalance
+            sample = elapsed >= 0.5
+            if sample:
+                self._last_rebalance = now
+
+            for direction in self.DIRECTIONS:
+                limit = self.global_limit(direction)
+                self.global_buckets[direction].set_rate(limit)
+
+                if sample:
+                    moved = self.global_bytes[direction] - self._last_sample[direction]
+                    self._last_sample[direction] = self.global_bytes[direction]
+                    self.global_rates[direction] += self.RATE_SMOOTHING * (moved / elapsed - self.global_rates[direction])
+
+                weights = {key: 2.0 ** max(-10, min(10, job["priority"])) for key, job in self.jobs.items()}
+                active = {
+                    key for key, job in self.jobs.items()
+                    if job["holds"][direction] or now - job["last_active"][direction] < self.ACTIVE_WINDOW
+                }
+                shares = self.water_fill(
+                    limit, {key: weights[key] for key in active},
+                    {key: self.jobs[key]["limits"][direction] for key in active}
                 )
 
-        if len(logs) > 200:
-            logs = logs[-200:]
+                active_weight = sum(weights[key] for key in active)
+                for key, job in self.jobs.items():
+                    if key in shares:
+                        rate = shares[key]
+                    else:
+                        # An idle job that wakes up gets the share it would have had
+                        cap = job["limits"][direction]
+                        rate = limit * weights[key] / (active_weight + weights[key]) if limit else None
+                        rate = cap if rate is None else (rate if cap is None else min(rate, cap))
+                    job["buckets"][direction].set_rate(rate)
 
-        if logs:
-            updated_entry["logs"] = logs
+                    view = job["view"][direction]
+                    view["effective_rate"] = rate
+                    view["bytes"] = job["bytes"][direction]
+                    if sample:
+                        moved = job["bytes"][direction] - job["sampled"][direction]
+                        job["sampled"][direction] = job["bytes"][direction]
+                        view["rate"] += self.RATE_SMOOTHING * (moved / elapsed - view["rate"])
+
+    @staticmethod
+    def water_fill(limit: Optional[float], weights: dict, caps: dict) -> dict:
+        """Split ``limit`` by weight, giving capped jobs no more than their cap."""
+        if limit is None:
+            return dict(caps)
+        shares = {}
+        remaining = limit
+        pending = dict(weights)
+        while pending:
+            total_weight = sum(pending.values())
+            capped = {
+                key for key, weight in pending.items()
+                if caps[key] is not None and caps[key] <= remaining * weight / total_weight
+            }
+            if not capped:
+                for key, weight in pending.items():
+                    shares[key] = remaining * weight / total_weight
+                break
+            for key in capped:
+                shares[key] = caps[key]
+                remaining -= caps[key]
+                del pending[key]
+        return shares
+
+    async def rebalance_loop(self):
+        while True:
+            await asyncio.sleep(1.0)
+            self.rebalance()
+
+    def start(self):
+        self._task = asyncio.create_task(self.rebalance_loop())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def status(self) -> dict:
+        self.rebalance()
+        window = self.active_window()
+        status = {
+            "schedule": self.schedule_text,
+            "active_window": window["spec"] if window else None,
+        }
+        for direction in self.DIRECTIONS:
+            status[direction] = {
+                "limit": self.limits.get(direction),
+                "effective_limit": self.global_buckets[direction].rate,
+                "job_limit": self.job_limits.get(direction),
+                "rate": self.global_rates[direction],
+            }
+        status["jobs"] = {key: job["view"] for key, job in self.jobs.items()}
+        return status
+
+class PrioritySlots:
+    """Counting semaphore whose waiters are admitted highest priority first, FIFO within a priority."""
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: list = []
+        self._sequence = itertools.count()
+
+    def locked(self) -> bool:
+        return self._value == 0 or bool(self._waiters)
+
+    def waiting(self) -> int:
+        return sum(1 for _, _, waiter in self._waiters if not waiter.done())
+
+    async def acquire(self, priority: int = 0):
+        if not self.locked():
+            self._value -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._sequence), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Pass on a slot that was handed over just as we were cancelled
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._value += 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = 0):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+class WireCompression:
+    """Per-file choice of zstd on the upload wire.
+
+    Weight and archive formats pass through untouched, text formats are always
+    compressed, and anything else is judged by the byte entropy of a few samples spread
+    across the file. The remote side decompresses with the ``zstd`` CLI.
+    """
+
+    PASSTHROUGH_SUFFIXES = {
+        ".safetensors", ".gguf", ".ggml", ".gz", ".tgz", ".zst", ".xz", ".bz2", ".zip", ".7z",
+        ".parquet", ".png", ".jpg", ".jpeg", ".webp", ".mp3", ".mp4", ".wav", ".flac",
+    }
+    TEXT_SUFFIXES = {
+        ".json", ".jsonl", ".txt", ".csv", ".tsv", ".md", ".py", ".yaml", ".yml", ".xml",
+        ".html", ".model", ".vocab", ".tiktoken", ".merges",
+    }
+    SAMPLE_COUNT = 8
+    SAMPLE_SIZE = 64 * 1024
+
+    def __init__(self, level: int, min_size: int, entropy_threshold: float):
+        self.level = level
+        self.min_size = min_size
+        self.entropy_threshold = entropy_threshold
+
+    @property
+    def available(self) -> bool:
+        return zstandard is not None
+
+    @staticmethod
+    def entropy(data: bytes) -> float:
+        """Shannon entropy in bits per byte (8.0 for random data)."""
+        if not data:
+            return 0.0
+        total = len(data)
+        return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+    def sample(self, path: Path, size: int) -> bytes:
+        with open(path, "rb") as handle:
+            if size <= self.SAMPLE_COUNT * self.SAMPLE_SIZE:
+                return handle.read()
+            samples = []
+            step = (size - self.SAMPLE_SIZE) // (self.SAMPLE_COUNT - 1)
+            for index in range(self.SAMPLE_COUNT):
+                handle.seek(index * step)
+                samples.append(handle.read(self.SAMPLE_SIZE))
+            return b"".join(samples)
+
+    def decide(self, path: Path, size: int) -> bool:
+        """Whether to compress one file; may read samples from disk."""
+        if size < self.min_size:
+            return False
+        suffix = path.suffix.lower()
+        if suffix in self.PASSTHROUGH_SUFFIXES:
+            return False
+        if suffix in self.TEXT_SUFFIXES:
+            return True
+        return self.entropy(self.sample(path, size)) < self.entropy_threshold
+
+    def compressor(self):
+        return zstandard.ZstdCompressor(level=self.level).compressobj()
+
+class HubRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follow Hub redirects, dropping the auth header when leaving the Hub host (CDN/S3 links are pre-signed)."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        new_request = super().redirect_request(req, fp, code, msg, headers, newurl)
+        if new_request is not None:
+            if urllib.parse.urlparse(newurl).netloc != urllib.parse.urlparse(req.full_url).netloc:
+                new_request.remove_header("Authorization")
+        return new_request
+
+class SSHConnectionPool:
+    """Persistent OpenSSH ControlMaster connections shared by every ssh/scp invocation.
+
+    Each slot is one multiplexed TCP connection. Commands are spread round-robin over
+    healthy slots, so the TCP+key-exchange+auth handshake is paid once per slot rather
+    than once per call. A background loop health-checks slots and reconnects dead ones.
+    """
+
+    def __init__(self, destination: str, size: int, control_dir: Path, health_interval: float, name: str = "cm"):
+        self.destination = destination
+        self.size = size
+        self.control_dir = control_dir
+        self.health_interval = health_interval
+        self.slots = [
+            {
+                "control_path": str(control_dir / f"{name}-{index}"),
+                "healthy": False,
+                "last_check": None,
+                "reconnects": 0,
+                "last_error": None,
+            }
+            for index in range(size)
+        ]
+        self._cursor = itertools.count()
+        self._health_task: Optional[asyncio.Task] = None
+
+    def options(self, index: Optional[int] = None) -> List[str]:
+        """ssh/scp ``-o`` options routing a command through a pooled connection.
+
+        Without ``index`` the next healthy connection is picked round-robin; with it the
+        command is pinned to connection ``index % size``.
+        """
+        if not self.size:
+            return []
+        if index is not None:
+            slot = self.slots[index % self.size]
         else:
-            updated_entry.pop("logs", None)
+            candidates = [slot for slot in self.slots if slot["healthy"]] or self.slots
+            slot = candidates[next(self._cursor) % len(candidates)]
+        # ControlMaster=auto re-establishes the master on demand if the health loop hasn't yet
+        return [
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={slot['control_path']}",
+            "-o", "ControlPersist=yes",
+        ]
 
-        self.download_progress[key] = updated_entry
-        print(f"Progress update [{key}]: {status} - {message} ({progress}%)")
+    async def check(self, slot: dict) -> bool:
+        process = await asyncio.create_subprocess_exec(
+            "ssh", "-O", "check", "-o", f"ControlPath={slot['control_path']}", self.destination,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+        slot["last_check"] = time.time()
+        slot["healthy"] = process.returncode == 0
+        if not slot["healthy"]:
+            slot["last_error"] = stderr.decode(errors="ignore").strip() or None
+        return slot["healthy"]
 
-        # Save to file
-        self.save_progress_to_file()
+    async def connect(self, slot: dict) -> bool:
+        """(Re)start the background master for ``slot``."""
+        control_path = Path(slot["control_path"])
+        if control_path.exists():
+            # Stale socket left behind by a dead master
+            control_path.unlink()
 
-    def cleanup_completed_progress(self, key: str):
-        """Remove completed downloads from progress tracking after delay"""
-        async def delayed_cleanup():
-            await asyncio.sleep(300)  # Wait 5 minutes
-            if key in self.download_progress:
-                status = self.download_progress[key].get('status')
-                if status in ['transfer_complete', 'exists', 'error']:
-                    del self.download_progress[key]
-                    self.save_progress_to_file()
-                    print(f"Cleaned up completed progress for: {key}")
+        # -f backgrounds the master after auth; its inherited pipes would never close, hence DEVNULL
+        process = await asyncio.create_subprocess_exec(
+            "ssh", "-M", "-N", "-f",
+            "-o", f"ControlPath={slot['control_path']}",
+            "-o", "ControlPersist=yes",
+            "-o", "BatchMode=yes",
+            "-o", "ConnectTimeout=10",
+            "-o", "ServerAliveInterval=15",
+            "-o", "ServerAliveCountMax=3",
+            self.destination,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        return_code = await process.wait()
+        slot["reconnects"] += 1
+        if return_code != 0:
+            slot["healthy"] = False
+            slot["last_error"] = f"ssh master exited with code {return_code}"
+            return False
+        return await self.check(slot)
 
-        # Run cleanup in background
-        asyncio.create_task(delayed_cleanup())
+    async def ensure(self, slot: dict) -> bool:
+        if await self.check(slot):
+            return True
+        print(f"SSH pool: reconnecting {slot['control_path']} ({slot['last_error']})")
+        return await self.connect(slot)
 
-    async def get_repo_total_size(self, author: str, repo_name: str) -> Optional[int]:
-        """Fetch total repository size from HuggingFace Hub metadata."""
-        repo_id = f"{author}/{repo_name}"
+    async def start(self):
+        if not self.size:
+            return
+        self.control_dir.mkdir(parents=True, exist_ok=True)
+        os.chmod(self.control_dir, 0o700)
+        await asyncio.gather(*(self.ensure(slot) for slot in self.slots), return_exceptions=True)
+        healthy = sum(1 for slot in self.slots if slot["healthy"])
+        print(f"SSH pool: {healthy}/{self.size} connections to {self.destination} ready")
+        self._health_task = asyncio.create_task(self.health_loop())
 
-        def _fetch_size():
+    async def health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
             try:
-                info = self.hf_api.model_info(repo_id, files_metadata=True)
-                total = 0
-                if hasattr(info, "siblings"):
-                    for sibling in info.siblings:
-                        if sibling.size is not None:
-                            total += sibling.size
-                return total or None
-            except HfHubHTTPError as err:
-                if getattr(err, "response", None) is not None and err.response.status_code == 404:
-                    return None
-                print(f"HuggingFace API error when fetching {repo_id}: {err}")
-                return None
-            except Exception as err:
-                print(f"Failed to fetch repo size for {repo_id}: {err}")
-                return None
+                await asyncio.gather(*(self.ensure(slot) for slot in self.slots))
+            except Exception as e:
+                print(f"SSH pool health check failed: {e}")
 
-        return await asyncio.to_thread(_fetch_size)
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+        for slot in self.slots:
+            if not Path(slot["control_path"]).exists():
+                continue
+            process = await asyncio.create_subprocess_exec(
+                "ssh", "-O", "exit", "-o", f"ControlPath={slot['control_path']}", self.destination,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+            await process.wait()
+            slot["healthy"] = False
 
-    def get_directory_size(self, path: Path) -> int:
-        """Calculate total size of files within the given directory."""
-        if not path.exists():
-            return 0
+    def status(self) -> dict:
+        return {
+            "size": self.size,
+            "healthy": sum(1 for slot in self.slots if slot["healthy"]),
+            "connections": self.slots,
+        }
 
-        total = 0
-        for root, _, files in os.walk(path):
-            for file_name in files:
-                file_path = Path(root) / file_name
-                try:
-                    total += file_path.stat().st_size
-                except OSError:
-                    continue
-        return total
+class RemoteInventory:
+    """In-memory set of ``author/repo`` directories present under ``SUPERCOMPUTER_PATH``.
 
-    def format_bytes(self, size: int) -> str:
-        """Human readable byte formatter."""
-        if size is None:
-            return "0 B"
-        step_unit = 1024
-        units = ["B", "KiB", "MiB", "GiB", "TiB", "PiB"]
-        idx = 0
-        value = float(size)
-        while value >= step_unit and idx < len(units) - 1:
-            value /= step_unit
-            idx += 1
-        return f"{value:.2f} {units[idx]}"
+    Built with one remote listing and refreshed on a TTL. Refreshes are incremental:
+    only author directories modified since the previous listing (tracked by a marker
+    file in the remote ``~/.cache``) are re-listed. Completed transfers update the set
+    locally, so lookups never wait on ssh once the first listing has landed.
+    """
 
-    async def monitor_download_progress(
-        self,
-        repo_path: Path,
-        progress_key: str,
-        expected_total: Optional[int],
-        stop_event: asyncio.Event,
-        interval_seconds: float = 2.0
-    ):
-        """Monitor local repo size and update progress based on actual bytes."""
+    MARKER = "$HOME/.cache/hf_proxy_inventory.marker"
 
-        last_reported_size = -1
+    def __init__(self, server: "DownloadProxyServer", ttl: float):
+        self.server = server
+        self.ttl = ttl
+        self.repos: set = set()
+        self.last_refresh: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def build_listing_command(self, full: bool) -> str:
+        script = (
+            f"cd {shlex.quote(self.server.supercomputer_path)} 2>/dev/null || exit 0\n"
+            f"mkdir -p \"$HOME/.cache\"; marker=\"{self.MARKER}\"; full={1 if full else 0}\n"
+            # Stamp the next marker before listing so changes made meanwhile are caught next time
+            "touch \"$marker.next\"\n"
+            "if [ $full = 1 ] || [ ! -f \"$marker\" ]; then full=1; echo FULL; else echo INCR; fi\n"
+            "for a in */; do\n"
+            "  [ -d \"$a\" ] || continue; a=\"${a%/}\"\n"
+            "  printf 'A\\t%s\\n' \"$a\"\n"
+            "  if [ $full = 1 ] || [ \"$a\" -nt \"$marker\" ]; then\n"
+            "    printf 'C\\t%s\\n' \"$a\"\n"
+            "    for r in \"$a\"/*/; do [ -d \"$r\" ] && printf 'R\\t%s\\n' \"${r%/}\"; done\n"
+            "  fi\n"
+            "done\n"
+            "mv -f \"$marker.next\" \"$marker\"\n"
+        )
+        # Run under sh regardless of the remote login shell
+        return f"sh -c {shlex.quote(script)}"
+
+    async def refresh(self, full: bool = False):
+        async with self._lock:
+            full = full or self.last_refresh is None
+            return_code, stdout, stderr = await self.server.run_remote(self.build_listing_command(full))
+            if return_code != 0:
+                raise Exception(f"Remote listing failed: {stderr.strip()}")
+
+            lines = stdout.splitlines()
+            mode = lines[0] if lines else "FULL"
+            authors = set()
+            changed_authors = set()
+            listed = set()
+            for line in lines[1:]:
+                kind, _, name = line.partition("\t")
+                if kind == "A":
+                    authors.add(name)
+                elif kind == "C":
+                    changed_authors.add(name)
+                elif kind == "R":
+                    listed.add(name)
 
+            if mode == "FULL":
+                repos = listed
+            else:
+                repos = {
+                    key for key in self.repos
+                    if key.split("/", 1)[0] in authors and key.split("/", 1)[0] not in changed_authors
+                }
+                repos |= listed
+
+            self.repos = repos
+            self.last_refresh = time.time()
+            print(f"Remote inventory refreshed ({mode.lower()}): {len(self.repos)} repos")
+
+    async def refresh_loop(self):
         while True:
-            size_bytes = await asyncio.to_thread(self.get_directory_size, repo_path)
-
-            if size_bytes != last_reported_size:
-                message: str
-                progress_value: Optional[int] = None
-                effective_size = size_bytes
-
-                if expected_total and expected_total > 0:
-                    clamped = min(size_bytes, expected_total)
-                    ratio = clamped / expected_total
-                    progress_value = min(99, int(ratio * 100))
-                    message = (
-                        f"Downloading files... {self.format_bytes(clamped)} / "
-                        f"{self.format_bytes(expected_total)}"
-                    )
-                    effective_size = clamped
-                else:
-                    message = f"Downloading files... {self.format_bytes(size_bytes)}"
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Remote inventory refresh failed: {e}")
+            await asyncio.sleep(self.ttl)
 
-                if progress_value is None:
-                    current = self.download_progress.get(progress_key, {})
-                    current_progress = current.get("progress", 0)
-                    if size_bytes > 0:
-                        progress_value = min(99, max(current_progress, 1))
-                    else:
-                        progress_value = current_progress
+    def start(self):
+        self._refresh_task = asyncio.create_task(self.refresh_loop())
+
+    def stop(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+
+    async def exists(self, author: str, repo_name: str) -> bool:
+        if self.last_refresh is None:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Remote inventory unavailable, checking directly: {e}")
+                return_code, _, _ = await self.server.run_remote(
+                    f"test -d {shlex.quote(f'{self.server.supercomputer_path}/{author}/{repo_name}')}"
+                )
+                return return_code == 0
+        return f"{author}/{repo_name}" in self.repos
+
+    def mark_present(self, author: str, repo_name: str):
+        self.repos.add(f"{author}/{repo_name}")
+
+    def mark_absent(self, author: str, repo_name: str):
+        self.repos.discard(f"{author}/{repo_name}")
+
+class ProgressStore:
+    """Progress entries persisted as a compact snapshot plus an append-only journal of deltas.
+
+    Updates change the in-memory entries immediately and queue a delta (changed fields
+    and newly appended log lines). A background loop appends the queued deltas to the
+    journal in one batch every ``flush_interval`` seconds and folds the journal into a
+    fresh snapshot once it passes ``compact_threshold`` records. Finished entries are
+    expired by a single sweeper task.
+    """
+
+    TERMINAL_STATUSES = ("transfer_complete", "exists", "error")
+    MAX_LOGS = 200
+
+    def __init__(
+        self,
+        snapshot_path: Path,
+        journal_path: Path,
+        flush_interval: float,
+        compact_threshold: int,
+        max_age: float = 86400
+    ):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        self.compact_threshold = compact_threshold
+        self.max_age = max_age
+        self.entries: dict = {}
+        self._pending: dict = {}
+        self._expiry: dict = {}
+        self._journal_records = 0
+        self._tasks: List[asyncio.Task] = []
+        # Called with (key, entry) on every change, (key, None) on removal
+        self.on_change: Optional[Callable[[str, Optional[dict]], None]] = None
+        self.load()
+
+    @staticmethod
+    def apply_record(entries: dict, record: dict):
+        """Apply one journal record. Log lines not newer than the entry's last line are skipped,
+        so replaying a record twice (e.g. after a crash mid-compaction) is harmless."""
+        key = record["k"]
+        if record.get("d"):
+            entries.pop(key, None)
+        if "s" not in record and "l" not in record:
+            return
+        entry = entries.setdefault(key, {})
+        entry.update(record.get("s", {}))
+        if record.get("l"):
+            logs = entry.get("logs", [])
+            last_timestamp = logs[-1]["timestamp"] if logs else float("-inf")
+            logs.extend(log for log in record["l"] if log["timestamp"] > last_timestamp)
+            entry["logs"] = logs[-ProgressStore.MAX_LOGS:]
+
+    def load(self):
+        """Load the snapshot, replay the journal and drop entries older than ``max_age``."""
+        entries = {}
+        try:
+            if self.snapshot_path.exists():
+                with open(self.snapshot_path, "r") as f:
+                    entries = json.load(f)
+        except Exception as e:
+            print(f"Failed to load progress snapshot: {e}")
+
+        try:
+            if self.journal_path.exists():
+                with open(self.journal_path, "r") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # Torn final line from a crash mid-append
+                            continue
+                        self.apply_record(entries, record)
+                        self._journal_records += 1
+        except Exception as e:
+            print(f"Failed to replay progress journal: {e}")
+
+        current_time = time.time()
+        self.entries = {
+            key: entry for key, entry in entries.items()
+            if current_time - entry.get("timestamp", 0) < self.max_age
+        }
+
+    def put(self, key: str, entry: dict, new_log: Optional[dict] = None):
+        """Store ``entry`` for ``key`` and queue the fields that changed plus ``new_log``."""
+        previous = self.entries.get(key, {})
+        changed = {
+            field: value for field, value in entry.items()
+            if field != "logs" and previous.get(field) != value
+        }
+        self.entries[key] = entry
+
+        record = self._pending.setdefault(key, {"k": key})
+        record.setdefault("s", {}).update(changed)
+        if new_log is not None:
+            logs = record.setdefault("l", [])
+            logs.append(new_log)
+            del logs[:-self.MAX_LOGS]
+
+        if self.on_change is not None:
+            self.on_change(key, entry)
+
+    def delete(self, key: str):
+        self.entries.pop(key, None)
+        self._expiry.pop(key, None)
+        # A delete supersedes any queued changes for the key
+        self._pending[key] = {"k": key, "d": 1}
+        if self.on_change is not None:
+            self.on_change(key, None)
+
+    def expire_after(self, key: str, delay: float):
+        """Drop ``key`` after ``delay`` seconds if it is still in a terminal state then."""
+        self._expiry[key] = time.time() + delay
+
+    def take_pending(self) -> str:
+        if not self._pending:
+            return ""
+        records = list(self._pending.values())
+        self._pending = {}
+        self._journal_records += len(records)
+        return "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+
+    def append_journal(self, data: str):
+        with open(self.journal_path, "a") as f:
+            f.write(data)
+
+    def write_snapshot(self, data: str):
+        temp_path = self.snapshot_path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            f.write(data)
+        os.replace(temp_path, self.snapshot_path)
+        # The snapshot now covers everything journaled so far
+        with open(self.journal_path, "w"):
+            pass
+
+    async def flush(self):
+        data = self.take_pending()
+        if data:
+            await asyncio.to_thread(self.append_journal, data)
+        if self._journal_records >= self.compact_threshold:
+            await self.compact()
+
+    async def compact(self):
+        # Serialize and clear pending together: the snapshot already contains pending deltas
+        snapshot = json.dumps(self.entries, separators=(",", ":"))
+        self._pending = {}
+        self._journal_records = 0
+        await asyncio.to_thread(self.write_snapshot, snapshot)
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Failed to save progress journal: {e}")
+
+    async def sweep_loop(self, interval: float = 30.0):
+        while True:
+            await asyncio.sleep(interval)
+            current_time = time.time()
+            for key, deadline in list(self._expiry.items()):
+                if deadline > current_time:
+                    continue
+                self._expiry.pop(key, None)
+                if self.entries.get(key, {}).get("status") in self.TERMINAL_STATUSES:
+                    self.delete(key)
+                    print(f"Cleaned up completed progress for: {key}")
+            for key, entry in list(self.entries.items()):
+                if current_time - entry.get("timestamp", 0) >= self.max_age:
+                    self.delete(key)
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self.flush_loop()),
+            asyncio.create_task(self.sweep_loop()),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await self.flush()
+
+class ProgressBroker:
+    """Fans progress updates out to Server-Sent Events subscribers.
+
+    Each subscriber keeps only the latest entry per key until it is sent, so a job
+    that updates faster than a client reads is coalesced instead of queued.
+    """
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self.subscribers: List[dict] = []
+
+    def subscribe(self, keys: Optional[set] = None) -> dict:
+        subscriber = {
+            "keys": keys,
+            "pending": {},
+            "event": asyncio.Event(),
+            "log_cursors": {},
+        }
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: dict):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+
+    def publish(self, key: str, entry: Optional[dict]):
+        """Queue ``entry`` (``None`` when the key was removed) for every matching subscriber."""
+        for subscriber in self.subscribers:
+            if subscriber["keys"] is not None and key not in subscriber["keys"]:
+                continue
+            subscriber["pending"][key] = entry
+            subscriber["event"].set()
+
+    def render(self, subscriber: dict, key: str, entry: Optional[dict]) -> str:
+        """Format one SSE event; only log lines the subscriber has not seen are included."""
+        author, _, repo_name = key.partition("/")
+        if entry is None:
+            payload = {"key": key, "author": author, "repo_name": repo_name, "status": "not_found"}
+            subscriber["log_cursors"].pop(key, None)
+            return f"event: removed\ndata: {json.dumps(payload)}\n\n"
+
+        cursor = subscriber["log_cursors"].get(key, float("-inf"))
+        new_logs = [log for log in entry.get("logs", []) if log["timestamp"] > cursor]
+        if new_logs:
+            subscriber["log_cursors"][key] = new_logs[-1]["timestamp"]
+
+        payload = {
+            "key": key,
+            "author": author,
+            "repo_name": repo_name,
+            **{field: value for field, value in entry.items() if field != "logs"},
+            "logs": new_logs,
+        }
+        return f"event: progress\ndata: {json.dumps(payload)}\n\n"
+
+    async def stream(self, request: Request, initial: dict, keys: Optional[set] = None):
+        """SSE generator: a snapshot of ``initial`` entries, then coalesced updates."""
+        subscriber = self.subscribe(keys)
+        try:
+            for key, entry in initial.items():
+                yield self.render(subscriber, key, entry)
+
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber["event"].wait(), timeout=15)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comment line keeps proxies and the browser from timing out the stream
+                    yield ": keepalive\n\n"
+                    continue
+
+                subscriber["event"].clear()
+                pending, subscriber["pending"] = subscriber["pending"], {}
+                for key, entry in pending.items():
+                    yield self.render(subscriber, key, entry)
+
+                # Let fast producers coalesce before the next batch
+                await asyncio.sleep(self.min_interval)
+        finally:
+            self.unsubscribe(subscriber)
+
+class BlobCache:
+    """Content-addressed store of downloaded repo files, keyed by LFS sha256 or git blob id.
+
+    Blobs live under ``root/<algo>/<xx>/<digest>`` and are only inserted once the
+    download path has verified that their content hashes to the key. Jobs get files by
+    reflink or hardlink, so a hit costs no data copy. Recency is the blob's mtime, which
+    keeps LRU order across restarts. Pipelined jobs read from the cache but never add to
+    it: their staged files are deleted once uploaded, and a cached link would keep every
+    one of them on the staging disk.
+    """
+
+    FICLONE = 0x40049409
+
+    def __init__(self, root: Path, budget_bytes: int):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        self.pinned: dict = {}
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "hit_bytes": 0,
+            "miss_bytes": 0,
+            "evictions": 0,
+            "evicted_bytes": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_bytes > 0
+
+    @staticmethod
+    def key_for(file_entry: dict) -> Optional[str]:
+        if file_entry.get("sha256"):
+            return f"sha256/{file_entry['sha256']}"
+        if file_entry.get("blob_id"):
+            return f"sha1/{file_entry['blob_id']}"
+        return None
+
+    def path_for(self, key: str) -> Path:
+        algo, digest = key.split("/", 1)
+        return self.root / algo / digest[:2] / digest
+
+    def load(self):
+        """Rebuild the index from disk, oldest first."""
+        if not self.enabled:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        found = []
+        for algo_dir in self.root.iterdir():
+            if not algo_dir.is_dir():
+                continue
+            for blob in algo_dir.glob("*/*"):
+                if blob.name.endswith(".tmp"):
+                    blob.unlink(missing_ok=True)
+                    continue
+                stat = blob.stat()
+                found.append((stat.st_mtime, f"{algo_dir.name}/{blob.name}", stat.st_size))
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+        print(f"Blob cache: {len(self.entries)} blobs, {self.total_bytes} bytes under {self.root}")
+        self.evict()
+
+    def pin(self, key: str):
+        self.pinned[key] = self.pinned.get(key, 0) + 1
+
+    def unpin(self, key: str):
+        remaining = self.pinned.get(key, 0) - 1
+        if remaining > 0:
+            self.pinned[key] = remaining
+        else:
+            self.pinned.pop(key, None)
+
+    def lookup(self, key: Optional[str]) -> Optional[Path]:
+        """Return the cached blob for ``key`` (marking it recently used), counting hit/miss."""
+        if not self.enabled or key is None:
+            return None
+        size = self.entries.get(key)
+        path = self.path_for(key)
+        if size is None or not path.exists():
+            if size is not None:
+                self.forget(key)
+            self.stats["misses"] += 1
+            return None
+
+        self.entries.move_to_end(key)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.stats["hits"] += 1
+        self.stats["hit_bytes"] += size
+        return path
+
+    def record_miss_bytes(self, size: Optional[int]):
+        self.stats["miss_bytes"] += size or 0
+
+    @classmethod
+    def materialize(cls, blob: Path, target: Path):
+        """Make ``target`` a copy of ``blob`` without copying data when the filesystem allows."""
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.unlink(missing_ok=True)
+        with open(blob, "rb") as source, open(target, "wb") as destination:
+            try:
+                fcntl.ioctl(destination.fileno(), cls.FICLONE, source.fileno())
+                return
+            except OSError:
+                pass
+        target.unlink()
+        try:
+            os.link(blob, target)
+        except OSError:
+            shutil.copyfile(blob, target)
+
+    def store(self, key: str, source: Path):
+        """Link a verified download into the cache (runs in a worker thread)."""
+        blob = self.path_for(key)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        temp_blob = blob.with_name(blob.name + ".tmp")
+        temp_blob.unlink(missing_ok=True)
+        try:
+            os.link(source, temp_blob)
+        except OSError:
+            shutil.copyfile(source, temp_blob)
+        os.replace(temp_blob, blob)
+
+    def add(self, key: str, size: int):
+        """Account for a blob written by ``store`` and evict down to the budget."""
+        if key in self.entries:
+            self.total_bytes -= self.entries[key]
+        self.entries[key] = size
+        self.entries.move_to_end(key)
+        self.total_bytes += size
+        self.evict()
+
+    def forget(self, key: str):
+        self.total_bytes -= self.entries.pop(key, 0)
+
+    def evict(self):
+        for key in list(self.entries):
+            if self.total_bytes <= self.budget_bytes:
+                break
+            if key in self.pinned:
+                continue
+            size = self.entries[key]
+            self.path_for(key).unlink(missing_ok=True)
+            self.forget(key)
+            self.stats["evictions"] += 1
+            self.stats["evicted_bytes"] += size
+
+    async def insert(self, key: Optional[str], source: Path, size: Optional[int]):
+        """Cache a freshly downloaded, verified file; failures never fail the download."""
+        if not self.enabled or key is None or not size or size > self.budget_bytes:
+            return
+        if key in self.entries:
+            return
+        try:
+            await asyncio.to_thread(self.store, key, source)
+            self.add(key, size)
+        except Exception as err:
+            print(f"Blob cache: failed to store {key}: {err}")
+
+    def status(self) -> dict:
+        requests = self.stats["hits"] + self.stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "blobs": len(self.entries),
+            "size_bytes": self.total_bytes,
+            "budget_bytes": self.budget_bytes,
+            "hit_rate": round(self.stats["hits"] / requests, 3) if requests else None,
+            **self.stats,
+        }
+
+class StagingDisk:
+    """Admission control for the staging disk (``LOCAL_DOWNLOAD_PATH``).
+
+    Before a job stages anything it reserves its estimated footprint. A reservation is
+    admitted when it fits in the free space minus ``floor_bytes`` minus what admitted
+    jobs have yet to write: their reservation less the bytes their ``ByteCounter`` has
+    seen, not counting bytes reported through ``freed`` (counted but never written, or
+    deleted again). Jobs that don't fit wait, highest priority first, until a
+    reservation is released or the GC frees space; a job that cannot fit even on an
+    otherwise idle disk fails instead of waiting forever.
+    """
+
+    def __init__(self, root: Path, floor_bytes: int, enabled: bool = True, poll_interval: float = 5.0):
+        self.root = root
+        self.floor_bytes = floor_bytes
+        self.enabled = enabled
+        self.poll_interval = poll_interval
+        self.reservations: dict = {}
+        self._waiters: list = []
+        self._sequence = itertools.count()
+        # Set by the server: True while deletions that will free space are queued
+        self.releasing: Callable[[], bool] = lambda: False
+
+    def usage(self):
+        return shutil.disk_usage(self.root)
+
+    @staticmethod
+    def written(reservation: dict) -> int:
+        counted = reservation["counter"].get() if reservation["counter"] else 0
+        return max(0, counted - reservation["freed"])
+
+    def outstanding(self) -> int:
+        """Bytes admitted jobs are still expected to write."""
+        return sum(
+            max(0, reservation["bytes"] - self.written(reservation)) for reservation in self.reservations.values()
+        )
+
+    def available(self) -> int:
+        return self.usage().free - self.floor_bytes - self.outstanding()
+
+    def admit(self):
+        """Admit waiters in priority order while the head of the line fits."""
+        while self._waiters:
+            _, _, key, amount, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self.available() < amount:
+                return
+            heapq.heappop(self._waiters)
+            self.reservations[key] = {"bytes": amount, "counter": None, "freed": 0, "admitted_at": time.time()}
+            future.set_result(None)
+
+    async def reserve(
+        self, key: str, amount: int, priority: int = 0, on_wait: Optional[Callable[[int, int], None]] = None
+    ):
+        """Wait until ``amount`` bytes can be set aside for ``key``; replaces an earlier reservation."""
+        self.reservations.pop(key, None)
+        if not self.enabled:
+            return
+        capacity = self.usage().total - self.floor_bytes
+        if amount > capacity:
+            raise Exception(
+                f"Staging needs {DownloadProxyServer.format_bytes(amount)} but the staging disk holds at most "
+                f"{DownloadProxyServer.format_bytes(max(0, capacity))} above the reserved free space"
+            )
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._sequence), key, amount, future))
+        self.admit()
+        try:
+            while not future.done():
+                available = self.available()
+                # Nothing admitted or being deleted will make room: waiting cannot help
+                if not self.reservations and not self.releasing() and self._waiters[0][4] is future:
+                    raise Exception(
+                        f"Not enough staging space: need {DownloadProxyServer.format_bytes(amount)}, "
+                        f"{DownloadProxyServer.format_bytes(max(0, available))} available"
+                    )
+                if on_wait is not None:
+                    on_wait(amount, max(0, available))
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), self.poll_interval)
+                except asyncio.TimeoutError:
+                    self.admit()
+        except BaseException:
+            if future.done() and not future.cancelled():
+                self.release(key)
+            else:
+                future.cancel()
+                self.admit()
+            raise
+
+    def fits(self, amount: int) -> bool:
+        """Whether ``amount`` would be admitted right now without waiting."""
+        return not self.enabled or (not self.waiting() and self.available() >= amount)
+
+    def track(self, key: str, counter: "ByteCounter"):
+        """Count bytes written through ``counter`` against ``key``'s reservation."""
+        reservation = self.reservations.get(key)
+        if reservation is not None:
+            reservation["counter"] = counter
+
+    def freed(self, key: str, amount: int):
+        """Report ``amount`` bytes on ``key``'s counter that take no staging space.
+
+        That covers resumed and cache-linked files, which the counter sees but nothing
+        writes, and files the job has already deleted.
+        """
+        reservation = self.reservations.get(key)
+        if reservation is not None and amount:
+            reservation["freed"] += amount
+            self.admit()
+
+    def release(self, key: str):
+        if self.reservations.pop(key, None) is not None:
+            self.admit()
+
+    def waiting(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter[4].done())
+
+    def status(self) -> dict:
+        usage = self.usage()
+        return {
+            "enabled": self.enabled,
+            "total_bytes": usage.total,
+            "free_bytes": usage.free,
+            "floor_bytes": self.floor_bytes,
+            "reserved_bytes": sum(reservation["bytes"] for reservation in self.reservations.values()),
+            "outstanding_bytes": self.outstanding(),
+            "reservations": {key: reservation["bytes"] for key, reservation in self.reservations.items()},
+            "waiting": [
+                {"key": key, "bytes": amount, "priority": -priority}
+                for priority, _, key, amount, future in sorted(self._waiters) if not future.done()
+            ],
+        }
+
+class StagingWindow:
+    """Byte budget for the files a pipelined job holds on the staging disk at once.
+
+    ``acquire`` waits until a file fits next to those not uploaded yet (a file larger
+    than the whole window goes through alone) and ``release`` returns its bytes once
+    the upload has deleted it, so the job never stages more than ``limit``.
+    """
+
+    def __init__(self, limit: int = 0):
+        self.limit = limit
+        self.held = 0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self, amount: int):
+        async with self._changed:
+            await self._changed.wait_for(lambda: not self.held or self.held + amount <= self.limit)
+            self.held += amount
+
+    async def release(self, amount: int):
+        async with self._changed:
+            self.held -= amount
+            self._changed.notify_all()
+
+class StagingGC:
+    """Deletes staging trees on a background worker instead of ``rmtree`` on the event loop.
+
+    ``discard`` renames the tree into ``trash_dir`` (instant on the same filesystem), so
+    its path is free for the next job right away, and queues it. The worker sizes each
+    tree, then unlinks it file by file in a thread, keeping byte and file counts for
+    ``status``; ``on_progress`` is called on the loop as space is freed. Trees left in
+    ``trash_dir`` by a previous run are picked up again on start.
+    """
+
+    PROGRESS_BYTES = 1024 ** 3
+
+    def __init__(self, trash_dir: Path, on_progress: Callable[[], None]):
+        self.trash_dir = trash_dir
+        self.on_progress = on_progress
+        self.items: List[dict] = []
+        self.stats = {"deleted_trees": 0, "deleted_bytes": 0, "deleted_files": 0, "errors": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self.trash_dir.mkdir(parents=True, exist_ok=True)
+        for leftover in sorted(self.trash_dir.iterdir()):
+            self.enqueue(leftover, "leftover")
+        self._worker = asyncio.create_task(self.work())
+
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+
+    def busy(self) -> bool:
+        return bool(self.items)
+
+    def discard(self, path, reason: str = "cleanup") -> bool:
+        """Move ``path`` out of the way and queue it for deletion; False if it doesn't exist."""
+        path = Path(path)
+        if not path.exists():
+            return False
+        target = self.trash_dir / f"{path.name}-{uuid.uuid4().hex[:8]}"
+        try:
+            self.trash_dir.mkdir(parents=True, exist_ok=True)
+            os.rename(path, target)
+        except OSError:
+            # Another filesystem: delete in place, the path stays taken until then
+            target = path
+        self.enqueue(target, reason)
+        return True
+
+    def enqueue(self, path: Path, reason: str):
+        item = {
+            "path": str(path),
+            "reason": reason,
+            "queued_at": time.time(),
+            "started_at": None,
+            "total_bytes": None,
+            "total_files": None,
+            "deleted_bytes": 0,
+            "deleted_files": 0,
+        }
+        self.items.append(item)
+        self._queue.put_nowait(item)
+
+    async def work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            item["started_at"] = time.time()
+            try:
+                await asyncio.to_thread(self.delete_tree, item, loop)
+                self.stats["deleted_trees"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Warning: Failed to delete {item['path']}: {e}")
+            finally:
+                self.items.remove(item)
+                self.on_progress()
+
+    def delete_tree(self, item: dict, loop: asyncio.AbstractEventLoop):
+        root = Path(item["path"])
+        if not root.is_dir() or root.is_symlink():
+            item["total_bytes"], item["total_files"] = (root.lstat().st_size, 1) if root.exists() else (0, 0)
+            root.unlink(missing_ok=True)
+            return
+
+        total_bytes = total_files = 0
+        for directory, _, names in os.walk(root):
+            for name in names:
+                try:
+                    total_bytes += os.lstat(os.path.join(directory, name)).st_size
+                    total_files += 1
+                except OSError:
+                    pass
+        item["total_bytes"], item["total_files"] = total_bytes, total_files
+
+        since_progress = 0
+        for directory, subdirectories, names in os.walk(root, topdown=False):
+            for name in names:
+                file_path = os.path.join(directory, name)
+                try:
+                    size = os.lstat(file_path).st_size
+                    os.unlink(file_path)
+                except FileNotFoundError:
+                    continue
+                item["deleted_bytes"] += size
+                item["deleted_files"] += 1
+                self.stats["deleted_bytes"] += size
+                self.stats["deleted_files"] += 1
+                since_progress += size
+                if since_progress >= self.PROGRESS_BYTES:
+                    since_progress = 0
+                    loop.call_soon_threadsafe(self.on_progress)
+            for name in subdirectories:
+                subdirectory = os.path.join(directory, name)
+                if os.path.islink(subdirectory):
+                    os.unlink(subdirectory)
+                else:
+                    os.rmdir(subdirectory)
+        os.rmdir(root)
+
+    def status(self) -> dict:
+        return {
+            "queued": len(self.items),
+            "pending_bytes": sum(
+                item["total_bytes"] - item["deleted_bytes"] for item in self.items if item["total_bytes"] is not None
+            ),
+            "items": [
+                {
+                    **item,
+                    "percent": int(item["deleted_bytes"] * 100 / item["total_bytes"]) if item["total_bytes"] else None,
+                }
+                for item in self.items
+            ],
+            **self.stats,
+        }
+
+class RemoteHashIndex:
+    """Maps content keys (see ``BlobCache.key_for``) to files already delivered remotely.
+
+    Paths are relative to ``SUPERCOMPUTER_PATH``. The index only records what this proxy
+    has delivered, so entries can go stale when remote files are removed. Callers check
+    the remote size before relying on an entry and ``forget`` it when that check fails.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: dict = {}
+        self._dirty = False
+
+    def load(self):
+        try:
+            if self.path.exists():
+                with open(self.path, "r") as f:
+                    self.entries = json.load(f)
+        except Exception as e:
+            print(f"Failed to load remote hash index: {e}")
+
+    def lookup(self, key: Optional[str]) -> Optional[str]:
+        return self.entries.get(key) if key else None
+
+    def record(self, key: Optional[str], remote_path: str):
+        if key and self.entries.get(key) != remote_path:
+            self.entries[key] = remote_path
+            self._dirty = True
+
+    def forget(self, key: str):
+        if self.entries.pop(key, None) is not None:
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        temp_path = self.path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.path)
+
+class RevisionLedger:
+    """Commit sha and file list last delivered to each ``author/repo`` on the supercomputer.
+
+    Files are stored as ``path -> [content key, size]`` (see ``BlobCache.key_for``), which
+    is what a sync needs to diff the delivered revision against a new Hub head without
+    touching the remote tree. Files a narrower sync left alone keep the key they were
+    delivered with, so the next sync that selects them sees whether they changed.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: dict = {}
+        self._dirty = False
+
+    def load(self):
+        try:
+            if self.path.exists():
+                with open(self.path, "r") as f:
+                    self.entries = json.load(f)
+        except Exception as e:
+            print(f"Failed to load revision ledger: {e}")
+
+    def lookup(self, repo_key: str) -> Optional[dict]:
+        return self.entries.get(repo_key)
+
+    def record(
+        self, repo_key: str, sha: str, files: List[dict], selection: Optional[dict], kept: Optional[dict] = None
+    ):
+        delivered = dict(kept or {})
+        delivered.update((entry["path"], [BlobCache.key_for(entry), entry["size"]]) for entry in files)
+        self.entries[repo_key] = {
+            "sha": sha,
+            "selection": selection,
+            "delivered_at": time.time(),
+            "files": delivered,
+        }
+        self._dirty = True
+
+    def forget(self, repo_key: str):
+        if self.entries.pop(repo_key, None) is not None:
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        temp_path = self.path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.path)
+
+class HubMetadataCache:
+    """Hub file lists (path, size, LFS sha256, blob id) persisted per repo and commit sha.
+
+    A commit's file list never changes, so ``root/<author>/<repo>/<sha>.json`` is valid
+    forever; only the repo's head (and any other branch or tag, ``ref``) moves. Callers
+    revalidate the head with a cheap sha-only request and reuse the stored list while it
+    still matches. Each repo keeps its ``MAX_REVISIONS`` most recently used revisions.
+    """
+
+    MAX_REVISIONS = 4
+
+    def __init__(self, root: Path, ttl: float):
+        self.root = root
+        self.ttl = ttl
+        self.heads: dict = {}
+        self.revisions: dict = {}
+        self.stats = {
+            "hits": 0,
+            "revalidations": 0,
+            "fetches": 0,
+            "stale_hits": 0,
+        }
+
+    def path_for(self, repo_id: str, sha: str) -> Path:
+        return self.root / repo_id / f"{sha}.json"
+
+    def head_path(self, repo_id: str, ref: Optional[str] = None) -> Path:
+        return self.root / repo_id / (f"HEAD@{urllib.parse.quote(ref, safe='')}" if ref else "HEAD")
+
+    def head(self, repo_id: str, max_age: Optional[float] = None, ref: Optional[str] = None) -> Optional[str]:
+        """Last known sha of ``ref`` (default branch when None), or None when unknown or
+        older than ``max_age`` seconds."""
+        entry = self.heads.get((repo_id, ref))
+        if entry is None:
+            # A head recorded before a restart is known but never fresh
+            try:
+                entry = (self.head_path(repo_id, ref).read_text().strip(), float("-inf"))
+            except OSError:
+                return None
+            self.heads[(repo_id, ref)] = entry
+        sha, checked_at = entry
+        if max_age is not None and time.monotonic() - checked_at > max_age:
+            return None
+        return sha
+
+    def set_head(self, repo_id: str, sha: str, ref: Optional[str] = None):
+        previous = self.heads.get((repo_id, ref))
+        self.heads[(repo_id, ref)] = (sha, time.monotonic())
+        if previous is None or previous[0] != sha:
+            head_path = self.head_path(repo_id, ref)
+            head_path.parent.mkdir(parents=True, exist_ok=True)
+            head_path.write_text(sha)
+
+    def get(self, repo_id: str, sha: str) -> Optional[dict]:
+        key = (repo_id, sha)
+        metadata = self.revisions.get(key)
+        if metadata is not None:
+            return metadata
+        path = self.path_for(repo_id, sha)
+        try:
+            with open(path, "r") as f:
+                metadata = json.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Discarding unreadable Hub metadata cache entry {path}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        self.revisions[key] = metadata
+        return metadata
+
+    def put(self, repo_id: str, metadata: dict):
+        sha = metadata["sha"]
+        self.revisions[(repo_id, sha)] = metadata
+        path = self.path_for(repo_id, sha)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            json.dump(metadata, f)
+        os.replace(temp_path, path)
+
+        stored = sorted(path.parent.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for old in stored[self.MAX_REVISIONS:]:
+            self.revisions.pop((repo_id, old.stem), None)
+            old.unlink(missing_ok=True)
+
+    def forget(self, repo_id: str, ref: Optional[str] = None):
+        self.heads.pop((repo_id, ref), None)
+        self.head_path(repo_id, ref).unlink(missing_ok=True)
+
+    def status(self) -> dict:
+        return {
+            "repos": len({repo_id for repo_id, _ in self.heads}),
+            "revisions": len(self.revisions),
+            "ttl": self.ttl,
+            **self.stats,
+        }
+
+class JobManifest:
+    """Checkpoint of one repo's transfer, used to resume after a crash or a failed attempt.
+
+    Records the job parameters, the Hub revision, and for each file the byte offset
+    reached in every range plus whether it is fully downloaded and verified remotely.
+    Workers advance offsets in memory; ``save`` fsyncs the partial files it covers
+    before it writes the manifest, so a recorded offset never runs ahead of the data on disk.
+    """
+
+    def __init__(self, path: Path, data: Optional[dict] = None):
+        self.path = path
+        self.data = data or {"job": {}, "state": "active", "attempts": 0, "revision": None, "files": {}}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._deleted = False
+        self._dirty = True
+        self._unsynced: set = set()
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["JobManifest"]:
+        try:
+            with open(path, "r") as f:
+                return cls(path, json.load(f))
+        except Exception as e:
+            print(f"Failed to load job manifest {path.name}: {e}")
+            return None
+
+    def begin(self, job: dict):
+        with self._lock:
+            self.data["job"] = {
+                key: job[key] for key in (
+                    "id", "author", "repo_name", "mode", "selection", "priority", "rate_limits",
+                    "upload_streams", "sync", "revision", "compression"
+                )
+            }
+            self.data["state"] = "active"
+            self.data["attempts"] += 1
+            self._dirty = True
+
+    def set_state(self, state: str):
+        with self._lock:
+            self.data["state"] = state
+            self._dirty = True
+
+    def bind_revision(self, revision: str) -> bool:
+        """Pin the manifest to ``revision``; returns False (and forgets file progress) if it moved."""
+        with self._lock:
+            if self.data["revision"] == revision:
+                return True
+            self.data["revision"] = revision
+            self.data["files"] = {}
+            self._dirty = True
+            return False
+
+    def file_state(self, path: str) -> dict:
+        with self._lock:
+            return dict(self.data["files"].get(path, {}))
+
+    def start_file(self, path: str, size: Optional[int], chunk_size: int):
+        with self._lock:
+            self.data["files"][path] = {"size": size, "chunk": chunk_size, "ranges": {}}
+            self._dirty = True
+
+    def advance(self, path: str, start: int, offset: int, temp_path: Path):
+        """Record that the range beginning at ``start`` is complete up to ``offset`` (thread-safe)."""
+        with self._lock:
+            state = self.data["files"].get(path)
+            if state is None:
+                return
+            state["ranges"][str(start)] = offset
+            self._unsynced.add(temp_path)
+            self._dirty = True
+
+    def mark(self, path: str, flag: str):
+        """Set ``downloaded`` or ``uploaded`` for a file."""
+        with self._lock:
+            self.data["files"].setdefault(path, {})[flag] = True
+            self._dirty = True
+
+    def paths_with(self, flag: str) -> set:
+        with self._lock:
+            return {path for path, state in self.data["files"].items() if state.get(flag)}
+
+    def save(self):
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty or self._deleted:
+                    return
+                unsynced, self._unsynced = self._unsynced, set()
+                data = json.dumps(self.data)
+                self._dirty = False
+
+            for temp_path in unsynced:
+                try:
+                    fd = os.open(temp_path, os.O_RDONLY)
+                except OSError:
+                    continue
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+            temp_manifest = self.path.with_suffix(".tmp")
+            with open(temp_manifest, "w") as f:
+                f.write(data)
+            os.replace(temp_manifest, self.path)
+
+    def delete(self):
+        with self._save_lock:
+            self._deleted = True
+            self.path.unlink(missing_ok=True)
+
+class JobTimeline:
+    """Timed spans of one job's phases, steps, files and ranges, for /jobs/{id}/timeline.
+
+    The running job's timeline lives in a context variable, so code anywhere under the
+    job's task records into it with ``JobTimeline.span`` (a no-op outside a job). Spans
+    are laid out on lanes: nested spans in the same task share a lane and concurrent
+    tasks take the lowest free one, which keeps the Chrome trace compact.
+    """
+
+    current: contextvars.ContextVar = contextvars.ContextVar("job_timeline", default=None)
+    lane: contextvars.ContextVar = contextvars.ContextVar("job_timeline_lane", default=None)
+    MAX_SPANS = 50000
+
+    def __init__(self, job_id: str, key: str, created_at: float):
+        self.job_id = job_id
+        self.key = key
+        self.created_at = created_at
+        self._origin = time.monotonic() - (time.time() - created_at)
+        self.finished_at: Optional[float] = None
+        self.spans: List[dict] = []
+        self.open_spans: dict = {}
+        self.dropped = 0
+        self._free_lanes: list = []
+        self._lane_count = 0
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        """Seconds since the job was created."""
+        return time.monotonic() - self._origin
+
+    def acquire_lane(self) -> int:
+        with self._lock:
+            if self._free_lanes:
+                return heapq.heappop(self._free_lanes)
+            self._lane_count += 1
+            return self._lane_count - 1
+
+    def release_lane(self, lane: int):
+        with self._lock:
+            heapq.heappush(self._free_lanes, lane)
+
+    def add(self, name: str, category: str, start: float, end: float, lane: int = 0, args: Optional[dict] = None):
+        with self._lock:
+            if len(self.spans) >= self.MAX_SPANS:
+                self.dropped += 1
+                return
+            self.spans.append({
+                "name": name, "category": category, "start": round(start, 6),
+                "duration": round(end - start, 6), "lane": lane, "args": args or {},
+            })
+
+    @classmethod
+    @contextmanager
+    def span(cls, name: str, category: str = "step", **args):
+        timeline = cls.current.get()
+        if timeline is None:
+            yield
+            return
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        owner = cls.lane.get()
+        token = None
+        if owner is not None and owner[0] is task:
+            lane = owner[1]
+        else:
+            lane = timeline.acquire_lane()
+            token = cls.lane.set((task, lane))
+
+        span_id = next(timeline._ids)
+        start = timeline.now()
+        timeline.open_spans[span_id] = {"name": name, "category": category, "start": start, "lane": lane, "args": args}
+        try:
+            yield
+        except BaseException as e:
+            args["error"] = "cancelled" if isinstance(e, asyncio.CancelledError) else str(e)[:200]
+            raise
+        finally:
+            timeline.open_spans.pop(span_id, None)
+            timeline.add(name, category, start, timeline.now(), lane, args)
+            if token is not None:
+                cls.lane.reset(token)
+                timeline.release_lane(lane)
+
+    @classmethod
+    async def trace(cls, awaitable: Awaitable, name: str, category: str = "step", **args):
+        """Await ``awaitable`` inside a span."""
+        with cls.span(name, category, **args):
+            return await awaitable
+
+    def snapshot(self) -> List[dict]:
+        """Finished spans plus the ones still open (``open``, duration so far)."""
+        now = self.now()
+        with self._lock:
+            spans = list(self.spans)
+        for span in list(self.open_spans.values()):
+            spans.append({
+                "name": span["name"], "category": span["category"], "start": round(span["start"], 6),
+                "duration": round(now - span["start"], 6), "lane": span["lane"], "args": span["args"],
+                "open": True,
+            })
+        spans.sort(key=lambda span: (span["start"], span["lane"]))
+        return spans
+
+    @staticmethod
+    def summarize(spans: List[dict], top: int = 5) -> dict:
+        """Time per phase, idle gaps inside the job and the slowest file downloads and uploads."""
+        job = next((span for span in spans if span["category"] == "phase" and span["name"] == "job"), None)
+        end = max((span["start"] + span["duration"] for span in spans), default=0.0)
+        phases: dict = {}
+        for span in spans:
+            if span["category"] == "phase":
+                phases[span["name"]] = round(phases.get(span["name"], 0.0) + span["duration"], 6)
+
+        # Idle: time inside the job span where nothing but waiting was going on
+        gaps = []
+        if job is not None:
+            cursor = job["start"]
+            job_end = job["start"] + job["duration"]
+            for span in spans:
+                if span is job or span["category"] == "wait":
+                    continue
+                if span["start"] > cursor:
+                    gaps.append({"start": round(cursor, 6), "duration": round(span["start"] - cursor, 6)})
+                cursor = max(cursor, span["start"] + span["duration"])
+            if job_end > cursor:
+                gaps.append({"start": round(cursor, 6), "duration": round(job_end - cursor, 6)})
+
+        def slowest(category: str) -> List[dict]:
+            ranked = sorted((span for span in spans if span["category"] == category), key=lambda span: -span["duration"])
+            return [{"path": span["name"], "duration": span["duration"], **span["args"]} for span in ranked[:top]]
+
+        return {
+            "wall_seconds": round(end, 6),
+            "queued_seconds": next(
+                (span["duration"] for span in spans if span["category"] == "wait" and span["name"] == "queued"), 0.0
+            ),
+            "phase_seconds": phases,
+            "idle_seconds": round(sum(gap["duration"] for gap in gaps), 6),
+            "idle_gaps": sorted(gaps, key=lambda gap: -gap["duration"])[:top],
+            "slowest_downloads": slowest("download"),
+            "slowest_uploads": slowest("upload"),
+        }
+
+    def to_dict(self) -> dict:
+        spans = self.snapshot()
+        return {
+            "job_id": self.job_id,
+            "key": self.key,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "dropped_spans": self.dropped,
+            "summary": self.summarize(spans),
+            "spans": spans,
+        }
+
+    @staticmethod
+    def chrome_trace(data: dict) -> dict:
+        """Chrome trace-event form of ``to_dict`` output (chrome://tracing, Perfetto)."""
+        origin = data["created_at"] * 1_000_000
+        events = [{
+            "name": "process_name", "ph": "M", "pid": 1, "tid": 0,
+            "args": {"name": f"{data['key']} (job {data['job_id']})"},
+        }]
+        for lane in sorted({span["lane"] for span in data["spans"]}):
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": lane, "args": {"name": f"lane {lane}"}})
+        for span in data["spans"]:
+            events.append({
+                "name": span["name"],
+                "cat": span["category"],
+                "ph": "X",
+                "ts": round(origin + span["start"] * 1_000_000),
+                "dur": round(span["duration"] * 1_000_000),
+                "pid": 1,
+                "tid": span["lane"],
+                "args": {**span["args"], **({"open": True} if span.get("open") else {})},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"job_id": data["job_id"]}}
+
+class MetricsRegistry:
+    """Counters and histograms exposed in the Prometheus text format on ``/metrics``.
+
+    Recording is a dict update under a lock, cheap enough to leave on. Gauges that mirror
+    state the server already keeps (jobs, slots, pools, caches) are not recorded at all;
+    they are read at scrape time and passed to ``render``.
+    """
+
+    PREFIX = "hf_proxy"
+    DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+    def __init__(self):
+        self.descriptions: dict = {}
+        self.counters: dict = {}
+        self.histograms: dict = {}
+        self.active_phases: dict = {}
+        self._lock = threading.Lock()
+        self.describe("phase_duration_seconds", "histogram", "Wall-clock duration of each job phase")
+        self.describe("phase_errors_total", "counter", "Phase runs that ended in an error")
+        self.describe("jobs_finished_total", "counter", "Jobs finished, by outcome")
+
+    def describe(self, name: str, kind: str, text: str):
+        self.descriptions[name] = (kind, text)
+
+    @staticmethod
+    def label_key(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name: str, amount: float = 1.0, **labels):
+        key = (name, self.label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, self.label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    "buckets": [0] * len(self.DURATION_BUCKETS), "sum": 0.0, "count": 0
+                }
+            index = bisect.bisect_left(self.DURATION_BUCKETS, value)
+            if index < len(self.DURATION_BUCKETS):
+                histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    @contextmanager
+    def phase(self, phase: str):
+        """Time a block as one run of ``phase``; an exception also counts as a phase error.
+
+        The run is also recorded as a span on the current job's timeline.
+        """
+        started = time.monotonic()
+        with self._lock:
+            self.active_phases[phase] = self.active_phases.get(phase, 0) + 1
+        try:
+            with JobTimeline.span(phase, "phase"):
+                yield
+        except BaseException as e:
+            if not isinstance(e, asyncio.CancelledError):
+                self.inc("phase_errors_total", phase=phase)
+            raise
+        finally:
+            with self._lock:
+                self.active_phases[phase] -= 1
+            self.observe("phase_duration_seconds", time.monotonic() - started, phase=phase)
+
+    @staticmethod
+    def format_labels(labels) -> str:
+        if not labels:
+            return ""
+        pairs = []
+        for name, value in labels:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            pairs.append(f'{name}="{value}"')
+        return "{" + ",".join(pairs) + "}"
+
+    @staticmethod
+    def format_value(value: float) -> str:
+        if value == math.inf:
+            return "+Inf"
+        return repr(float(value)) if value != int(value) else str(int(value))
+
+    def render(self, gauges: List[tuple]) -> str:
+        """Exposition text for the recorded metrics plus ``gauges`` samples.
+
+        Each gauge sample is ``(name, kind, help, labels dict, value)``.
+        """
+        families: dict = {}
+        for name, kind, text, labels, value in gauges:
+            self.describe(name, kind, text)
+            families.setdefault(name, []).append((self.label_key(labels), value))
+        with self._lock:
+            for (name, labels), value in self.counters.items():
+                families.setdefault(name, []).append((labels, value))
+            histograms = {
+                key: {"buckets": list(value["buckets"]), "sum": value["sum"], "count": value["count"]}
+                for key, value in self.histograms.items()
+            }
+            families.setdefault("phase_active", []).extend(
+                ((("phase", phase),), count) for phase, count in self.active_phases.items()
+            )
+        self.describe("phase_active", "gauge", "Phase runs in progress")
+        for (name, labels), _ in histograms.items():
+            families.setdefault(name, [])
+
+        lines = []
+        for name in sorted(families):
+            kind, text = self.descriptions.get(name, ("untyped", name))
+            full_name = f"{self.PREFIX}_{name}"
+            lines.append(f"# HELP {full_name} {text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            if kind == "histogram":
+                for (hist_name, labels), histogram in sorted(histograms.items()):
+                    if hist_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.DURATION_BUCKETS, histogram["buckets"]):
+                        cumulative += count
+                        bucket_labels = labels + (("le", self.format_value(bound)),)
+                        lines.append(f"{full_name}_bucket{self.format_labels(bucket_labels)} {cumulative}")
+                    lines.append(f"{full_name}_bucket{self.format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+                    lines.append(f"{full_name}_sum{self.format_labels(labels)} {self.format_value(histogram['sum'])}")
+                    lines.append(f"{full_name}_count{self.format_labels(labels)} {histogram['count']}")
+                continue
+            for labels, value in sorted(families[name]):
+                lines.append(f"{full_name}{self.format_labels(labels)} {self.format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+class DownloadProxyServer:
+    def __init__(self):
+        self.local_download_path = Path(os.getenv("LOCAL_DOWNLOAD_PATH", "/tmp/huggingface_downloads"))
+        self.supercomputer_host = os.getenv("SUPERCOMPUTER_HOST")
+        self.supercomputer_user = os.getenv("SUPERCOMPUTER_USER")
+        self.supercomputer_path = os.getenv("SUPERCOMPUTER_PATH")
+        self.hf_token = os.getenv("HUGGINGFACE_TOKEN")
+        self.hf_endpoint = os.getenv("HUGGINGFACE_ENDPOINT", "https://huggingface.co").rstrip("/")
+        self.hf_api = HfApi(endpoint=self.hf_endpoint, token=self.hf_token)
+
+        # Parallel HTTP download engine settings
+        self.download_workers = max(1, int(os.getenv("DOWNLOAD_WORKERS", 8)))
+        self.range_chunk_size = max(1, int(os.getenv("DOWNLOAD_RANGE_CHUNK_MB", 64))) * 1024 * 1024
+        self.download_retries = max(0, int(os.getenv("DOWNLOAD_RETRIES", 3)))
+        self.download_timeout = float(os.getenv("DOWNLOAD_TIMEOUT", 60))
+        self.download_executor = ThreadPoolExecutor(
+            max_workers=self.download_workers,
+            thread_name_prefix="hf-download"
+        )
+        # Admission to the worker pool by job priority (the executor's own queue is FIFO)
+        self.range_slots = PrioritySlots(self.download_workers)
+        self.hub_opener = urllib.request.build_opener(HubRedirectHandler())
+
+        # Hub file lists keyed by commit sha; the head is re-checked at most every HUB_METADATA_TTL
+        self.hub_metadata = HubMetadataCache(
+            self.local_download_path / ".hub_metadata",
+            ttl=float(os.getenv("HUB_METADATA_TTL", 60))
+        )
+        self._metadata_fetches: dict = {}
+
+        # "staged" downloads everything then runs scp; "pipelined" uploads each file as soon as it lands
+        self.transfer_mode = os.getenv("TRANSFER_MODE", "staged")
+
+        # "all" keeps every file; "prefer_safetensors" drops weight formats duplicated by safetensors
+        self.format_policy = os.getenv("FORMAT_POLICY", "all")
+
+        # Zero-staging relay: memory is bounded by RELAY_BUFFER_COUNT * RELAY_BUFFER_MB
+        self.relay_buffer_size = max(1, int(os.getenv("RELAY_BUFFER_MB", 4))) * 1024 * 1024
+        self.relay_buffer_count = max(2, int(os.getenv("RELAY_BUFFER_COUNT", 32)))
+
+        # Create local download directory if it doesn't exist
+        self.local_download_path.mkdir(parents=True, exist_ok=True)
+
+        # Content-addressed cache of downloaded files, LRU-evicted to BLOB_CACHE_GB (0 disables)
+        self.blob_cache = BlobCache(
+            self.local_download_path / ".blob_cache",
+            budget_bytes=int(float(os.getenv("BLOB_CACHE_GB", 20)) * 1024 ** 3)
+        )
+
+        # Content key -> file already delivered under SUPERCOMPUTER_PATH, for remote-side linking
+        self.remote_dedup = os.getenv("REMOTE_DEDUP", "true").lower() not in ("0", "false", "no")
+
+        # Check remote copies against the Hub oids (inline for pipelined, a parallel pass otherwise)
+        self.verify_remote = os.getenv("VERIFY_REMOTE", "true").lower() not in ("0", "false", "no")
+        self.verify_parallelism = max(1, int(os.getenv("VERIFY_PARALLELISM", 4)))
+        self.remote_hash_index = RemoteHashIndex(self.local_download_path / "remote_hash_index.json")
+
+        # Revision and file list delivered to each remote repo directory, diffed by sync jobs
+        self.revision_ledger = RevisionLedger(self.local_download_path / "delivered_revisions.json")
+
+        # Persistent multiplexed SSH connections reused by all remote commands and transfers
+        self.ssh_destination = f"{self.supercomputer_user}@{self.supercomputer_host}"
+        self.ssh_pool = SSHConnectionPool(
+            self.ssh_destination,
+            size=max(0, int(os.getenv("SSH_POOL_SIZE", 2))),
+            control_dir=Path(os.getenv("SSH_CONTROL_DIR", "~/.ssh/hf-proxy-cm")).expanduser(),
+            health_interval=float(os.getenv("SSH_HEALTH_INTERVAL", 30))
+        )
+
+        # Staged uploads fan out over UPLOAD_STREAMS dedicated connections (separate TCP streams);
+        # files above UPLOAD_SPLIT_MB are sent as parallel ranges of that size
+        self.upload_streams = max(1, int(os.getenv("UPLOAD_STREAMS", 4)))
+        self.upload_split_size = max(1, int(os.getenv("UPLOAD_SPLIT_MB", 256))) * 1024 * 1024
+        # files below UPLOAD_BATCH_MB share one tar stream per connection instead of an ssh each
+        self.upload_batch_size = int(float(os.getenv("UPLOAD_BATCH_MB", 8)) * 1024 * 1024)
+        self.upload_pool = SSHConnectionPool(
+            self.ssh_destination,
+            size=self.upload_streams if self.ssh_pool.size and self.upload_streams > 1 else 0,
+            control_dir=self.ssh_pool.control_dir,
+            health_interval=self.ssh_pool.health_interval,
+            name="up"
+        )
+
+        # "auto" zstd-compresses compressible files on the upload wire (needs zstandard locally
+        # and the zstd CLI on the supercomputer); "off" sends everything raw
+        self.upload_compression = os.getenv("UPLOAD_COMPRESSION", "off").lower()
+        self.wire_compression = WireCompression(
+            level=int(os.getenv("UPLOAD_COMPRESSION_LEVEL", 3)),
+            min_size=max(0, int(os.getenv("UPLOAD_COMPRESSION_MIN_KB", 64))) * 1024,
+            entropy_threshold=float(os.getenv("UPLOAD_COMPRESSION_ENTROPY", 7.0))
+        )
+        if self.upload_compression == "auto" and not self.wire_compression.available:
+            print("UPLOAD_COMPRESSION=auto needs the zstandard package; uploads stay uncompressed")
+
+        # Per-job upload meters, published every UPLOAD_STATS_INTERVAL seconds with an
+        # EWMA-smoothed rate (UPLOAD_STATS_SMOOTHING is the weight of the newest sample)
+        self.upload_meters: dict = {}
+        self.upload_stats_interval = max(0.05, float(os.getenv("UPLOAD_STATS_INTERVAL", 0.25)))
+        self.upload_stats_smoothing = min(1.0, max(0.01, float(os.getenv("UPLOAD_STATS_SMOOTHING", 0.3))))
+
+        # Cached listing of SUPERCOMPUTER_PATH used by /status and the pre-download check
+        self.remote_inventory = RemoteInventory(self, ttl=float(os.getenv("REMOTE_INVENTORY_TTL", 60)))
+
+        # Progress tracking: snapshot + journal, flushed in batches off the update path
+        self.progress_store = ProgressStore(
+            self.local_download_path / "download_progress.json",
+            self.local_download_path / "download_progress.journal",
+            flush_interval=float(os.getenv("PROGRESS_FLUSH_INTERVAL", 0.5)),
+            compact_threshold=int(os.getenv("PROGRESS_COMPACT_THRESHOLD", 2000))
+        )
+        self.download_progress = self.progress_store.entries
+
+        # Push channel for /events subscribers, fed by the same path as update_progress
+        self.progress_broker = ProgressBroker(min_interval=float(os.getenv("EVENTS_MIN_INTERVAL", 0.25)))
+        self.progress_store.on_change = self.progress_broker.publish
+
+        # Job queue: one job per repo at a time, bounded globally and per phase
+        self.jobs: dict = {}
+        self.batches: dict = {}
+        self.active_jobs: dict = {}
+        self.job_tasks: set = set()
+        self.job_retention = float(os.getenv("JOB_RETENTION", 3600))
+        self.job_slots = PrioritySlots(max(1, int(os.getenv("MAX_CONCURRENT_JOBS", 4))))
+        self.download_slots = PrioritySlots(max(1, int(os.getenv("MAX_CONCURRENT_DOWNLOADS", 2))))
+        self.upload_slots = PrioritySlots(max(1, int(os.getenv("MAX_CONCURRENT_UPLOADS", 2))))
+
+        # Phase timings and error counts for /metrics
+        self.metrics = MetricsRegistry()
+        # How late a LOOP_LAG_INTERVAL timer fires: blocking work on the event loop shows up here
+        self.loop_lag_interval = max(0.01, float(os.getenv("LOOP_LAG_INTERVAL", 0.1)))
+        self.loop_lag: deque = deque(maxlen=600)
+        self._loop_lag_task: Optional[asyncio.Task] = None
+
+        # Per-job span timelines for /jobs/{id}/timeline; finished ones are also kept on disk
+        self.timelines: dict = {}
+        self.timeline_retention = max(0, int(os.getenv("TIMELINE_RETENTION", 500)))
+
+        # Bandwidth shaping: global and per-job MB/s caps (0 = unlimited) plus time-of-day windows
+        self.bandwidth = BandwidthGovernor(
+            limits={
+                "download": BandwidthGovernor.mb_to_rate(float(os.getenv("DOWNLOAD_RATE_LIMIT_MB", 0))),
+                "upload": BandwidthGovernor.mb_to_rate(float(os.getenv("UPLOAD_RATE_LIMIT_MB", 0))),
+            },
+            job_limits={
+                "download": BandwidthGovernor.mb_to_rate(float(os.getenv("JOB_DOWNLOAD_RATE_LIMIT_MB", 0))),
+                "upload": BandwidthGovernor.mb_to_rate(float(os.getenv("JOB_UPLOAD_RATE_LIMIT_MB", 0))),
+            },
+            schedule=os.getenv("BANDWIDTH_SCHEDULE", "")
+        )
+
+        # Per-repo resume checkpoints (one manifest per unfinished job), saved every CHECKPOINT_INTERVAL
+        self.manifest_dir = self.local_download_path / ".jobs"
+        self.manifest_dir.mkdir(parents=True, exist_ok=True)
+        self.timeline_dir = self.local_download_path / ".timelines"
+        self.timeline_dir.mkdir(parents=True, exist_ok=True)
+
+        # Staging disk: jobs reserve their estimated footprint before staging, keeping
+        # STAGING_RESERVE_GB free; deletions run on a background worker
+        self.staging_disk = StagingDisk(
+            self.local_download_path,
+            floor_bytes=int(float(os.getenv("STAGING_RESERVE_GB", 5)) * 1024 ** 3),
+            enabled=os.getenv("STAGING_ADMISSION", "true").lower() not in ("0", "false", "no"),
+            poll_interval=float(os.getenv("STAGING_POLL_INTERVAL", 5))
+        )
+        self.staging_gc = StagingGC(self.local_download_path / ".trash", self.staging_disk.admit)
+        self.staging_disk.releasing = self.staging_gc.busy
+        self.manifests: dict = {}
+        self.checkpoint_interval = float(os.getenv("CHECKPOINT_INTERVAL", 2))
+        self._checkpoint_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start background services (called from the app lifespan)."""
+        await asyncio.to_thread(self.blob_cache.load)
+        self.remote_hash_index.load()
+        self.revision_ledger.load()
+        self.progress_store.start()
+        self.staging_gc.start()
+        await self.ssh_pool.start()
+        await self.upload_pool.start()
+        self.remote_inventory.start()
+        self.bandwidth.start()
+        self.resume_unfinished_jobs()
+        self._checkpoint_task = asyncio.create_task(self.checkpoint_loop())
+        self._loop_lag_task = asyncio.create_task(self.monitor_loop_lag())
+
+    async def stop(self):
+        # Interrupted jobs keep their manifests in the "active" state and resume on next start
+        for task in list(self.job_tasks):
+            task.cancel()
+        await asyncio.gather(*self.job_tasks, return_exceptions=True)
+        if self._checkpoint_task:
+            self._checkpoint_task.cancel()
+        if self._loop_lag_task:
+            self._loop_lag_task.cancel()
+        await self.staging_gc.stop()
+        await asyncio.to_thread(self.save_manifests)
+        self.bandwidth.stop()
+        self.remote_inventory.stop()
+        await self.ssh_pool.close()
+        await self.upload_pool.close()
+        await self.progress_store.stop()
+
+    def save_manifests(self):
+        for manifest in list(self.manifests.values()):
+            try:
+                manifest.save()
+            except Exception as e:
+                print(f"Failed to save job manifest {manifest.path.name}: {e}")
+
+    async def checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            await asyncio.to_thread(self.save_manifests)
+
+    async def monitor_loop_lag(self):
+        while True:
+            expected = time.monotonic() + self.loop_lag_interval
+            await asyncio.sleep(self.loop_lag_interval)
+            self.loop_lag.append(max(0.0, time.monotonic() - expected))
+
+    def resume_unfinished_jobs(self):
+        """Load job manifests and re-enqueue the jobs that were running when the server stopped."""
+        for path in sorted(self.manifest_dir.glob("*.json")):
+            manifest = JobManifest.load(path)
+            job_info = manifest.data.get("job") if manifest else None
+            if not job_info:
+                continue
+            progress_key = f"{job_info['author']}/{job_info['repo_name']}"
+            self.manifests[progress_key] = manifest
+            if manifest.data["state"] == "active":
+                print(f"Resuming interrupted job for {progress_key}")
+                self.submit_job(
+                    job_info["author"], job_info["repo_name"], job_info["mode"], job_info["selection"],
+                    job_info.get("priority", 0), job_info.get("rate_limits"), job_info.get("upload_streams"),
+                    job_info.get("sync", False), job_info.get("revision"), job_info.get("compression")
+                )
+
+    def ssh_command(self, remote_cmd: str, stream: Optional[int] = None) -> List[str]:
+        """Build an ssh invocation that runs ``remote_cmd`` over a pooled connection.
+
+        ``stream`` pins bulk uploads to one of the dedicated upload connections.
+        """
+        options = self.ssh_pool.options() if stream is None else self.upload_pool.options(stream)
+        return ["ssh", *options, self.ssh_destination, remote_cmd]
+
+    async def run_remote(self, remote_cmd: str) -> tuple:
+        """Run ``remote_cmd`` on the supercomputer; returns (returncode, stdout, stderr).
+
+        Scripts longer than a single exec argument may be (per-file commands for
+        thousands of files) are fed to a remote ``sh -s`` on stdin instead.
+        """
+        script = remote_cmd.encode() if len(remote_cmd) > 64 * 1024 else None
+        process = await asyncio.create_subprocess_exec(
+            *self.ssh_command("sh -s" if script is not None else remote_cmd),
+            stdin=asyncio.subprocess.PIPE if script is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await process.communicate(script)
+        except BaseException:
+            # A cancelled job must not leave its ssh behind; draining the pipes closes them
+            if process.returncode is None:
+                process.kill()
+            if process.stdin is not None:
+                process.stdin.close()
+            await process.communicate()
+            raise
+        return process.returncode, stdout.decode(errors="ignore"), stderr.decode(errors="ignore")
+
+    def update_progress(
+        self,
+        key: str,
+        status: str,
+        message: str,
+        progress: Optional[int] = None,
+        *,
+        downloaded_bytes: Optional[int] = None,
+        total_bytes: Optional[int] = None,
+        uploaded_bytes: Optional[int] = None,
+        upload: Optional[dict] = None,
+        log_type: Optional[str] = None,
+        append_log: bool = True
+    ):
+        """Update download progress"""
+
+        current_entry = self.download_progress.get(key, {})
+
+        if progress is None:
+            progress = current_entry.get("progress", 0)
+
+        logs = list(current_entry.get("logs", []))
+        new_log = None
+        normalized_message = None
+        if isinstance(message, str):
+            normalized_message = message.strip()
+
+        updated_entry = {
+            **current_entry,
+            "status": status,
+            "message": message,
+            "progress": progress,
+            "timestamp": time.time(),
+        }
+
+        if downloaded_bytes is not None:
+            updated_entry["downloaded_bytes"] = downloaded_bytes
+        if total_bytes is not None:
+            updated_entry["total_bytes"] = total_bytes
+        if uploaded_bytes is not None:
+            updated_entry["uploaded_bytes"] = uploaded_bytes
+        if upload is not None:
+            updated_entry["upload"] = upload
+
+        if append_log and normalized_message:
+            inferred_type = log_type
+            if inferred_type is None:
+                if status in {"transfer_complete", "exists"}:
+                    inferred_type = "success"
+                elif status == "error":
+                    inferred_type = "error"
+                else:
+                    inferred_type = "info"
+
+            last_message = logs[-1]["message"] if logs else None
+            if normalized_message != last_message:
+                new_log = {
+                    "message": normalized_message,
+                    "type": inferred_type,
+                    "timestamp": time.time(),
+                }
+                logs.append(new_log)
+
+        if len(logs) > 200:
+            logs = logs[-200:]
+
+        if logs:
+            updated_entry["logs"] = logs
+        else:
+            updated_entry.pop("logs", None)
+
+        # Persisted as a delta by the store's batched flush
+        self.progress_store.put(key, updated_entry, new_log)
+        print(f"Progress update [{key}]: {status} - {message} ({progress}%)")
+
+    def cleanup_completed_progress(self, key: str):
+        """Remove completed downloads from progress tracking after delay"""
+        # Expired by the store's sweeper after 5 minutes
+        self.progress_store.expire_after(key, 300)
+
+    def job_option(self, progress_key: str, name: str, default=None):
+        """Setting ``name`` of the job running for ``progress_key``, or ``default`` when unset."""
+        job = self.jobs.get(self.active_jobs.get(progress_key))
+        value = job.get(name) if job is not None else None
+        return default if value is None else value
+
+    def job_report(self, progress_key: str) -> dict:
+        """Report of the job currently running for ``progress_key`` (a throwaway dict if none)."""
+        job_id = self.active_jobs.get(progress_key)
+        return self.jobs[job_id]["report"] if job_id is not None else {}
+
+    def record_verification(self, progress_key: str, path: str, stage: str, passed: bool):
+        """Record a per-file ``download``/``remote`` checksum result in the job report."""
+        verification = self.job_report(progress_key).setdefault("verification", {})
+        verification.setdefault(path, {})[stage] = "pass" if passed else "fail"
+        if not passed:
+            print(f"Checksum mismatch ({stage}) for {progress_key}/{path}")
+
+    def compression_stats(self, progress_key: str) -> dict:
+        """Wire compression tally in the job report (ratio is input over wire bytes)."""
+        return self.job_report(progress_key).setdefault("compression", {
+            "compressed_files": 0,
+            "passthrough_files": 0,
+            "input_bytes": 0,
+            "wire_bytes": 0,
+            "ratio": None,
+            "cpu_seconds": 0.0,
+        })
+
+    async def choose_compression(self, progress_key: str, files: List[tuple]) -> set:
+        """Paths among ``files`` (path, local file, size) to zstd on the upload wire."""
+        mode = self.job_option(progress_key, "compression", self.upload_compression)
+        if mode != "auto" or not self.wire_compression.available or not files:
+            return set()
+        decisions = await asyncio.to_thread(
+            lambda: [(path, self.wire_compression.decide(local_file, size)) for path, local_file, size in files]
+        )
+        stats = self.compression_stats(progress_key)
+        chosen = set()
+        for path, compress in decisions:
+            stats["compressed_files" if compress else "passthrough_files"] += 1
+            if compress:
+                chosen.add(path)
+        return chosen
+
+    @staticmethod
+    def remote_hash_pipeline(algo: str, size: int, source: str) -> str:
+        """Shell pipeline printing the Hub oid of the bytes ``source`` writes to stdout."""
+        if algo == "sha256":
+            return f"{source} | sha256sum | cut -c1-64"
+        # Git blob id: sha1 over a "blob <size>\0" header followed by the content
+        return f"{{ printf 'blob {size}\\000'; {source}; }} | sha1sum | cut -c1-40"
+
+    @staticmethod
+    def tar_hash_script(sha256_paths: List[str], check_size: bool = False) -> str:
+        """Shell script for ``tar --to-command`` that writes each member and prints its oid.
+
+        Members listed in ``sha256_paths`` are hashed as LFS files, the rest as git blobs,
+        so a tar stream is verified as it is extracted: one ``sha*sum`` line per member,
+        digest first. This runs once per member, so it spawns as little as it can. tee
+        keeps hashing when a write fails; with ``check_size`` a short member fails the
+        extraction, otherwise the caller checks the sizes afterwards.
+        """
+        lines = [
+            'case "$TAR_FILENAME" in */*) [ -d "${TAR_FILENAME%/*}" ] || mkdir -p "${TAR_FILENAME%/*}" || exit 1 ;; esac',
+            'case "$TAR_FILENAME" in',
+        ]
+        if sha256_paths:
+            patterns = "|".join(shlex.quote(path) for path in sha256_paths)
+            lines.append(f'{patterns}) tee -- "$TAR_FILENAME" | sha256sum ;;')
+        lines.append("""*) { printf 'blob %s\\000' "$TAR_SIZE"; tee -- "$TAR_FILENAME"; } | sha1sum ;;""")
+        lines.append("esac")
+        if check_size:
+            lines.append('[ "$(wc -c < "$TAR_FILENAME")" -eq "$TAR_SIZE" ]')
+        return "\n".join(lines)
+
+    def install_tar_hash_script(self, script_path: str, sha256_paths: List[str], check_size: bool = False) -> str:
+        """Remote command that writes ``tar_hash_script`` to ``script_path``."""
+        return (
+            f"cat > {shlex.quote(script_path)} <<'HF_PROXY_HASH_SCRIPT'\n"
+            f"{self.tar_hash_script(sha256_paths, check_size)}\nHF_PROXY_HASH_SCRIPT"
+        )
+
+    async def check_remote_digests(self, author: str, repo_name: str, results: List[tuple]) -> set:
+        """Record ``(path, expected oid, remote digest)`` results; returns the paths that passed.
+
+        Mismatching remote copies are deleted so a retry sends them again.
+        """
+        progress_key = f"{author}/{repo_name}"
+        passed, failed = set(), []
+        for path, expected, digest in results:
+            self.record_verification(progress_key, path, "remote", digest == expected)
+            if digest == expected:
+                passed.add(path)
+            else:
+                failed.append(path)
+        if failed:
+            repo_dir = f"{self.supercomputer_path}/{author}/{repo_name}"
+            await self.run_remote(" ".join(["rm", "-f"] + [shlex.quote(f"{repo_dir}/{path}") for path in failed]))
+            raise Exception(f"Remote checksum mismatch for {len(failed)} files: {', '.join(failed[:5])}")
+        return passed
+
+    async def get_repo_metadata(
+        self, author: str, repo_name: str, revision: Optional[str] = None
+    ) -> Optional[dict]:
+        """Return the commit sha and per-file metadata (path, size, LFS sha256, blob id).
+
+        ``revision`` is a branch, tag or commit sha (default branch when None). Served from
+        ``HubMetadataCache``: within ``HUB_METADATA_TTL`` of the last check the cached head
+        is trusted outright; after that a sha-only request revalidates it and the full
+        ``files_metadata`` listing is fetched only when the head has moved. A full commit
+        sha that is already cached needs no request at all. Concurrent callers for the
+        same repo share one request. The returned dict is shared and must not be modified.
+        """
+        repo_id = f"{author}/{repo_name}"
+
+        if revision is not None and re.fullmatch(r"[0-9a-f]{40}", revision):
+            sha = revision
+        else:
+            sha = self.hub_metadata.head(repo_id, max_age=self.hub_metadata.ttl, ref=revision)
+        if sha is not None:
+            metadata = self.hub_metadata.get(repo_id, sha)
+            if metadata is not None:
+                self.hub_metadata.stats["hits"] += 1
+                return metadata
+
+        pending = self._metadata_fetches.get((repo_id, revision))
+        if pending is None:
+            pending = asyncio.ensure_future(self.refresh_repo_metadata(repo_id, revision))
+            self._metadata_fetches[(repo_id, revision)] = pending
+            pending.add_done_callback(lambda _: self._metadata_fetches.pop((repo_id, revision), None))
+        return await asyncio.shield(pending)
+
+    async def refresh_repo_metadata(self, repo_id: str, ref: Optional[str] = None) -> Optional[dict]:
+        """Revalidate ``ref`` of ``repo_id`` and fetch its file list if it is not cached."""
+
+        def _fetch_head():
+            try:
+                info = self.hf_api.model_info(repo_id, revision=ref, expand=["sha"])
+            except TypeError:
+                # huggingface_hub releases without ``expand`` return the plain listing
+                info = self.hf_api.model_info(repo_id, revision=ref)
+            return info.sha
+
+        def _fetch_metadata(revision: Optional[str]):
+            info = self.hf_api.model_info(repo_id, revision=revision, files_metadata=True)
+            files = []
+            for sibling in info.siblings or []:
+                lfs = getattr(sibling, "lfs", None)
+                files.append({
+                    "path": sibling.rfilename,
+                    "size": sibling.size,
+                    "sha256": lfs.sha256 if lfs is not None else None,
+                    "blob_id": getattr(sibling, "blob_id", None),
+                })
+            return {"sha": info.sha, "files": files}
+
+        known_sha = self.hub_metadata.head(repo_id, ref=ref)
+        try:
+            with self.metrics.phase("metadata"):
+                sha = await asyncio.to_thread(_fetch_head)
+                self.hub_metadata.stats["revalidations"] += 1
+                metadata = await asyncio.to_thread(self.hub_metadata.get, repo_id, sha) if sha else None
+                if metadata is None:
+                    # Pin the listing to the sha just seen so it cannot race a concurrent push
+                    metadata = await asyncio.to_thread(_fetch_metadata, sha)
+                    self.hub_metadata.stats["fetches"] += 1
+                    if metadata["sha"]:
+                        await asyncio.to_thread(self.hub_metadata.put, repo_id, metadata)
+                if metadata["sha"]:
+                    self.hub_metadata.set_head(repo_id, metadata["sha"], ref)
+                if known_sha and metadata["sha"] and known_sha != metadata["sha"]:
+                    print(f"{repo_id}{'@' + ref if ref else ''} moved from {known_sha[:12]} to {metadata['sha'][:12]}")
+                return metadata
+        except HfHubHTTPError as err:
+            if getattr(err, "response", None) is not None and err.response.status_code == 404:
+                self.hub_metadata.forget(repo_id, ref)
+                return None
+            print(f"HuggingFace API error when fetching {repo_id}: {err}")
+        except Exception as err:
+            print(f"Failed to fetch repo metadata for {repo_id}: {err}")
+
+        # Hub unreachable or rate limited: fall back to the last revision we saw
+        if known_sha:
+            metadata = await asyncio.to_thread(self.hub_metadata.get, repo_id, known_sha)
+            if metadata is not None:
+                self.hub_metadata.stats["stale_hits"] += 1
+                print(f"Using cached metadata for {repo_id} at {known_sha[:12]}")
+                return metadata
+        return None
+
+    async def get_repo_total_size(self, author: str, repo_name: str) -> Optional[int]:
+        """Fetch total repository size from HuggingFace Hub metadata."""
+        metadata = await self.get_repo_metadata(author, repo_name)
+        if not metadata:
+            return None
+        total = sum(entry["size"] for entry in metadata["files"] if entry["size"] is not None)
+        return total or None
+
+    # Weight formats that duplicate a sibling .safetensors checkpoint
+    REDUNDANT_WEIGHT_PATTERNS = (
+        "*pytorch_model*.bin", "*pytorch_model*.bin.index.json", "adapter_model.bin",
+        "*.pt", "*.pth", "*.ckpt", "*.h5", "*.msgpack", "*.onnx", "*.onnx_data",
+        "*.gguf", "*.ggml", "*.tflite", "*.ot",
+    )
+
+    def select_repo_files(self, files: List[dict], selection: Optional[dict]) -> List[dict]:
+        """Filter a Hub file list by include/exclude globs and the weight format policy.
+
+        Globs match the repo-relative path (``*`` crosses ``/``; a trailing ``/`` selects a
+        folder). With ``prefer_safetensors``, redundant weight formats and ``original/``
+        folders are dropped from every directory that also holds ``.safetensors`` files.
+        """
+        if not selection:
+            return files
+
+        def patterns(values):
+            return [value + "*" if value.endswith("/") else value for value in values or []]
+
+        def matches(path: str, globs) -> bool:
+            return any(fnmatch.fnmatchcase(path, glob) for glob in globs)
+
+        include = patterns(selection.get("include"))
+        exclude = patterns(selection.get("exclude"))
+        selected = [
+            entry for entry in files
+            if (not include or matches(entry["path"], include)) and not matches(entry["path"], exclude)
+        ]
+
+        if selection.get("format_policy") == "prefer_safetensors":
+            safetensors_dirs = {
+                posixpath.dirname(entry["path"]) for entry in selected if entry["path"].endswith(".safetensors")
+            }
+
+            def redundant(path: str) -> bool:
+                parts = path.split("/")
+                if "original" in parts[:-1]:
+                    return "/".join(parts[:parts.index("original")]) in safetensors_dirs
+                name = parts[-1]
+                return (
+                    posixpath.dirname(path) in safetensors_dirs
+                    and any(fnmatch.fnmatchcase(name, glob) for glob in self.REDUNDANT_WEIGHT_PATTERNS)
+                )
+
+            selected = [entry for entry in selected if not redundant(entry["path"])]
+
+        return selected
+
+    def describe_selection(self, selected: List[dict], files: List[dict]) -> Optional[str]:
+        """Summarize what a selection skipped, or None when every file was kept."""
+        if len(selected) == len(files):
+            return None
+        selected_bytes = sum(entry["size"] or 0 for entry in selected)
+        total_bytes = sum(entry["size"] or 0 for entry in files)
+        return (
+            f"Selected {len(selected)} of {len(files)} files "
+            f"({self.format_bytes(selected_bytes)} of {self.format_bytes(total_bytes)})"
+        )
+
+    def get_directory_size(self, path: Path, allocated: bool = False) -> int:
+        """Calculate total size of files within the given directory.
+
+        With ``allocated`` sparse files count only the blocks written so far.
+        """
+        if not path.exists():
+            return 0
+
+        total = 0
+        for root, _, files in os.walk(path):
+            for file_name in files:
+                file_path = Path(root) / file_name
+                try:
+                    stat = file_path.stat()
+                except OSError:
+                    continue
+                total += min(stat.st_size, stat.st_blocks * 512) if allocated else stat.st_size
+        return total
+
+    def list_local_files(self, path: Path) -> List[tuple]:
+        """``(relative path, full path, size)`` of every file under ``path``; run it off the event loop."""
+        files = []
+        for root, _, names in os.walk(path):
+            for name in names:
+                full_path = Path(root) / name
+                files.append((full_path.relative_to(path).as_posix(), full_path, full_path.stat().st_size))
+        return files
+
+    @staticmethod
+    def format_bytes(size: int) -> str:
+        """Human readable byte formatter."""
+        if size is None:
+            return "0 B"
+        step_unit = 1024
+        units = ["B", "KiB", "MiB", "GiB", "TiB", "PiB"]
+        idx = 0
+        value = float(size)
+        while value >= step_unit and idx < len(units) - 1:
+            value /= step_unit
+            idx += 1
+        return f"{value:.2f} {units[idx]}"
+
+    def report_download_bytes(self, progress_key: str, size_bytes: int, expected_total: Optional[int], append_log: bool):
+        """Publish a download byte count as a "cloning" progress update."""
+        progress_value: Optional[int] = None
+        effective_size = size_bytes
+
+        if expected_total and expected_total > 0:
+            clamped = min(size_bytes, expected_total)
+            progress_value = min(99, int(clamped / expected_total * 100))
+            message = (
+                f"Downloading files... {self.format_bytes(clamped)} / "
+                f"{self.format_bytes(expected_total)}"
+            )
+            effective_size = clamped
+        else:
+            message = f"Downloading files... {self.format_bytes(size_bytes)}"
+            current_progress = self.download_progress.get(progress_key, {}).get("progress", 0)
+            if size_bytes > 0:
+                progress_value = min(99, max(current_progress, 1))
+            else:
+                progress_value = current_progress
+
+        self.update_progress(
+            progress_key,
+            "cloning",
+            message,
+            progress_value,
+            downloaded_bytes=effective_size,
+            append_log=append_log
+        )
+
+    async def monitor_download_progress(
+        self,
+        repo_path: Path,
+        progress_key: str,
+        expected_total: Optional[int],
+        stop_event: asyncio.Event,
+        counter: Optional[ByteCounter] = None,
+        min_interval: float = 0.25,
+        log_interval: float = 5.0
+    ) -> int:
+        """Report download progress as bytes arrive and return the final byte count.
+
+        With ``counter`` the transfer engine feeds exact byte counts. Otherwise (the git
+        clone fallback) an inotify watcher on ``repo_path`` follows the external writer.
+        The tree is walked at most once, at completion, and only when neither source is
+        available. Updates go out at most every ``min_interval`` seconds and add a log
+        line at most every ``log_interval`` seconds.
+        """
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        watcher: Optional[DirectoryGrowthWatcher] = None
+        size_fn: Optional[Callable[[], int]] = None
+
+        if counter is not None:
+            counter.subscribe(loop, changed.set)
+            size_fn = counter.get
+        else:
+            watcher = DirectoryGrowthWatcher(repo_path, changed.set)
+            if watcher.start(loop):
+                size_fn = lambda: watcher.total
+            else:
+                watcher = None
+                print("inotify unavailable; download size will be measured on completion")
+
+        last_reported_size = -1
+        last_logged = 0.0
+        stop_waiter = asyncio.create_task(stop_event.wait())
+
+        try:
+            while size_fn is not None and not stop_event.is_set():
+                change_waiter = asyncio.create_task(changed.wait())
+                await asyncio.wait({change_waiter, stop_waiter}, return_when=asyncio.FIRST_COMPLETED)
+                change_waiter.cancel()
+                changed.clear()
+
+                size_bytes = size_fn()
+                if size_bytes != last_reported_size:
+                    now = time.monotonic()
+                    append_log = now - last_logged >= log_interval
+                    if append_log:
+                        last_logged = now
+                    self.report_download_bytes(progress_key, size_bytes, expected_total, append_log)
+                    last_reported_size = size_bytes
+
+                # Coalesce bursts of writes into one update per interval
+                await asyncio.sleep(min_interval)
+        finally:
+            stop_waiter.cancel()
+            if counter is not None:
+                counter.unsubscribe()
+            if watcher is not None:
+                watcher.stop()
+
+        # Final size update after the download completes
+        if size_fn is not None:
+            final_size = size_fn()
+        else:
+            final_size = await asyncio.to_thread(self.get_directory_size, repo_path)
+        if final_size != last_reported_size:
+            self.report_download_bytes(progress_key, final_size, expected_total, append_log=True)
+        return final_size
+
+    async def check_if_exists_on_supercomputer(self, author: str, repo_name: str) -> bool:
+        """Check if model already exists on supercomputer (served from the remote inventory)"""
+        if f"{author}/{repo_name}" in self.manifests:
+            # An unfinished job may have left a partial directory behind; it is not complete
+            return False
+        try:
+            return await self.remote_inventory.exists(author, repo_name)
+        except Exception as e:
+            print(f"Error checking remote directory: {e}")
+            return False
+
+    def build_resolve_url(self, author: str, repo_name: str, file_path: str, revision: str) -> str:
+        """Build the Hub ``resolve`` URL for a single file at a pinned revision."""
+        quoted_path = urllib.parse.quote(file_path)
+        quoted_revision = urllib.parse.quote(revision, safe="")
+        return f"{self.hf_endpoint}/{author}/{repo_name}/resolve/{quoted_revision}/{quoted_path}"
+
+    def split_byte_ranges(self, size: Optional[int]) -> List[tuple]:
+        """Split a file into inclusive (start, end) byte ranges of ``range_chunk_size``."""
+        if not size:
+            return [(0, None)]
+        count = math.ceil(size / self.range_chunk_size)
+        return [
+            (index * self.range_chunk_size, min(size, (index + 1) * self.range_chunk_size) - 1)
+            for index in range(count)
+        ]
+
+    def stream_byte_range(
+        self,
+        url: str,
+        start: int,
+        end: Optional[int],
+        consume: Callable[[bytes, int], None],
+        abort_event: threading.Event,
+        progress_key: Optional[str] = None
+    ):
+        """Stream bytes ``start``..``end`` (inclusive) of ``url`` into ``consume(chunk, offset)``.
+
+        Transient failures are retried with a new range request that resumes at the
+        first byte not yet consumed. Reads are paced by the bandwidth governor's download
+        buckets for ``progress_key``.
+        """
+        offset = start
+        attempt = 0
+
+        while True:
+            if abort_event.is_set():
+                raise Exception("Download aborted")
+
+            headers = build_hf_headers(token=self.hf_token)
+            if end is not None:
+                headers["Range"] = f"bytes={offset}-{end}"
+            elif offset > 0:
+                headers["Range"] = f"bytes={offset}-"
+
+            try:
+                request = urllib.request.Request(url, headers=headers)
+                with self.hub_opener.open(request, timeout=self.download_timeout) as response:
+                    # A plain 200 is only usable when the range starts at byte 0
+                    if "Range" in headers and response.status != 206 and offset != 0:
+                        raise Exception(f"Server ignored range request (HTTP {response.status})")
+
+                    while True:
+                        if abort_event.is_set():
+                            raise Exception("Download aborted")
+                        read_size = 1024 * 1024
+                        if end is not None:
+                            read_size = min(read_size, end + 1 - offset)
+                            if read_size <= 0:
+                                break
+                        chunk = response.read(read_size)
+                        if not chunk:
+                            break
+                        consume(chunk, offset)
+                        offset += len(chunk)
+                        self.bandwidth.pace(progress_key, "download", len(chunk), abort_event)
+
+                if end is not None and offset != end + 1:
+                    raise Exception(f"Short read: got {offset - start} of {end + 1 - start} bytes")
+                return
+            except Exception as err:
+                if abort_event.is_set() or attempt >= self.download_retries:
+                    raise
+                if isinstance(err, urllib.error.HTTPError) and 400 <= err.code < 500 and err.code != 429:
+                    raise
+                attempt += 1
+                print(f"Retrying {url} from byte {offset} (attempt {attempt}): {err}")
+                time.sleep(min(2 ** attempt, 30))
+
+    async def run_range_worker(self, progress_key: str, func: Callable, *args, span: Optional[dict] = None):
+        """Run ``func(*args)`` on the HTTP worker pool once a worker is free.
+
+        Waiting ranges are admitted highest job priority first, so a throttled job that
+        holds workers cannot park a more urgent job's ranges behind its own. The run is
+        recorded as a ``range`` span on the job timeline with ``span`` as its args.
+        """
+        async with self.range_slots.slot(self.bandwidth.priority(progress_key)):
+            with JobTimeline.span("range", "range", **(span or {})):
+                return await asyncio.get_running_loop().run_in_executor(self.download_executor, func, *args)
+
+    def download_byte_range(
+        self,
+        url: str,
+        temp_path: Path,
+        start: int,
+        end: Optional[int],
+        counter: ByteCounter,
+        abort_event: threading.Event,
+        on_write: Optional[Callable[[bytes, int], None]] = None,
+        progress_key: Optional[str] = None
+    ):
+        """Fetch one byte range into ``temp_path`` at its offset.
+
+        ``on_write(chunk, offset)`` is called after every write (checkpointing, hashing).
+        """
+        fd = os.open(temp_path, os.O_WRONLY)
+
+        def write_chunk(chunk: bytes, offset: int):
+            os.pwrite(fd, chunk, offset)
+            counter.add(len(chunk))
+            if on_write is not None:
+                on_write(chunk, offset)
+
+        try:
+            self.stream_byte_range(url, start, end, write_chunk, abort_event, progress_key)
+        finally:
+            os.close(fd)
+
+    async def download_repo_file(
+        self,
+        author: str,
+        repo_name: str,
+        revision: str,
+        file_entry: dict,
+        local_repo_path: Path,
+        counter: ByteCounter,
+        abort_event: threading.Event,
+        file_callback: Optional[Callable[[dict, Path], Awaitable[None]]] = None
+    ) -> tuple:
+        """Download one repo file, splitting it into parallel range requests when large.
+
+        Files already in the blob cache are linked into place instead. With a job manifest,
+        a file downloaded by an earlier attempt is reused and a partial one resumes each
+        range at its checkpointed offset. Returns ``(local path, served from cache)``.
+        """
+        target = local_repo_path / file_entry["path"]
+        temp_path = target.with_name(target.name + ".incomplete")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        size = file_entry["size"]
+        progress_key = f"{author}/{repo_name}"
+
+        manifest = self.manifests.get(progress_key)
+        file_state = manifest.file_state(file_entry["path"]) if manifest is not None else {}
+        # Bytes already on disk or linked from the cache count as progress but need no room
+        if file_state.get("downloaded") and target.exists() and target.stat().st_size == (size or 0):
+            counter.add(size or 0)
+            self.staging_disk.freed(progress_key, size or 0)
+            if file_callback is not None:
+                await file_callback(file_entry, target)
+            return target, False
+
+        cache_key = BlobCache.key_for(file_entry)
+        cached_blob = self.blob_cache.lookup(cache_key)
+        if cached_blob is not None:
+            self.blob_cache.pin(cache_key)
+            try:
+                await asyncio.to_thread(BlobCache.materialize, cached_blob, target)
+            finally:
+                self.blob_cache.unpin(cache_key)
+            if manifest is not None:
+                manifest.mark(file_entry["path"], "downloaded")
+            counter.add(file_entry["size"] or 0)
+            self.staging_disk.freed(progress_key, file_entry["size"] or 0)
+            if file_callback is not None:
+                await file_callback(file_entry, target)
+            return target, True
+        self.blob_cache.record_miss_bytes(file_entry["size"])
+
+        # Resume only a partial file laid out exactly as the checkpoint describes
+        offsets = {}
+        if manifest is not None:
+            if (
+                size
+                and file_state.get("size") == size
+                and file_state.get("chunk") == self.range_chunk_size
+                and temp_path.exists()
+                and temp_path.stat().st_size == size
+            ):
+                offsets = {int(start): offset for start, offset in file_state.get("ranges", {}).items()}
+            else:
+                manifest.start_file(file_entry["path"], size, self.range_chunk_size)
+
+        if not offsets:
+            # Pre-size the file so every range worker can write at its own offset
+            with open(temp_path, "wb") as handle:
+                if size:
+                    handle.truncate(size)
+
+        # Verified inline against the Hub oid as the ranges land
+        ranges = self.split_byte_ranges(size)
+        oid = cache_key.split("/", 1) if cache_key and size is not None else None
+        hasher = StreamingHasher(temp_path, oid[0], size, ranges) if oid else None
+
+        pending = []
+        for start, end in ranges:
+            offset = offsets.get(start, start)
+            counter.add(offset - start)
+            self.staging_disk.freed(progress_key, offset - start)
+            if hasher is not None:
+                hasher.seed(start, offset)
+            if end is None or offset <= end:
+                pending.append((start, offset, end))
+        if offsets:
+            resumed = sum(offsets.get(start, start) - start for start, _ in ranges)
+            print(f"Resuming {file_entry['path']} with {resumed} of {size} bytes already on disk")
+
+        def on_write_for(start: int) -> Optional[Callable[[bytes, int], None]]:
+            if manifest is None and hasher is None:
+                return None
+
+            def on_write(chunk: bytes, offset: int):
+                if manifest is not None:
+                    manifest.advance(file_entry["path"], start, offset + len(chunk), temp_path)
+                if hasher is not None:
+                    hasher.update(start, chunk, offset)
+            return on_write
+
+        url = self.build_resolve_url(author, repo_name, file_entry["path"], revision)
+        await asyncio.gather(*(
+            self.run_range_worker(
+                progress_key,
+                self.download_byte_range,
+                url,
+                temp_path,
+                offset,
+                end,
+                counter,
+                abort_event,
+                on_write_for(start),
+                progress_key,
+                span={"path": file_entry["path"], "start": offset, "end": end}
+            )
+            for start, offset, end in pending
+        ))
+
+        if hasher is not None:
+            digest = await asyncio.to_thread(hasher.finish)
+            passed = digest == oid[1]
+            self.record_verification(progress_key, file_entry["path"], "download", passed)
+            if not passed:
+                temp_path.unlink(missing_ok=True)
+                if manifest is not None:
+                    manifest.start_file(file_entry["path"], size, self.range_chunk_size)
+                raise Exception(f"Checksum mismatch for {file_entry['path']}: expected {oid[1]}, got {digest}")
+
+        os.replace(temp_path, target)
+        if manifest is not None:
+            manifest.mark(file_entry["path"], "downloaded")
+        # Pipelined files are deleted after upload; caching them would pin their space
+        if file_callback is None:
+            await self.blob_cache.insert(cache_key, target, file_entry["size"])
+        else:
+            await file_callback(file_entry, target)
+        return target, False
+
+    async def download_repo_files(
+        self,
+        author: str,
+        repo_name: str,
+        file_callback: Optional[Callable[[dict, Path], Awaitable[None]]] = None,
+        selection: Optional[dict] = None,
+        skip_paths: Optional[set] = None,
+        window: Optional[StagingWindow] = None
+    ) -> str:
+        """Download the selected repo files over HTTP with a pool of concurrent workers.
+
+        ``file_callback`` is awaited with (file entry, local path) as soon as each file is
+        complete. Files in ``skip_paths`` are already on the supercomputer and are left out.
+        With ``window`` (pipelined jobs, whose uploads delete files) a file is started only
+        once it fits in the window, sized here to the ``DOWNLOAD_WORKERS`` + 1 largest
+        files, and the staging reservation is capped to it. Falls back to
+        ``git_clone_repo`` when the Hub file list is unavailable.
+        """
+        local_repo_path = self.local_download_path / f"{author}_{repo_name}"
+        progress_key = f"{author}/{repo_name}"
+
+        revision = self.job_option(progress_key, "revision")
+        metadata = await self.get_repo_metadata(author, repo_name, revision)
+        if not metadata or not metadata["files"]:
+            if revision is not None:
+                raise Exception(f"Hub file list for revision {revision} is unavailable")
+            print("Repository file list unavailable; falling back to git clone.")
+            with self.metrics.phase("clone"):
+                return await self.git_clone_repo(author, repo_name, selection)
+
+        files = self.select_repo_files(metadata["files"], selection)
+        if not files:
+            self.update_progress(progress_key, "error", "No repository files match the requested selection", 0)
+            raise Exception("No repository files match the requested selection")
+        selection_note = self.describe_selection(files, metadata["files"])
+        if skip_paths:
+            files = [entry for entry in files if entry["path"] not in skip_paths]
+        revision = metadata["sha"] or "main"
+        expected_total_size = sum(entry["size"] or 0 for entry in files) or None
+
+        print(f"Starting HTTP download for {author}/{repo_name} @ {revision}")
+        print(f"Files: {len(files)}, workers: {self.download_workers}, local path: {local_repo_path}")
+        if selection_note:
+            self.update_progress(progress_key, "cloning", selection_note, 0)
+
+        self.update_progress(
+            progress_key,
+            "cloning",
+            f"Starting download of {len(files)} files with {self.download_workers} workers...",
+            0,
+            total_bytes=expected_total_size,
+            downloaded_bytes=0
+        )
+
+        # Files from an earlier attempt at the same revision are resumed, not discarded
+        manifest = self.manifests.get(progress_key)
+        resuming = manifest is not None and manifest.bind_revision(revision) and local_repo_path.exists()
+        if local_repo_path.exists() and not resuming:
+            print(f"Removing existing directory: {local_repo_path}")
+            self.staging_gc.discard(local_repo_path, "restart")
+
+        # Only what is not staged yet needs room; cached files are linked, not copied
+        staged_bytes = await asyncio.to_thread(self.get_directory_size, local_repo_path, True) if resuming else 0
+        cached_bytes = sum(
+            entry["size"] or 0 for entry in files if BlobCache.key_for(entry) in self.blob_cache.entries
+        )
+        needed = (expected_total_size or 0) - staged_bytes - cached_bytes
+        if window is not None:
+            sizes = sorted((entry["size"] or 0 for entry in files), reverse=True)
+            window.limit = sum(sizes[:self.download_workers + 1])
+            needed = min(needed, window.limit)
+        await self.reserve_staging(progress_key, max(0, needed))
+        local_repo_path.mkdir(parents=True, exist_ok=True)
+
+        counter = ByteCounter()
+        self.staging_disk.track(progress_key, counter)
+        abort_event = threading.Event()
+        stop_event = asyncio.Event()
+        monitor_task = asyncio.create_task(
+            self.monitor_download_progress(
+                local_repo_path,
+                progress_key,
+                expected_total_size,
+                stop_event,
+                counter=counter
+            )
+        )
+
+        try:
+            try:
+                async def fetch(entry: dict) -> tuple:
+                    if window is not None:
+                        await window.acquire(entry["size"] or 0)
+                    return await JobTimeline.trace(
+                        self.download_repo_file(
+                            author, repo_name, revision, entry, local_repo_path, counter, abort_event,
+                            file_callback
+                        ),
+                        entry["path"], "download", size=entry.get("size")
+                    )
+
+                results = await asyncio.gather(*(fetch(entry) for entry in files))
+            except BaseException:
+                abort_event.set()
+                raise
+            finally:
+                stop_event.set()
+                try:
+                    await monitor_task
+                except asyncio.CancelledError:
+                    pass
+
+            final_size = counter.get()
+            cached_files = [entry for entry, (_, from_cache) in zip(files, results) if from_cache]
+            cache_note = ""
+            if cached_files:
+                cached_bytes = sum(entry["size"] or 0 for entry in cached_files)
+                cache_note = f" ({len(cached_files)} from cache, {self.format_bytes(cached_bytes)})"
+            print(f"HTTP download completed successfully: {local_repo_path}{cache_note}")
+            self.update_progress(
+                progress_key,
+                "clone_complete",
+                f"Download complete: {self.format_bytes(final_size)} in {len(files)} files{cache_note}",
+                100,
+                downloaded_bytes=final_size
+            )
+            return str(local_repo_path)
+        except Exception as e:
+            print(f"HTTP download error: {e}")
+            self.update_progress(progress_key, "error", f"Download failed: {str(e)}", 0)
+            raise Exception(f"Failed to download repository: {e}")
+
+    async def git_clone_repo(self, author: str, repo_name: str, selection: Optional[dict] = None) -> str:
+        """Clone HuggingFace repository.
+
+        Without a Hub file list the selection can only be applied after the fact: files it
+        excludes are deleted from the working tree so they are at least never uploaded.
+        """
+        repo_url = f"{self.hf_endpoint}/{author}/{repo_name}"
+        local_repo_path = self.local_download_path / f"{author}_{repo_name}"
+        progress_key = f"{author}/{repo_name}"
+
+        print(f"Starting git clone for {author}/{repo_name}")
+        print(f"Repository URL: {repo_url}")
+        print(f"Local path: {local_repo_path}")
+
+        expected_total_size = await self.get_repo_total_size(author, repo_name)
+        if expected_total_size:
+            print(f"Estimated repository size: {expected_total_size} bytes")
+        else:
+            print("Repository size metadata unavailable; tracking progress using downloaded bytes only.")
+
+        self.update_progress(
+            progress_key,
+            "cloning",
+            "Starting git clone...",
+            0,
+            total_bytes=expected_total_size,
+            downloaded_bytes=0
+        )
+
+        # Remove existing directory if it exists
+        if local_repo_path.exists():
+            print(f"Removing existing directory: {local_repo_path}")
+            self.staging_gc.discard(local_repo_path, "restart")
+
+        # LFS objects land in .git/lfs and again in the checkout: twice the repo size
+        await self.reserve_staging(progress_key, 2 * (expected_total_size or 0))
+        # Clone into a pre-created (empty) directory so the watcher can follow it from the start
+        local_repo_path.mkdir(parents=True)
+
+        try:
+            stop_event = asyncio.Event()
+            monitor_task = asyncio.create_task(
+                self.monitor_download_progress(local_repo_path, progress_key, expected_total_size, stop_event)
+            )
+
+            process = None
+            stderr_task = None
+            stdout_task = None
+            success = False
+
+            try:
+                cmd = ["git", "clone", "--progress", repo_url, str(local_repo_path)]
+                print(f"Executing command: {' '.join(cmd)}")
+
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+
+                async def relay_stream(stream, label: str):
+                    if not stream:
+                        return
+                    async for line in stream:
+                        text = line.decode().strip()
+                        if text:
+                            print(f"Git clone {label}: {text}")
+
+                stderr_task = asyncio.create_task(relay_stream(process.stderr, "stderr"))
+                stdout_task = asyncio.create_task(relay_stream(process.stdout, "stdout"))
+
+                with JobTimeline.span("git_clone"):
+                    await process.wait()
+                success = process.returncode == 0
+
+            finally:
+                stop_event.set()
+
+                for task in (stderr_task, stdout_task):
+                    if task:
+                        task.cancel()
+                await asyncio.gather(
+                    *(task for task in (stderr_task, stdout_task) if task),
+                    return_exceptions=True
+                )
+
+                final_size = await monitor_task
+
+            if not success:
+                raise Exception("Git clone failed")
+
+            if selection:
+                with JobTimeline.span("prune"):
+                    removed_files, removed_bytes = await asyncio.to_thread(
+                        self.prune_unselected_files, local_repo_path, selection
+                    )
+                if removed_files:
+                    final_size = max(0, final_size - removed_bytes)
+                    self.update_progress(
+                        progress_key,
+                        "cloning",
+                        f"Pruned {removed_files} unselected files ({self.format_bytes(removed_bytes)})"
+                    )
+
+            current_entry = self.download_progress.get(progress_key, {})
+            total_bytes = current_entry.get("total_bytes")
+
+            effective_final = final_size
+            if total_bytes and total_bytes > 0:
+                clamped = min(final_size, total_bytes)
+                final_message = (
+                    f"Clone complete: {self.format_bytes(clamped)} / {self.format_bytes(total_bytes)}"
+                )
+                effective_final = clamped
+            else:
+                final_message = f"Clone complete: {self.format_bytes(final_size)}"
+
+            print(f"Git clone completed successfully: {local_repo_path}")
+            self.update_progress(
+                progress_key,
+                "clone_complete",
+                final_message,
+                100,
+                downloaded_bytes=effective_final
+            )
+            return str(local_repo_path)
+        except Exception as e:
+            print(f"Git clone error: {e}")
+            self.update_progress(progress_key, "error", f"Git clone failed: {str(e)}", 0)
+            raise Exception(f"Failed to clone repository: {e}")
+
+    def prune_unselected_files(self, repo_path: Path, selection: dict) -> tuple:
+        """Delete working-tree files outside ``selection``; returns (files, bytes) removed."""
+        files = []
+        for root, dirs, names in os.walk(repo_path):
+            dirs[:] = [name for name in dirs if name != ".git"]
+            for name in names:
+                full_path = Path(root) / name
+                files.append({
+                    "path": full_path.relative_to(repo_path).as_posix(),
+                    "size": full_path.stat().st_size,
+                })
+
+        keep = {entry["path"] for entry in self.select_repo_files(files, selection)}
+        removed_files = 0
+        removed_bytes = 0
+        for entry in files:
+            if entry["path"] not in keep:
+                (repo_path / entry["path"]).unlink()
+                removed_files += 1
+                removed_bytes += entry["size"]
+        return removed_files, removed_bytes
+
+    async def create_remote_directory(self, author: str, repo_name: str):
+        """Create directory structure on supercomputer"""
+        remote_path = shlex.quote(f"{self.supercomputer_path}/{author}/{repo_name}")
+
+        try:
+            with self.metrics.phase("remote_mkdir"):
+                cmd = self.ssh_command(f"mkdir -p {remote_path}")
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                await process.communicate()
+
+                if process.returncode != 0:
+                    raise Exception("Failed to create remote directory")
+        except Exception as e:
+            raise Exception(f"Failed to create remote directory: {e}")
+
+    async def scp_transfer(
+        self,
+        local_path: str,
+        author: str,
+        repo_name: str,
+        verify: Optional[Callable[[set], Awaitable[None]]] = None
+    ):
+        """Transfer a staged tree to the supercomputer.
+
+        Uses ``multistream_upload`` when the job has more than one upload stream, and a
+        single ``scp -r`` otherwise. Multi-stream uploads are hashed remotely as they are
+        written; after ``scp -r`` every copy goes to ``verify``.
+        """
+        remote_path = f"{self.ssh_destination}:{self.supercomputer_path}/{author}/"
+        progress_key = f"{author}/{repo_name}"
+
+        try:
+            # Create remote directory first
+            await self.create_remote_directory(author, repo_name)
+
+            self.update_progress(progress_key, "transferring", "Starting SCP transfer to supercomputer...", 0)
+
+            with self.metrics.phase("git_cleanup"):
+                removed_git = self.remove_git_directory(local_path)
+            if removed_git:
+                self.update_progress(progress_key, "transferring", "Removed .git directory before transfer")
+
+            # Copy the entries into the (possibly pre-populated) repo directory rather than
+            # the directory itself, which scp would nest when the target already exists
+            sources = sorted(str(entry) for entry in Path(local_path).iterdir())
+            if not sources:
+                if verify is not None:
+                    await verify(set())
+                self.remote_inventory.mark_present(author, repo_name)
+                self.update_progress(progress_key, "transfer_complete", "Nothing left to transfer", 100)
+                self.cleanup_completed_progress(progress_key)
+                return
+
+            streams = self.job_option(progress_key, "upload_streams", self.upload_streams)
+            compression = self.job_option(progress_key, "compression", self.upload_compression)
+            # Per-file compression needs per-file ssh uploads, so it takes the multi-stream path
+            if streams > 1 or (compression == "auto" and self.wire_compression.available):
+                uploaded_files, uploaded_bytes, hashed = await self.multistream_upload(
+                    Path(local_path), author, repo_name, streams
+                )
+                if verify is not None:
+                    await verify(hashed)
+                self.remote_inventory.mark_present(author, repo_name)
+                self.update_progress(
+                    progress_key,
+                    "transfer_complete",
+                    f"Multi-stream transfer completed: {uploaded_files} files, "
+                    f"{self.format_bytes(uploaded_bytes)} over {streams} streams",
+                    100,
+                    uploaded_bytes=uploaded_bytes
+                )
+                self.cleanup_completed_progress(progress_key)
+                return
+
+            # scp cannot be paced chunk by chunk; -l (Kbit/s) fixes it at the job's current share
+            rate = self.bandwidth.effective_rate(progress_key, "upload")
+            limit_args = ["-l", str(max(8, int(rate * 8 / 1000)))] if rate else []
+            cmd = [
+                "scp", *self.ssh_pool.options(), *limit_args, "-r",
+                *sources,
+                f"{remote_path}{repo_name}/"
+            ]
+
+            # scp's meter shows basenames; sizes of ambiguous names come from the meter itself
+            local_files = await asyncio.to_thread(self.list_local_files, Path(local_path))
+            local_sizes: dict = {}
+            for _, full_path, size in local_files:
+                local_sizes[full_path.name] = None if full_path.name in local_sizes else size
+            total_bytes = sum(size for _, _, size in local_files)
+
+            master_fd, slave_fd = os.openpty()
+            # A wide terminal keeps scp from truncating file names in its progress meter
+            fcntl.ioctl(slave_fd, termios.TIOCSWINSZ, struct.pack("HHHH", 24, 512, 0, 0))
+            captured_logs: List[str] = []
+            loop = asyncio.get_running_loop()
+            output_closed = loop.create_future()
+            reader = {"buffer": "", "file": None, "file_started": 0.0}
+            # Each file scp's meter moves past becomes an upload span on its own lane
+            timeline = JobTimeline.current.get()
+            file_lane = timeline.acquire_lane() if timeline is not None else 0
+
+            def file_finished(meter: UploadMeter):
+                meter.finish(reader["file"])
+                if timeline is not None:
+                    timeline.add(reader["file"], "upload", reader["file_started"], timeline.now(), file_lane)
+
+            def handle_line(line: str, meter: UploadMeter):
+                match = UploadMeter.SCP_METER.match(line)
+                if match is None:
+                    print(f"SCP PTY: {line}")
+                    captured_logs.append(line)
+                    self.update_progress(progress_key, "transferring", line, log_type="info")
+                    return
+                name = match.group("name").strip()
+                if reader["file"] != name:
+                    if reader["file"] is not None:
+                        file_finished(meter)
+                    reader["file_started"] = timeline.now() if timeline is not None else 0.0
+                reader["file"] = name
+                size = local_sizes.get(name)
+                if size is not None:
+                    sent = size * int(match.group("percent")) // 100
+                else:
+                    sent = UploadMeter.parse_size(match.group("amount"))
+                meter.set_sent(name, sent, size)
+
+            def on_output(meter: UploadMeter):
+                try:
+                    chunk = os.read(master_fd, 65536)
+                except BlockingIOError:
+                    return
+                except OSError:
+                    # Linux reports EIO on the master once the last slave fd closes: that is EOF
+                    chunk = b""
+                if not chunk:
+                    loop.remove_reader(master_fd)
+                    if reader["buffer"].strip():
+                        handle_line(reader["buffer"].strip(), meter)
+                    reader["buffer"] = ""
+                    if not output_closed.done():
+                        output_closed.set_result(None)
+                    return
+                # The meter redraws with \r; each redraw is a sample, not a log line
+                lines = re.split(r"[\r\n]", reader["buffer"] + chunk.decode(errors="ignore"))
+                reader["buffer"] = lines.pop()
+                for line in lines:
+                    if line.strip():
+                        handle_line(line.strip(), meter)
+
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdin=slave_fd,
+                    stdout=slave_fd,
+                    stderr=slave_fd
+                )
+            except Exception:
+                os.close(master_fd)
+                raise
+            finally:
+                os.close(slave_fd)
+
+            try:
+                async with self.upload_telemetry(progress_key, total_bytes) as meter:
+                    os.set_blocking(master_fd, False)
+                    loop.add_reader(master_fd, on_output, meter)
+                    async with self.bandwidth.hold(progress_key, "upload"):
+                        return_code = await process.wait()
+                    # A backgrounded ssh master may still hold the terminal; don't wait on it
+                    try:
+                        await asyncio.wait_for(asyncio.shield(output_closed), timeout=1.0)
+                    except asyncio.TimeoutError:
+                        pass
+                    if return_code == 0 and reader["file"] is not None:
+                        file_finished(meter)
+            finally:
+                loop.remove_reader(master_fd)
+                os.close(master_fd)
+                if timeline is not None:
+                    timeline.release_lane(file_lane)
+
+            if return_code != 0:
+                self.update_progress(progress_key, "error", "SCP transfer failed", 0)
+                combined_logs = "\n".join(captured_logs)
+                raise Exception(f"SCP transfer failed with exit code {return_code}: {combined_logs}")
+
+            # scp writes the remote copies without hashing them, so all of them are checked
+            if verify is not None:
+                await verify(set())
+            self.remote_inventory.mark_present(author, repo_name)
+            self.update_progress(progress_key, "transfer_complete", "SCP transfer completed", 100)
+            self.cleanup_completed_progress(progress_key)
+        except Exception as e:
+            self.update_progress(progress_key, "error", f"SCP transfer failed: {str(e)}", 0)
+            self.cleanup_completed_progress(progress_key)
+            raise Exception(f"Failed to transfer files: {e}")
+
+    async def upload_file(
+        self,
+        local_file: Path,
+        author: str,
+        repo_name: str,
+        relative_path: str,
+        oid: Optional[tuple] = None,
+        stream: Optional[int] = None,
+        compress: bool = False
+    ) -> tuple:
+        """Stream one file to the supercomputer over ssh.
+
+        With ``oid`` (algo, digest) the remote side hashes the stream through ``tee`` as it
+        writes it, so verification needs no second read. ``stream`` selects a dedicated
+        upload connection; ``compress`` sends the file as zstd, decompressed remotely.
+        Returns ``(remote size, remote digest or None)``.
+        """
+        remote_file = f"{self.supercomputer_path}/{author}/{repo_name}/{relative_path}"
+        remote_temp = f"{remote_file}.incomplete"
+        source = "zstd -dqc" if compress else "cat"
+        if oid is not None:
+            size = local_file.stat().st_size
+            write_cmd = self.remote_hash_pipeline(oid[0], size, f"{source} | tee {shlex.quote(remote_temp)}")
+        else:
+            write_cmd = f"{source} > {shlex.quote(remote_temp)}"
+        remote_cmd = (
+            f"mkdir -p {shlex.quote(posixpath.dirname(remote_file))} && "
+            f"{write_cmd} && "
+            f"mv -f {shlex.quote(remote_temp)} {shlex.quote(remote_file)} && "
+            f"wc -c < {shlex.quote(remote_file)}"
+        )
+        progress_key = f"{author}/{repo_name}"
+        with JobTimeline.span(relative_path, "upload", stream=stream, compress=compress):
+            stdout = await self.pipe_file_to_remote(
+                self.ssh_command(remote_cmd, stream), local_file, progress_key, relative_path,
+                compress=compress
+            )
+        meter = self.upload_meters.get(progress_key)
+        if meter is not None:
+            meter.finish(relative_path)
+
+        output = stdout.decode().split()
+        try:
+            if oid is not None:
+                return int(output[1]), output[0]
+            return int(output[0]), None
+        except (IndexError, ValueError):
+            raise Exception(f"Could not confirm remote size of {relative_path}")
+
+    async def pipe_file_to_remote(
+        self,
+        cmd: List[str],
+        local_file: Path,
+        progress_key: str,
+        label: str,
+        start: int = 0,
+        length: Optional[int] = None,
+        compress: bool = False,
+        path: Optional[str] = None,
+        on_read: Optional[Callable[[bytes, int], None]] = None
+    ) -> bytes:
+        """Run ``cmd`` with ``length`` bytes of ``local_file`` from ``start`` on its stdin.
+
+        The bytes are counted against ``path`` (default ``label``) on the job's upload
+        meter, and ``on_read(chunk, offset)`` sees each chunk as it is read (in a worker
+        thread); see ``pipe_to_remote`` for compression, pacing and errors.
+        """
+        def segments() -> Iterator[tuple]:
+            with open(local_file, "rb") as handle:
+                file_size = os.fstat(handle.fileno()).st_size
+                handle.seek(start)
+                offset = start
+                remaining = length
+                while remaining is None or remaining > 0:
+                    chunk = handle.read(1024 * 1024 if remaining is None else min(1024 * 1024, remaining))
+                    if not chunk:
+                        return
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                    if on_read is not None:
+                        on_read(chunk, offset)
+                    offset += len(chunk)
+                    yield chunk, path or label, file_size
+
+        return await self.pipe_to_remote(cmd, segments(), progress_key, label, compress)
+
+    @staticmethod
+    def tar_segments(members: List[tuple]) -> Iterator[tuple]:
+        """``pipe_to_remote`` segments of a tar archive holding ``members`` (path, local file, size)."""
+        for relative_path, full_path, size in members:
+            header = tarfile.TarInfo(relative_path)
+            header.size = size
+            header.mode = 0o644
+            header.mtime = int(time.time())
+            yield header.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"), None, 0
+            with open(full_path, "rb") as handle:
+                sent = 0
+                while sent < size:
+                    chunk = handle.read(min(1024 * 1024, size - sent))
+                    if not chunk:
+                        raise Exception(f"{relative_path} shrank while it was being uploaded")
+                    sent += len(chunk)
+                    yield chunk, relative_path, size
+            if size % tarfile.BLOCKSIZE:
+                yield tarfile.NUL * (tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE), None, 0
+        yield tarfile.NUL * (2 * tarfile.BLOCKSIZE), None, 0
+
+    async def pipe_to_remote(
+        self,
+        cmd: List[str],
+        segments: Iterator[tuple],
+        progress_key: str,
+        label: str,
+        compress: bool = False
+    ) -> bytes:
+        """Run ``cmd`` with the bytes ``segments`` yields on its stdin.
+
+        ``segments`` yields non-empty ``(data, path, file size)`` tuples and is read in a
+        worker thread; data with a ``path`` is counted against that file on the job's
+        upload meter. With ``compress`` the bytes go out as one zstd frame (``cmd`` must
+        decompress) and the job's compression tally is updated. Writes are paced by the
+        job's upload bucket on wire bytes. Returns the command's stdout; raises when it
+        exits non-zero, and kills it if the upload is cancelled.
+        """
+        meter = self.upload_meters.get(progress_key)
+        compressor = self.wire_compression.compressor() if compress else None
+        counters = {"input": 0, "wire": 0, "cpu": 0.0}
+
+        def read_chunk() -> tuple:
+            data, path, file_size = next(segments, (b"", None, 0))
+            if compressor is None:
+                return data, data, path, file_size
+            started = time.thread_time()
+            wire = compressor.compress(data) if data else compressor.flush()
+            counters["cpu"] += time.thread_time() - started
+            return data, wire, path, file_size
+
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+
+        try:
+            try:
+                while True:
+                    # The empty read at the end yields the compressor's closing frame
+                    chunk, wire, path, file_size = await asyncio.to_thread(read_chunk)
+                    counters["input"] += len(chunk)
+                    counters["wire"] += len(wire)
+                    if wire:
+                        process.stdin.write(wire)
+                        await process.stdin.drain()
+                        await self.bandwidth.throttle(progress_key, "upload", len(wire))
+                    if meter is not None and chunk and path is not None:
+                        meter.advance(path, len(chunk), file_size)
+                    if not chunk:
+                        break
+                process.stdin.close()
+            except (BrokenPipeError, ConnectionResetError):
+                # ssh exited early; its return code and stderr explain why
+                pass
+
+            stdout, stderr = await process.communicate()
+        except BaseException:
+            if process.returncode is None:
+                process.kill()
+            # Draining the pipes closes them along with the killed process
+            process.stdin.close()
+            await process.communicate()
+            raise
+
+        if process.returncode != 0:
+            raise Exception(f"Upload of {label} failed: {stderr.decode(errors='ignore').strip()}")
+        if compressor is not None:
+            stats = self.compression_stats(progress_key)
+            stats["input_bytes"] += counters["input"]
+            stats["wire_bytes"] += counters["wire"]
+            stats["cpu_seconds"] = round(stats["cpu_seconds"] + counters["cpu"], 3)
+            stats["ratio"] = round(stats["input_bytes"] / stats["wire_bytes"], 2) if stats["wire_bytes"] else None
+        return stdout
+
+    async def multistream_upload(self, local_path: Path, author: str, repo_name: str, streams: int) -> tuple:
+        """Upload a staged tree over ``streams`` parallel ssh connections.
+
+        Work is handed out largest first. Files below ``UPLOAD_BATCH_MB`` are grouped into
+        tar streams, one per connection unless there are hundreds of them, so small files
+        don't each pay for an ssh process and a round trip. Files above
+        ``UPLOAD_SPLIT_MB`` are cut into ranges of that size, each written with ``dd seek``
+        into one remote temp file that is size-checked and renamed into place once every
+        range has landed. Everything else gets its own stream.
+
+        With ``VERIFY_REMOTE`` every remote copy is hashed as it is written: whole files
+        and tar members against their Hub oid, split ranges against the digest of the
+        bytes sent while the file's oid is checked over the ranges as they are read.
+        Returns ``(files, bytes, paths verified against their oid)``.
+        """
+        progress_key = f"{author}/{repo_name}"
+        remote_root = f"{self.supercomputer_path}/{author}/{repo_name}"
+        manifest = self.manifests.get(progress_key)
+        split_size = self.upload_split_size
+
+        files = await asyncio.to_thread(self.list_local_files, local_path)
+        total_bytes = sum(size for _, _, size in files)
+        compressed = await self.choose_compression(progress_key, files)
+
+        oids = {}
+        if self.verify_remote:
+            metadata = await self.get_repo_metadata(author, repo_name, self.job_option(progress_key, "revision"))
+            for entry in metadata["files"] if metadata else []:
+                cache_key = BlobCache.key_for(entry)
+                if cache_key:
+                    oids[entry["path"]] = tuple(cache_key.split("/", 1))
+
+        # Work items are (path, local file, size, range start, length); a batch has the
+        # list of its (path, local file, size) members in place of the local file
+        items = []
+        pending_ranges = {}
+        file_hashers = {}
+        small = []
+        for relative_path, full_path, size in files:
+            if size > split_size:
+                starts = range(0, size, split_size)
+                pending_ranges[relative_path] = len(starts)
+                if relative_path in oids:
+                    file_hashers[relative_path] = StreamingHasher(
+                        full_path, oids[relative_path][0], size,
+                        [(start, min(start + split_size, size) - 1) for start in starts]
+                    )
+                items.extend(
+                    (relative_path, full_path, size, start, min(split_size, size - start)) for start in starts
+                )
+            elif size < self.upload_batch_size:
+                small.append((relative_path, full_path, size))
+            else:
+                items.append((relative_path, full_path, size, None, size))
+        if len(small) > 1:
+            # Balance bytes across the batches, at most 200 files each so a batch's remote
+            # size check stays a modest command line
+            batches = [[] for _ in range(max(min(streams, len(small)), math.ceil(len(small) / 200)))]
+            loads = [0] * len(batches)
+            for member in sorted(small, key=lambda member: member[2], reverse=True):
+                index = min(
+                    (index for index, batch in enumerate(batches) if len(batch) < 200), key=loads.__getitem__
+                )
+                batches[index].append(member)
+                loads[index] += member[2]
+            items.extend((None, members, load, None, load) for members, load in zip(batches, loads) if members)
+        else:
+            items.extend((relative_path, full_path, size, None, size) for relative_path, full_path, size in small)
+        items.sort(key=lambda item: item[4], reverse=True)
+
+        # Tar batches are extracted through a script that hashes each member as it lands
+        batched = [member for item in items if item[0] is None for member in item[1]]
+        hash_script = None
+        if self.verify_remote and batched:
+            hash_script = f"{self.supercomputer_path}/{author}/.{repo_name}.hash.sh"
+
+        # Create every directory, clear stale split temp files and install the hash script
+        # in one round trip
+        directories = sorted({posixpath.dirname(f"{remote_root}/{path}") for path, _, _ in files})
+        setup = " && ".join(
+            [f"mkdir -p {' '.join(shlex.quote(directory) for directory in directories)}"]
+            + [f"rm -f {shlex.quote(f'{remote_root}/{path}.incomplete')}" for path in pending_ranges]
+            + ([self.install_tar_hash_script(hash_script, [
+                path for path, _, _ in batched if oids.get(path, ("",))[0] == "sha256"
+            ])] if hash_script else [])
+        )
+        return_code, _, stderr = await self.run_remote(setup)
+        if return_code != 0:
+            raise Exception(f"Failed to prepare remote directories: {stderr.strip()}")
+
+        work: asyncio.Queue = asyncio.Queue()
+        for item in items:
+            work.put_nowait(item)
+        state = {"files": 0, "bytes": 0}
+        hashed: set = set()
+
+        def file_done(relative_path: str, size: int, announce: bool = True):
+            state["files"] += 1
+            if manifest is not None:
+                manifest.mark(relative_path, "uploaded")
+            meter.finish(relative_path)
+            if announce:
+                report_progress(f"Transferred {relative_path} ({self.format_bytes(size)})")
+
+        def report_progress(message: str):
+            self.update_progress(
+                progress_key,
+                "transferring",
+                message,
+                min(99, int(meter.sent / total_bytes * 100)) if total_bytes else None,
+                uploaded_bytes=meter.sent
+            )
+
+        async def upload_batch(members: List[tuple], stream: int):
+            # Compress the whole stream when most of its bytes were judged compressible
+            compress = sum(size for path, _, size in members if path in compressed) * 2 > sum(
+                size for _, _, size in members
+            )
+            paths = " ".join(shlex.quote(path) for path, _, _ in members)
+            label = f"batch of {len(members)} file{'s' if len(members) != 1 else ''}"
+            # tar runs the command from its own working directory, not the -C one
+            extract = "tar -xf -"
+            if hash_script is not None:
+                extract += f" --to-command={shlex.quote('sh ' + shlex.quote(hash_script))}"
+            with JobTimeline.span(label, "upload", stream=stream, compress=compress):
+                stdout = await self.pipe_to_remote(
+                    self.ssh_command(
+                        f"cd {shlex.quote(remote_root)} && {'zstd -dqc | ' if compress else ''}{extract} && "
+                        f"wc -c -- {paths}",
+                        stream
+                    ),
+                    self.tar_segments(members), progress_key, label, compress
+                )
+            # The hash script prints one digest line per member, ahead of the size listing
+            lines = stdout.decode().splitlines()
+            digests = [(line.split() or [None])[0] for line in lines[:len(members)]] if hash_script is not None else []
+            remote_sizes = [line.split(None, 1)[0] for line in lines[len(digests):len(digests) + len(members)]]
+            remote_sizes += [None] * (len(members) - len(remote_sizes))
+            for (relative_path, _, size), remote_size in zip(members, remote_sizes):
+                if remote_size != str(size):
+                    raise Exception(f"Remote size mismatch for {relative_path}: {remote_size} != {size}")
+            hashed.update(await self.check_remote_digests(author, repo_name, [
+                (relative_path, oids[relative_path][1], digest)
+                for (relative_path, _, _), digest in zip(members, digests) if relative_path in oids
+            ]))
+            for relative_path, _, size in members:
+                state["bytes"] += size
+                file_done(relative_path, size, announce=False)
+            # One update per batch; hundreds in a row would hold up the event loop
+            report_progress(f"Transferred {label} ({self.format_bytes(sum(size for _, _, size in members))})")
+
+        async def worker(stream: int):
+            while not work.empty():
+                relative_path, full_path, size, start, length = work.get_nowait()
+                if relative_path is None:
+                    await upload_batch(full_path, stream)
+                    continue
+                remote_file = f"{remote_root}/{relative_path}"
+                if start is None:
+                    oid = oids.get(relative_path)
+                    remote_size, remote_digest = await self.upload_file(
+                        full_path, author, repo_name, relative_path, oid, stream=stream,
+                        compress=relative_path in compressed
+                    )
+                    if remote_size != size:
+                        raise Exception(f"Remote size mismatch for {relative_path}: {remote_size} != {size}")
+                    if oid is not None:
+                        hashed.update(await self.check_remote_digests(
+                            author, repo_name, [(relative_path, oid[1], remote_digest)]
+                        ))
+                    state["bytes"] += size
+                    file_done(relative_path, size)
+                    continue
+
+                remote_temp = shlex.quote(f"{remote_file}.incomplete")
+                compress = relative_path in compressed
+                # split_size is a whole number of MiB, so every range starts on a 1 MiB block
+                write_cmd = f"dd of={remote_temp} bs=1048576 seek={start // 1048576} conv=notrunc 2>/dev/null"
+                range_hasher = hashlib.sha256() if self.verify_remote else None
+                if range_hasher is not None:
+                    # dd cannot tee, so the range is split off to it on fd 3 and hashed on the way
+                    write_cmd = (
+                        f"{{ {{ {'zstd -dqc' if compress else 'cat'} | tee /dev/fd/3 | sha256sum | cut -c1-64 >&4; }} "
+                        f"3>&1 | {write_cmd}; }} 4>&1"
+                    )
+                elif compress:
+                    write_cmd = f"zstd -dqc | {write_cmd}"
+
+                def on_read(chunk: bytes, offset: int, start=start, file_hasher=file_hashers.get(relative_path)):
+                    range_hasher.update(chunk)
+                    if file_hasher is not None:
+                        file_hasher.update(start, chunk, offset)
+
+                with JobTimeline.span(
+                    "upload_range", "range", path=relative_path, start=start, end=start + length - 1, stream=stream
+                ):
+                    stdout = await self.pipe_file_to_remote(
+                        self.ssh_command(write_cmd, stream),
+                        full_path, progress_key, f"{relative_path} @ {start}", start, length, compress,
+                        path=relative_path, on_read=on_read if range_hasher is not None else None
+                    )
+                if range_hasher is not None and stdout.decode().strip() != range_hasher.hexdigest():
+                    self.record_verification(progress_key, relative_path, "remote", False)
+                    await self.run_remote(f"rm -f {remote_temp}")
+                    raise Exception(f"Remote checksum mismatch for {relative_path} at byte {start}")
+                state["bytes"] += length
+                pending_ranges[relative_path] -= 1
+                if pending_ranges[relative_path]:
+                    continue
+                with JobTimeline.span("reassemble", path=relative_path):
+                    return_code, _, stderr = await self.run_remote(
+                        f"[ \"$(wc -c < {remote_temp})\" -eq {size} ] && "
+                        f"mv -f {remote_temp} {shlex.quote(remote_file)}"
+                    )
+                if return_code != 0:
+                    raise Exception(f"Reassembly of {relative_path} failed: {stderr.strip() or 'size mismatch'}")
+                # Every range matched the bytes sent, so the bytes read must match the oid
+                file_hasher = file_hashers.pop(relative_path, None)
+                if file_hasher is not None:
+                    digest = await asyncio.to_thread(file_hasher.finish)
+                    hashed.update(await self.check_remote_digests(
+                        author, repo_name, [(relative_path, oids[relative_path][1], digest)]
+                    ))
+                file_done(relative_path, size)
+
+        self.update_progress(
+            progress_key,
+            "transferring",
+            f"Uploading {len(files)} files ({self.format_bytes(total_bytes)}) over {streams} streams "
+            f"in {len(items)} parts...",
+            0
+        )
+        async with self.upload_telemetry(progress_key, total_bytes) as meter:
+            workers = [asyncio.create_task(worker(stream)) for stream in range(min(streams, len(items)))]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for task in workers:
+                    task.cancel()
+                if hash_script is not None:
+                    await self.run_remote(f"rm -f {shlex.quote(hash_script)}")
+        return state["files"], state["bytes"], hashed
+
+    async def pipelined_transfer(
+        self,
+        author: str,
+        repo_name: str,
+        selection: Optional[dict] = None,
+        skip_paths: Optional[set] = None,
+        verify: Optional[Callable[[set], Awaitable[None]]] = None
+    ) -> str:
+        """Download and upload concurrently, shipping each file as soon as it is complete.
+
+        Local copies are deleted once the remote size matches, so the staging disk only
+        holds files that are still waiting in the upload queue. A ``StagingWindow`` holds
+        back downloads while that queue is full, so the job stages no more than its window.
+        """
+        progress_key = f"{author}/{repo_name}"
+        manifest = self.manifests.get(progress_key)
+        await self.create_remote_directory(author, repo_name)
+
+        upload_queue: asyncio.Queue = asyncio.Queue()
+        state = {"download_finished": False, "uploaded_bytes": 0, "uploaded_files": 0}
+        hashed: set = set()
+        window = StagingWindow()
+
+        async def enqueue_upload(file_entry: dict, local_file: Path):
+            await upload_queue.put((file_entry, local_file))
+
+        async def upload_worker():
+            while True:
+                item = await upload_queue.get()
+                if item is None:
+                    return
+                file_entry, local_file = item
+
+                # Upload slots are taken per file so a waiting download never holds one
+                cache_key = BlobCache.key_for(file_entry) if self.verify_remote else None
+                oid = tuple(cache_key.split("/", 1)) if cache_key else None
+                compressed = await self.choose_compression(
+                    progress_key, [(file_entry["path"], local_file, local_file.stat().st_size)]
+                )
+                async with self.phase_slot("upload", progress_key, announce=False):
+                    remote_size, remote_digest = await self.upload_file(
+                        local_file, author, repo_name, file_entry["path"], oid,
+                        compress=bool(compressed)
+                    )
+                local_size = local_file.stat().st_size
+                if remote_size != local_size:
+                    raise Exception(
+                        f"Remote size mismatch for {file_entry['path']}: {remote_size} != {local_size}"
+                    )
+                if oid is not None:
+                    hashed.update(await self.check_remote_digests(
+                        author, repo_name, [(file_entry["path"], oid[1], remote_digest)]
+                    ))
+                if manifest is not None:
+                    manifest.mark(file_entry["path"], "uploaded")
+                local_file.unlink()
+                self.staging_disk.freed(progress_key, local_size)
+                await window.release(file_entry["size"] or 0)
+
+                state["uploaded_bytes"] += remote_size
+                state["uploaded_files"] += 1
+
+                progress_value = None
+                status = "cloning"
+                if state["download_finished"]:
+                    status = "transferring"
+                    total_bytes = self.download_progress.get(progress_key, {}).get("total_bytes")
+                    if total_bytes:
+                        progress_value = min(99, int(meter.sent / total_bytes * 100))
+
+                self.update_progress(
+                    progress_key,
+                    status,
+                    f"Transferred {file_entry['path']} ({self.format_bytes(remote_size)})",
+                    progress_value,
+                    uploaded_bytes=meter.sent
+                )
+
+        async def download_phase():
+            async with self.phase_slot("download", progress_key):
+                with self.metrics.phase("download"):
+                    return await self.download_repo_files(
+                        author, repo_name, file_callback=enqueue_upload, selection=selection,
+                        skip_paths=skip_paths, window=window
+                    )
+
+        async def upload_phase():
+            with self.metrics.phase("upload"):
+                await upload_worker()
+
+        upload_task = asyncio.create_task(upload_phase())
+        download_task = asyncio.create_task(download_phase())
+
+        def abort_download_on_upload_failure(task: asyncio.Task):
+            if not task.cancelled() and task.exception() is not None:
+                download_task.cancel()
+
+        upload_task.add_done_callback(abort_download_on_upload_failure)
+
+        try:
+            # Upload stats ride along with the download progress until the download is done
+            async with self.upload_telemetry(progress_key, None, drive_progress=False) as meter:
+                try:
+                    local_path = await download_task
+                except asyncio.CancelledError:
+                    if upload_task.done() and not upload_task.cancelled() and upload_task.exception():
+                        raise upload_task.exception()
+                    raise
+
+                state["download_finished"] = True
+                meter.drive_progress = True
+                self.update_progress(
+                    progress_key,
+                    "transferring",
+                    "Download finished; waiting for remaining uploads...",
+                    uploaded_bytes=meter.sent
+                )
+                await upload_queue.put(None)
+                await upload_task
+            if verify is not None and (state["uploaded_files"] or skip_paths):
+                await verify(hashed)
+        except Exception as e:
+            self.update_progress(progress_key, "error", f"Pipelined transfer failed: {str(e)}", 0)
+            self.cleanup_completed_progress(progress_key)
+            raise Exception(f"Failed to transfer files: {e}")
+        finally:
+            if not upload_task.done():
+                upload_task.cancel()
+
+        if state["uploaded_files"] == 0 and not skip_paths:
+            # The git clone fallback produces no per-file events; ship the tree in one go
+            with self.metrics.phase("upload"):
+                await self.scp_transfer(local_path, author, repo_name, verify)
+            return local_path
+
+        self.remote_inventory.mark_present(author, repo_name)
+        self.update_progress(
+            progress_key,
+            "transfer_complete",
+            f"Pipelined transfer completed: {state['uploaded_files']} files, "
+            f"{self.format_bytes(state['uploaded_bytes'])}",
+            100,
+            uploaded_bytes=state["uploaded_bytes"]
+        )
+        self.cleanup_completed_progress(progress_key)
+        return local_path
+
+    def read_local_range(
+        self,
+        path: Path,
+        start: int,
+        end: Optional[int],
+        consume: Callable[[bytes, int], None],
+        abort_event: threading.Event
+    ):
+        """Local-file counterpart of ``stream_byte_range``."""
+        offset = start
+        with open(path, "rb") as handle:
+            handle.seek(start)
+            while end is None or offset <= end:
+                if abort_event.is_set():
+                    raise Exception("Download aborted")
+                length = 1024 * 1024 if end is None else min(1024 * 1024, end + 1 - offset)
+                chunk = handle.read(length)
+                if not chunk:
+                    break
+                consume(chunk, offset)
+                offset += len(chunk)
+
+    def relay_read_range(
+        self,
+        source,
+        start: int,
+        end: Optional[int],
+        pool: BufferPool,
+        part_queue: queue.Queue,
+        abort_event: threading.Event,
+        progress_key: Optional[str] = None
+    ):
+        """Fill pooled buffers with one byte range and hand them, in order, to the relay writer.
+
+        ``source`` is a resolve URL, or a ``Path`` for blobs served from the local cache.
+        Puts ``(buffer, length)`` tuples on ``part_queue``, then ``None`` when the range is
+        done or the exception that stopped it.
+        """
+        state = {"buffer": None, "filled": 0}
+
+        def put(item):
+            while True:
+                if abort_event.is_set():
+                    raise Exception("Relay aborted")
+                try:
+                    part_queue.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+        def flush():
+            if state["buffer"] is not None and state["filled"]:
+                put((state["buffer"], state["filled"]))
+                state["buffer"] = None
+                state["filled"] = 0
+
+        def fill(chunk: bytes, offset: int):
+            view = memoryview(chunk)
+            while view:
+                if state["buffer"] is None:
+                    state["buffer"] = pool.acquire(abort_event)
+                    state["filled"] = 0
+                count = min(len(view), pool.buffer_size - state["filled"])
+                state["buffer"][state["filled"]:state["filled"] + count] = view[:count]
+                state["filled"] += count
+                view = view[count:]
+                if state["filled"] == pool.buffer_size:
+                    flush()
+
+        try:
+            if isinstance(source, Path):
+                self.read_local_range(source, start, end, fill, abort_event)
+            else:
+                self.stream_byte_range(source, start, end, fill, abort_event, progress_key)
+            flush()
+            put(None)
+        except Exception as err:
+            if state["buffer"] is not None:
+                pool.release(state["buffer"])
+            try:
+                put(err)
+            except Exception:
+                pass
+
+    def check_relay_digest(self, progress_key: str, entry: dict, oid: Optional[list], file_hasher):
+        """Compare a relayed file's streamed digest with its Hub oid; raises on mismatch."""
+        if file_hasher is None:
+            return
+        digest = file_hasher.hexdigest()
+        self.record_verification(progress_key, entry["path"], "download", digest == oid[1])
+        if digest != oid[1]:
+            raise Exception(f"Checksum mismatch for {entry['path']}: expected {oid[1]}, got {digest}")
+
+    async def relay_transfer(
+        self,
+        author: str,
+        repo_name: str,
+        selection: Optional[dict] = None,
+        skip_paths: Optional[set] = None,
+        verify: Optional[Callable[[set], Awaitable[None]]] = None
+    ):
+        """Stream Hub files straight into a remote ``tar -x`` over a single ssh session.
+
+        Nothing is written under ``LOCAL_DOWNLOAD_PATH``: readers fill buffers from a
+        fixed-size pool and the writer frames them as a tar stream in file order, so
+        memory stays bounded by ``RELAY_BUFFER_COUNT * RELAY_BUFFER_MB``. The stream is
+        hashed against the Hub oids on its way out, and with ``VERIFY_REMOTE`` the remote
+        ``tar`` hashes each file again as it writes it.
+        """
+        progress_key = f"{author}/{repo_name}"
+
+        metadata = await self.get_repo_metadata(author, repo_name, self.job_option(progress_key, "revision"))
+        if not metadata or not metadata["files"]:
+            raise Exception("Relay mode requires the Hub file list, which is unavailable")
+
+        files = self.select_repo_files(metadata["files"], selection)
+        if not files:
+            raise Exception("No repository files match the requested selection")
+        selection_note = self.describe_selection(files, metadata["files"])
+        if selection_note:
+            self.update_progress(progress_key, "transferring", selection_note, 0)
+        if skip_paths:
+            files = [entry for entry in files if entry["path"] not in skip_paths]
+            if not files:
+                if verify is not None:
+                    await verify(set())
+                self.remote_inventory.mark_present(author, repo_name)
+                self.update_progress(progress_key, "transfer_complete", "All files were already on the supercomputer", 100)
+                self.cleanup_completed_progress(progress_key)
+                return
+        if any(entry["size"] is None for entry in files):
+            raise Exception("Relay mode requires known file sizes")
+        revision = metadata["sha"] or "main"
+        expected_total_size = sum(entry["size"] for entry in files)
+
+        self.update_progress(
+            progress_key,
+            "transferring",
+            f"Starting relay of {len(files)} files to supercomputer...",
+            0,
+            total_bytes=expected_total_size,
+            downloaded_bytes=0,
+            uploaded_bytes=0
+        )
+
+        remote_dir = f"{self.supercomputer_path}/{author}/{repo_name}"
+        remote_cmd = f"mkdir -p {shlex.quote(remote_dir)} && tar -xf - -C {shlex.quote(remote_dir)}"
+        hash_script = None
+        if self.verify_remote:
+            hash_script = f"{self.supercomputer_path}/{author}/.{repo_name}.hash.sh"
+            return_code, _, stderr = await self.run_remote(
+                f"mkdir -p {shlex.quote(remote_dir)} && " + self.install_tar_hash_script(hash_script, [
+                    entry["path"] for entry in files if (BlobCache.key_for(entry) or "").startswith("sha256/")
+                ], check_size=True)
+            )
+            if return_code != 0:
+                raise Exception(f"Failed to prepare remote directory: {stderr.strip()}")
+            # tar runs the command from its own working directory, not the -C one
+            remote_cmd = (
+                f"cd {shlex.quote(remote_dir)} && "
+                f"tar -xf - --to-command={shlex.quote('sh ' + shlex.quote(hash_script))}; "
+                f"status=$?; rm -f {shlex.quote(hash_script)}; exit $status"
+            )
+        cmd = self.ssh_command(remote_cmd)
+        print(f"Starting relay for {author}/{repo_name} @ {revision}: {' '.join(cmd)}")
+
+        # Each in-flight range owns at most ``quota`` queued buffers plus the one it is filling,
+        # so sizing the pool this way means the range at the head of the stream never starves.
+        inflight = max(1, min(self.download_workers, self.relay_buffer_count // 2))
+        quota = max(1, self.relay_buffer_count // inflight - 1)
+        pool = BufferPool(inflight * (quota + 1), self.relay_buffer_size)
+
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE if hash_script is not None else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stderr_task = asyncio.create_task(process.stderr.read())
+        # One digest line per file from the hash script, read as it comes so the pipe never fills
+        stdout_task = asyncio.create_task(process.stdout.read()) if hash_script is not None else None
+
+        abort_event = threading.Event()
+        slots = asyncio.Semaphore(inflight)
+        ready: asyncio.Queue = asyncio.Queue()
+
+        async def start_readers():
+            for entry in files:
+                if entry["path"] in sources:
+                    source = sources[entry["path"]][1]
+                else:
+                    source = self.build_resolve_url(author, repo_name, entry["path"], revision)
+                ranges = self.split_byte_ranges(entry["size"]) if entry["size"] else []
+                if not ranges:
+                    await ready.put((entry, None, None, None))
+                    continue
+                for start, end in ranges:
+                    await slots.acquire()
+                    part_queue = queue.Queue(maxsize=quota)
+                    future = asyncio.ensure_future(self.run_range_worker(
+                        progress_key,
+                        self.relay_read_range,
+                        source,
+                        start,
+                        end,
+                        pool,
+                        part_queue,
+                        abort_event,
+                        progress_key,
+                        span={"path": entry["path"], "start": start, "end": end}
+                    ))
+                    await ready.put((entry, start, end, (part_queue, future)))
+            await ready.put(None)
+
+        # Cached blobs are read from disk; pinned so eviction cannot race the readers
+        sources = {}
+        for entry in files:
+            cache_key = BlobCache.key_for(entry)
+            cached_blob = self.blob_cache.lookup(cache_key)
+            if cached_blob is not None:
+                self.blob_cache.pin(cache_key)
+                sources[entry["path"]] = (cache_key, cached_blob)
+            else:
+                self.blob_cache.record_miss_bytes(entry["size"])
+        if sources:
+            print(f"Relaying {len(sources)} files from the blob cache")
+
+        starter_task = asyncio.create_task(start_readers())
+        relayed = 0
+        # Files are framed one after another, so their upload spans share the writer's lane
+        timeline = JobTimeline.current.get()
+        writer_lane = JobTimeline.lane.get()[1] if JobTimeline.lane.get() is not None else 0
+
+        async def send(data, entry: Optional[dict] = None):
+            process.stdin.write(data)
+            await process.stdin.drain()
+            await self.bandwidth.throttle(progress_key, "upload", len(data))
+            if entry is not None:
+                meter.advance(entry["path"], len(data), entry["size"])
+
+        try:
+            async with self.upload_telemetry(progress_key, expected_total_size) as meter:
+                while True:
+                    item = await ready.get()
+                    if item is None:
+                        break
+                    entry, start, end, reader = item
+
+                    if not start:
+                        header = tarfile.TarInfo(entry["path"])
+                        header.size = entry["size"]
+                        header.mode = 0o644
+                        header.mtime = int(time.time())
+                        await send(header.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape"))
+                        file_started = timeline.now() if timeline is not None else 0.0
+
+                        # Files go out in order, so the stream itself is hashed against the Hub oid
+                        cache_key = BlobCache.key_for(entry)
+                        oid = cache_key.split("/", 1) if cache_key else None
+                        file_hasher = None
+                        if oid is not None:
+                            file_hasher = hashlib.sha256() if oid[0] == "sha256" else hashlib.sha1()
+                            if oid[0] == "sha1":
+                                file_hasher.update(f"blob {entry['size']}\0".encode())
+
+                    last_range = end is None or end + 1 == entry["size"]
+                    if reader is not None:
+                        part_queue, future = reader
+                        # One buffer is held back so a file's last bytes are sent only after its
+                        # checksum passed; a corrupt file therefore never lands remotely at full size
+                        held = None
+                        try:
+                            while True:
+                                chunk = await asyncio.to_thread(part_queue.get)
+                                if chunk is None:
+                                    break
+                                if isinstance(chunk, Exception):
+                                    raise chunk
+                                if file_hasher is not None:
+                                    file_hasher.update(memoryview(chunk[0])[:chunk[1]])
+                                if held is not None:
+                                    await send(memoryview(held[0])[:held[1]], entry)
+                                    relayed += held[1]
+                                    pool.release(held[0])
+                                held = chunk
+                            await future
+                            slots.release()
+
+                            if last_range:
+                                self.check_relay_digest(progress_key, entry, oid, file_hasher)
+                            if held is not None:
+                                await send(memoryview(held[0])[:held[1]], entry)
+                                relayed += held[1]
+                        finally:
+                            if held is not None:
+                                pool.release(held[0])
+                    elif last_range:
+                        self.check_relay_digest(progress_key, entry, oid, file_hasher)
+
+                    if last_range:
+                        padding = -entry["size"] % tarfile.BLOCKSIZE
+                        if padding:
+                            await send(bytes(padding))
+                        meter.finish(entry["path"])
+                        if timeline is not None:
+                            timeline.add(entry["path"], "upload", file_started, timeline.now(), writer_lane)
+
+                # End-of-archive marker: two zero blocks
+                await send(bytes(tarfile.BLOCKSIZE * 2))
+                process.stdin.close()
+                return_code = await process.wait()
+                stderr = (await stderr_task).decode(errors="ignore").strip()
+                if return_code != 0:
+                    raise Exception(f"Remote tar exited with code {return_code}: {stderr}")
+            hashed: set = set()
+            if stdout_task is not None:
+                digests = [(line.split() or [None])[0] for line in (await stdout_task).decode(errors="ignore").splitlines()]
+                results = []
+                for entry, digest in zip(files, digests + [None] * (len(files) - len(digests))):
+                    cache_key = BlobCache.key_for(entry)
+                    if cache_key:
+                        results.append((entry["path"], cache_key.split("/", 1)[1], digest))
+                hashed = await self.check_remote_digests(author, repo_name, results)
+            if verify is not None:
+                await verify(hashed)
+        except BaseException as e:
+            abort_event.set()
+            starter_task.cancel()
+            if process.returncode is None:
+                process.kill()
+            if isinstance(e, (BrokenPipeError, ConnectionResetError)):
+                await process.wait()
+                stderr = (await stderr_task).decode(errors="ignore").strip()
+                e = Exception(f"Remote writer closed the stream: {stderr}")
+            if isinstance(e, Exception):
+                self.update_progress(progress_key, "error", f"Relay transfer failed: {str(e)}", 0)
+                self.cleanup_completed_progress(progress_key)
+                raise Exception(f"Failed to relay files: {e}")
+            raise
+        finally:
+            for cache_key, _ in sources.values():
+                self.blob_cache.unpin(cache_key)
+
+        self.remote_inventory.mark_present(author, repo_name)
+        self.update_progress(
+            progress_key,
+            "transfer_complete",
+            f"Relay completed: {len(files)} files, {self.format_bytes(relayed)}",
+            100,
+            downloaded_bytes=relayed,
+            uploaded_bytes=relayed
+        )
+        self.cleanup_completed_progress(progress_key)
+
+    def cleanup_local_files(self, local_path: str):
+        """Remove local files after successful transfer (deleted in the background by ``staging_gc``)"""
+        try:
+            self.staging_gc.discard(local_path)
+        except Exception as e:
+            print(f"Warning: Failed to cleanup local files: {e}")
+
+    def remove_git_directory(self, repo_path: str):
+        """Delete the .git directory before transfer to reduce payload size."""
+        try:
+            git_dir = Path(repo_path) / ".git"
+            # Only delete if the path lives under our managed download root
+            if git_dir.exists() and git_dir.is_dir():
+                git_dir_relative = git_dir.resolve().relative_to(self.local_download_path.resolve())
+                print(f"Removing git metadata: {git_dir}")
+                self.staging_gc.discard(git_dir, "git")
+                return str(git_dir_relative)
+        except ValueError:
+            # Path is outside our managed download directory; skip removal for safety
+            print(f"Skipping .git removal for unmanaged path: {repo_path}")
+        except Exception as e:
+            print(f"Warning: Failed to remove .git directory: {e}")
+        return None
+
+    async def reserve_staging(self, progress_key: str, amount: int):
+        """Reserve ``amount`` bytes of staging disk for the job, queued while it doesn't fit."""
+        def on_wait(needed: int, available: int):
+            self.update_progress(
+                progress_key,
+                "queued",
+                f"Waiting for staging disk space: needs {self.format_bytes(needed)}, "
+                f"{self.format_bytes(available)} available"
+            )
+
+        with JobTimeline.span("staging_disk", "wait") if not self.staging_disk.fits(amount) else nullcontext():
+            await self.staging_disk.reserve(progress_key, amount, self.bandwidth.priority(progress_key), on_wait)
+
+    @asynccontextmanager
+    async def phase_slot(self, phase: str, progress_key: Optional[str] = None, announce: bool = True):
+        """Hold one of the global ``download``/``upload`` phase slots.
+
+        Waiters are admitted by the priority of the job owning ``progress_key``. When the
+        phase is saturated and ``announce`` is set, the job is shown as queued.
+        """
+        slots = self.download_slots if phase == "download" else self.upload_slots
+        if progress_key is not None and announce and slots.locked():
+            self.update_progress(progress_key, "queued", f"Waiting for a free {phase} slot...")
+        with JobTimeline.span(f"{phase}_slot", "wait") if slots.locked() else nullcontext():
+            await slots.acquire(self.bandwidth.priority(progress_key))
+        try:
+            yield
+        finally:
+            slots.release()
+
+    @asynccontextmanager
+    async def upload_telemetry(self, progress_key: str, total: Optional[int], drive_progress: bool = True):
+        """Meter the job's uploads and publish structured stats while the block runs.
+
+        With ``drive_progress`` the stats also set the transferring message and the
+        percentage against ``total``; otherwise (a pipelined job still downloading) they
+        ride along on the entry's current status. The final totals go to the job report.
+        """
+        meter = UploadMeter(total, self.upload_stats_smoothing, drive_progress)
+        self.upload_meters[progress_key] = meter
+        publisher = asyncio.create_task(self.publish_upload_stats(progress_key, meter))
+        try:
+            yield meter
+        finally:
+            publisher.cancel()
+            if self.upload_meters.get(progress_key) is meter:
+                del self.upload_meters[progress_key]
+            entry = self.download_progress.get(progress_key)
+            if entry is not None:
+                self.update_progress(
+                    progress_key, entry["status"], entry["message"], upload=meter.sample(), append_log=False
+                )
+            elapsed = time.monotonic() - meter.started
+            self.job_report(progress_key)["upload"] = {
+                "bytes": meter.sent,
+                "files": meter.files_done,
+                "seconds": round(elapsed, 3),
+                "average_rate": meter.sent / elapsed if elapsed > 0 else 0.0,
+            }
+
+    async def publish_upload_stats(self, progress_key: str, meter: UploadMeter, log_interval: float = 5.0):
+        """Publish ``meter`` every ``UPLOAD_STATS_INTERVAL`` while bytes are moving."""
+        last_sent = None
+        last_rate = None
+        last_logged = time.monotonic()
+        while True:
+            await asyncio.sleep(self.upload_stats_interval)
+            entry = self.download_progress.get(progress_key, {})
+            if meter.total is None:
+                meter.total = entry.get("total_bytes")
+            stats = meter.sample()
+            # An idle meter is published once more so the rate visibly drops to zero
+            if stats["sent_bytes"] == last_sent and last_rate == 0:
+                continue
+            last_sent, last_rate = stats["sent_bytes"], stats["rate"]
+
+            if not meter.drive_progress:
+                self.update_progress(
+                    progress_key,
+                    entry.get("status", "transferring"),
+                    entry.get("message", ""),
+                    uploaded_bytes=stats["sent_bytes"],
+                    upload=stats,
+                    append_log=False
+                )
+                continue
+
+            message = f"Uploading... {self.format_bytes(stats['sent_bytes'])}"
+            if stats["total_bytes"]:
+                message += f" / {self.format_bytes(stats['total_bytes'])}"
+            message += f" at {self.format_bytes(int(stats['smoothed_rate'] or 0))}/s"
+            if stats["eta_seconds"] is not None:
+                message += f", ETA {int(stats['eta_seconds'])}s"
+            now = time.monotonic()
+            append_log = now - last_logged >= log_interval
+            if append_log:
+                last_logged = now
+            self.update_progress(
+                progress_key,
+                "transferring",
+                message,
+                min(99, stats["percent"]) if stats["percent"] is not None else None,
+                uploaded_bytes=stats["sent_bytes"],
+                upload=stats,
+                append_log=append_log
+            )
+
+    async def link_remote_duplicates(self, author: str, repo_name: str, files: List[dict]) -> tuple:
+        """Hardlink (or remote-copy) files whose content is already on the supercomputer.
+
+        Candidates come from the remote hash index and are checked by size on the remote
+        side before linking. Returns ``(linked paths, bytes saved)``; stale entries are
+        dropped from the index.
+        """
+        repo_prefix = f"{author}/{repo_name}/"
+        candidates = []
+        for entry in files:
+            key = BlobCache.key_for(entry)
+            source = self.remote_hash_index.lookup(key)
+            if source and entry["size"] and not source.startswith(repo_prefix):
+                candidates.append((entry, key, source))
+        if not candidates:
+            return set(), 0
+
+        lines = []
+        for index, (entry, _, source) in enumerate(candidates):
+            source_file = shlex.quote(f"{self.supercomputer_path}/{source}")
+            target = f"{self.supercomputer_path}/{repo_prefix}{entry['path']}"
+            target_file = shlex.quote(target)
+            temp_file = shlex.quote(f"{target}.incomplete")
+            lines.append(
+                f'if [ -f {source_file} ] && [ "$(wc -c < {source_file})" -eq {entry["size"]} ]; then '
+                f"mkdir -p {shlex.quote(posixpath.dirname(target))} && "
+                f"{{ ln -f {source_file} {temp_file} 2>/dev/null || cp {source_file} {temp_file}; }} && "
+                f"mv -f {temp_file} {target_file} && echo linked {index}; fi"
+            )
+
+        returncode, stdout, stderr = await self.run_remote("\n".join(lines))
+        if returncode == 255:
+            print(f"Remote dedup skipped, ssh failed: {stderr.strip()}")
+            return set(), 0
+
+        linked_indexes = {
+            int(line.split()[1]) for line in stdout.splitlines() if line.startswith("linked ")
+        }
+        linked = set()
+        saved_bytes = 0
+        for index, (entry, key, _) in enumerate(candidates):
+            if index in linked_indexes:
+                linked.add(entry["path"])
+                saved_bytes += entry["size"]
+            else:
+                self.remote_hash_index.forget(key)
+        return linked, saved_bytes
+
+    async def verify_remote_files(self, author: str, repo_name: str, files: List[dict]) -> set:
+        """Return the paths whose remote copy already has the expected size (one ssh round trip)."""
+        sized = [entry for entry in files if entry["size"] is not None]
+        if not sized:
+            return set()
+
+        repo_dir = f"{self.supercomputer_path}/{author}/{repo_name}"
+        remote_cmd = "\n".join(
+            f"wc -c < {shlex.quote(repo_dir + '/' + entry['path'])} 2>/dev/null || echo -1"
+            for entry in sized
+        )
+        returncode, stdout, stderr = await self.run_remote(remote_cmd)
+        sizes = stdout.split()
+        if returncode == 255 or len(sizes) != len(sized):
+            print(f"Remote verification unavailable for {author}/{repo_name}: {stderr.strip()}")
+            return set()
+        return {entry["path"] for entry, size in zip(sized, sizes) if size == str(entry["size"])}
+
+    async def plan_sync(
+        self, author: str, repo_name: str, sha: str, files: List[dict], tree: List[dict], report: dict
+    ) -> tuple:
+        """Diff ``files`` (the selected listing at ``sha``) against the delivered revision.
+
+        Returns ``(unchanged paths, removed paths)``. Unchanged files have the same content
+        key as at the delivered revision and the expected size remotely. Removed files are
+        delivered paths gone from ``tree``, the full listing at ``sha``: a narrower
+        selection decides what is sent, never what is deleted. Without a ledger entry (a
+        repo delivered before revisions were recorded) LFS files whose remote size matches
+        are kept, and small files, which can change in place, are sent again.
+        """
+        progress_key = f"{author}/{repo_name}"
+        record = self.revision_ledger.lookup(progress_key)
+
+        if record is None:
+            candidates = [entry for entry in files if entry.get("sha256")]
+            removed: List[str] = []
+        else:
+            delivered = record["files"]
+            candidates = [
+                entry for entry in files
+                if BlobCache.key_for(entry) and delivered.get(entry["path"], [None])[0] == BlobCache.key_for(entry)
+            ]
+            present = {entry["path"] for entry in tree}
+            removed = sorted(path for path in delivered if path not in present)
+        # A remote file removed or truncated by hand since delivery is sent again
+        unchanged = await self.verify_remote_files(author, repo_name, candidates) if candidates else set()
+
+        added = [
+            entry["path"] for entry in files
+            if record is not None and entry["path"] not in record["files"]
+        ]
+        changed = [entry["path"] for entry in files if entry["path"] not in unchanged]
+        report["sync"] = {
+            "from": record["sha"] if record else None,
+            "to": sha,
+            "unchanged": len(unchanged),
+            "changed": len(changed) - len(added),
+            "added": len(added),
+            "removed": len(removed),
+        }
+        changed_bytes = sum(entry["size"] or 0 for entry in files if entry["path"] not in unchanged)
+        self.update_progress(
+            progress_key,
+            "transferring",
+            f"Sync {(record['sha'][:12] if record else 'unknown revision')} -> {sha[:12]}: "
+            f"{len(changed)} changed or added ({self.format_bytes(changed_bytes)}), "
+            f"{len(removed)} removed, {len(unchanged)} unchanged"
+        )
+        return unchanged, removed
+
+    async def remove_remote_files(self, author: str, repo_name: str, paths: List[str]):
+        """Delete files dropped by a sync, then any directories they leave empty."""
+        repo_dir = f"{self.supercomputer_path}/{author}/{repo_name}"
+        remote_cmd = (
+            f"cd {shlex.quote(repo_dir)} && "
+            f"rm -f -- {' '.join(shlex.quote(path) for path in paths)} && "
+            "find . -mindepth 1 -type d -empty -delete"
+        )
+        return_code, _, stderr = await self.run_remote(remote_cmd)
+        if return_code != 0:
+            raise Exception(f"Failed to remove {len(paths)} files on the supercomputer: {stderr.strip()}")
+
+        record = self.revision_ledger.lookup(f"{author}/{repo_name}")
+        for path in paths:
+            key = record["files"][path][0] if record and path in record["files"] else None
+            if key and self.remote_hash_index.lookup(key) == f"{author}/{repo_name}/{path}":
+                self.remote_hash_index.forget(key)
+
+    async def verify_remote_copies(self, author: str, repo_name: str, files: List[dict]):
+        """Hash remote copies against their Hub oids, ``VERIFY_PARALLELISM`` files at a time.
+
+        This second read of the remote copies is the exception: every other upload path
+        hashes on the remote side as it writes. It covers the single-stream ``scp -r``
+        upload (including a staged git clone), which cannot, and files found on the
+        supercomputer by size alone when a job resumes. Mismatching copies are deleted
+        so a retry sends them again.
+        """
+        progress_key = f"{author}/{repo_name}"
+        repo_dir = f"{self.supercomputer_path}/{author}/{repo_name}"
+        checks = []
+        for entry in files:
+            cache_key = BlobCache.key_for(entry)
+            if cache_key and entry["size"] is not None:
+                algo, digest = cache_key.split("/", 1)
+                checks.append((entry, algo, digest))
+        if not checks:
+            return
+
+        self.update_progress(
+            progress_key,
+            "transferring",
+            f"Verifying {len(checks)} files on the supercomputer..."
+        )
+        groups = [[] for _ in range(min(self.verify_parallelism, len(checks)))]
+        for index, (entry, algo, _) in enumerate(checks):
+            source = f"cat {shlex.quote(repo_dir + '/' + entry['path'])} 2>/dev/null"
+            pipeline = self.remote_hash_pipeline(algo, entry["size"], source)
+            groups[index % len(groups)].append(f'echo "{index} $({pipeline})"')
+        remote_cmd = "\n".join(f"( {'; '.join(group)} ) &" for group in groups) + "\nwait"
+
+        returncode, stdout, stderr = await self.run_remote(remote_cmd)
+        if returncode == 255:
+            raise Exception(f"Remote verification failed: {stderr.strip()}")
+
+        remote_digests = {}
+        for line in stdout.splitlines():
+            parts = line.split()
+            if parts and parts[0].isdigit():
+                remote_digests[int(parts[0])] = parts[1] if len(parts) > 1 else ""
+
+        await self.check_remote_digests(author, repo_name, [
+            (entry["path"], digest, remote_digests.get(index)) for index, (entry, _, digest) in enumerate(checks)
+        ])
+        self.update_progress(progress_key, "transferring", f"Verified {len(checks)} files on the supercomputer")
+
+    async def transfer_repo(
+        self,
+        author: str,
+        repo_name: str,
+        mode: str,
+        selection: Optional[dict] = None,
+        report: Optional[dict] = None,
+        sync: bool = False
+    ) -> Optional[str]:
+        """Run one download+transfer in ``mode``; returns the local staging path, if any.
+
+        ``selection`` (include/exclude globs, format policy) limits which repo files are sent.
+        Files whose content is already on the supercomputer are linked there instead of
+        being transferred, and a resumed job skips files an earlier attempt delivered.
+        With ``sync`` only files changed since the delivered revision are sent and files
+        gone from the new head are deleted remotely. Job-level figures such as
+        ``bytes_saved`` go into ``report``.
+        """
+        progress_key = f"{author}/{repo_name}"
+        report = report if report is not None else {}
+
+        metadata = await self.get_repo_metadata(author, repo_name, self.job_option(progress_key, "revision"))
+        files = self.select_repo_files(metadata["files"], selection) if metadata else []
+        manifest = self.manifests.get(progress_key)
+        if manifest is not None and metadata:
+            manifest.bind_revision(metadata["sha"] or "main")
 
+        delivered: set = set()
+        confirmed: set = set()
+        if files and manifest is not None and manifest.data["attempts"] > 1:
+            # Uploads an earlier attempt confirmed are skipped as recorded; only the
+            # rest are looked up remotely
+            uploaded = manifest.paths_with("uploaded")
+            confirmed = {entry["path"] for entry in files if entry["path"] in uploaded}
+            delivered = set(confirmed)
+            unmarked = [entry for entry in files if entry["path"] not in uploaded]
+            found = await self.verify_remote_files(author, repo_name, unmarked) if unmarked else set()
+            for path in found:
+                manifest.mark(path, "uploaded")
+            delivered |= found
+            report["resumed_files"] = len(delivered)
+            if delivered:
                 self.update_progress(
                     progress_key,
-                    "cloning",
-                    message,
-                    progress_value,
-                    downloaded_bytes=effective_size
+                    "transferring",
+                    f"Resuming: {len(delivered)} of {len(files)} files already delivered by an earlier attempt"
                 )
-                last_reported_size = size_bytes
-
-            try:
-                await asyncio.wait_for(stop_event.wait(), timeout=interval_seconds)
-                break
-            except asyncio.TimeoutError:
-                continue
-
-        # Final size update after clone completes
-        final_size = await asyncio.to_thread(self.get_directory_size, repo_path)
-        if final_size != last_reported_size:
-            message: str
-            progress_value: Optional[int] = None
-            effective_final = final_size
 
-            if expected_total and expected_total > 0:
-                clamped = min(final_size, expected_total)
-                ratio = clamped / expected_total
-                progress_value = min(99, int(ratio * 100))
-                message = (
-                    f"Downloading files... {self.format_bytes(clamped)} / "
-                    f"{self.format_bytes(expected_total)}"
+        unchanged: set = set()
+        removed: List[str] = []
+        if sync:
+            if not metadata or not metadata["sha"]:
+                raise Exception("Hub file list unavailable; cannot sync")
+            with JobTimeline.span("plan_sync"):
+                unchanged, removed = await self.plan_sync(
+                    author, repo_name, metadata["sha"], files, metadata["files"], report
                 )
-                effective_final = clamped
-            else:
-                message = f"Downloading files... {self.format_bytes(final_size)}"
-
-            if progress_value is None:
-                current = self.download_progress.get(progress_key, {})
-                current_progress = current.get("progress", 0)
-                if final_size > 0:
-                    progress_value = min(99, max(current_progress, 1))
-                else:
-                    progress_value = current_progress
+            if len(unchanged) == len(files) and not removed:
+                self.remote_inventory.mark_present(author, repo_name)
+                self.update_progress(
+                    progress_key, "transfer_complete", f"Already up to date at {metadata['sha'][:12]}", 100
+                )
+                self.cleanup_completed_progress(progress_key)
+                await asyncio.to_thread(
+                    self.record_delivery, progress_key, metadata["sha"], files, selection, metadata["files"]
+                )
+                return None
 
-            self.update_progress(
-                progress_key,
-                "cloning",
-                message,
-                progress_value,
-                downloaded_bytes=effective_final
-            )
+        linked: set = set()
+        if self.remote_dedup and self.remote_hash_index.entries and files:
+            pending = [entry for entry in files if entry["path"] not in delivered | unchanged]
+            with self.metrics.phase("remote_link"):
+                linked, saved_bytes = await self.link_remote_duplicates(author, repo_name, pending)
+            report["linked_files"] = len(linked)
+            report["bytes_saved"] = saved_bytes
+            if linked:
+                self.update_progress(
+                    progress_key,
+                    "transferring",
+                    f"Linked {len(linked)} files already on the supercomputer "
+                    f"({self.format_bytes(saved_bytes)} not transferred)"
+                )
 
-    def check_if_exists_on_supercomputer(self, author: str, repo_name: str) -> bool:
-        """Check if model already exists on supercomputer"""
-        remote_path = f"{self.supercomputer_path}/{author}/{repo_name}"
+        # Uploads are hashed remotely in flight; the transfer mode hands ``verify`` the paths
+        # it hashed that way, and only the rest get a parallel pass before it reports
+        # completion. Uploads the manifest confirmed were hashed by the attempt that sent them.
+        verify = None
+        unverified = [entry for entry in files if entry["path"] not in unchanged | linked | confirmed]
+        if self.verify_remote and unverified:
+            async def verify_fn(hashed: set):
+                pending = [entry for entry in unverified if entry["path"] not in hashed]
+                if pending:
+                    with self.metrics.phase("verify"):
+                        await self.verify_remote_copies(author, repo_name, pending)
 
-        try:
-            cmd = [
-                "ssh",
-                f"{self.supercomputer_user}@{self.supercomputer_host}",
-                f"test -d {remote_path}"
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            return result.returncode == 0
-        except Exception as e:
-            print(f"Error checking remote directory: {e}")
-            return False
+            verify = verify_fn
 
-    async def git_clone_repo(self, author: str, repo_name: str) -> str:
-        """Clone HuggingFace repository"""
-        repo_url = f"https://huggingface.co/{author}/{repo_name}"
-        local_repo_path = self.local_download_path / f"{author}_{repo_name}"
-        progress_key = f"{author}/{repo_name}"
+        local_path = await self.run_transfer_mode(
+            author, repo_name, mode, selection, delivered | linked | unchanged, verify
+        )
+        if removed:
+            await self.remove_remote_files(author, repo_name, removed)
 
-        print(f"Starting git clone for {author}/{repo_name}")
-        print(f"Repository URL: {repo_url}")
-        print(f"Local path: {local_repo_path}")
+        # Remember where each delivered file now lives for future jobs
+        for entry in files:
+            if entry["path"] not in linked:
+                self.remote_hash_index.record(BlobCache.key_for(entry), f"{author}/{repo_name}/{entry['path']}")
+        await asyncio.to_thread(
+            self.record_delivery, progress_key, metadata["sha"] if metadata else None, files, selection,
+            metadata["files"] if metadata else []
+        )
+        return local_path
 
-        if progress_key in self.download_progress:
-            print(f"Resetting existing progress entry for {progress_key}")
-            del self.download_progress[progress_key]
-            self.save_progress_to_file()
+    def record_delivery(
+        self, repo_key: str, sha: Optional[str], files: List[dict], selection: Optional[dict], tree: List[dict]
+    ):
+        """Persist what a finished transfer left on the supercomputer.
 
-        expected_total_size = await self.get_repo_total_size(author, repo_name)
-        if expected_total_size:
-            print(f"Estimated repository size: {expected_total_size} bytes")
+        Files delivered earlier that are still in ``tree`` but outside this selection stay
+        on the supercomputer untouched, so they keep their earlier ledger entry.
+        """
+        if sha and files:
+            record = self.revision_ledger.lookup(repo_key)
+            present = {entry["path"] for entry in tree}
+            selected = {entry["path"] for entry in files}
+            kept = {
+                path: delivered for path, delivered in (record["files"] if record else {}).items()
+                if path in present and path not in selected
+            }
+            self.revision_ledger.record(repo_key, sha, files, selection, kept)
         else:
-            print("Repository size metadata unavailable; tracking progress using downloaded bytes only.")
+            # A git clone fallback leaves no file list to diff against
+            self.revision_ledger.forget(repo_key)
+        self.revision_ledger.save()
+        self.remote_hash_index.save()
 
-        self.update_progress(
-            progress_key,
-            "cloning",
-            "Starting git clone...",
-            0,
-            total_bytes=expected_total_size,
-            downloaded_bytes=0
-        )
+    async def run_transfer_mode(
+        self,
+        author: str,
+        repo_name: str,
+        mode: str,
+        selection: Optional[dict],
+        skip_paths: set,
+        verify: Optional[Callable[[set], Awaitable[None]]] = None
+    ) -> Optional[str]:
+        """Move the selected files not in ``skip_paths`` with the given transfer mode.
 
-        # Remove existing directory if it exists
-        if local_repo_path.exists():
-            print(f"Removing existing directory: {local_repo_path}")
-            shutil.rmtree(local_repo_path)
+        ``verify`` is awaited after the data is on the supercomputer and before the
+        transfer is reported complete, with the paths the mode already hashed remotely.
+        """
+        progress_key = f"{author}/{repo_name}"
+
+        if mode == "relay":
+            # Hub -> ssh stream, nothing staged locally
+            async with self.phase_slot("download", progress_key), self.phase_slot("upload", progress_key):
+                with self.metrics.phase("relay"):
+                    await self.relay_transfer(author, repo_name, selection, skip_paths, verify)
+            return None
 
+        local_path = None
         try:
-            stop_event = asyncio.Event()
-            monitor_task = asyncio.create_task(
-                self.monitor_download_progress(local_repo_path, progress_key, expected_total_size, stop_event)
-            )
+            if mode == "pipelined":
+                # Steps 1+2 overlapped: each file is uploaded as soon as it is downloaded
+                local_path = await self.pipelined_transfer(author, repo_name, selection, skip_paths, verify)
+            else:
+                # Step 1: Download repository files
+                async with self.phase_slot("download", progress_key):
+                    with self.metrics.phase("download"):
+                        local_path = await self.download_repo_files(
+                            author, repo_name, selection=selection, skip_paths=skip_paths
+                        )
 
-            process = None
-            stderr_task = None
-            stdout_task = None
-            success = False
+                # Step 2: Transfer to supercomputer
+                async with self.phase_slot("upload", progress_key):
+                    with self.metrics.phase("upload"):
+                        await self.scp_transfer(local_path, author, repo_name, verify)
 
-            try:
-                cmd = ["git", "clone", "--progress", repo_url, str(local_repo_path)]
-                print(f"Executing command: {' '.join(cmd)}")
+            # Step 3: Cleanup local files
+            with self.metrics.phase("cleanup"):
+                self.cleanup_local_files(local_path)
+            return local_path
+        except Exception:
+            # Cleanup on error, unless the manifest can resume from the staged files
+            manifest = self.manifests.get(progress_key)
+            if local_path is not None and not (manifest is not None and manifest.data["files"]):
+                self.cleanup_local_files(local_path)
+            raise
+        finally:
+            self.staging_disk.release(progress_key)
 
-                process = await asyncio.create_subprocess_exec(
-                    *cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
+    def submit_job(
+        self,
+        author: str,
+        repo_name: str,
+        mode: str,
+        selection: Optional[dict] = None,
+        priority: int = 0,
+        rate_limits: Optional[dict] = None,
+        upload_streams: Optional[int] = None,
+        sync: bool = False,
+        revision: Optional[str] = None,
+        compression: Optional[str] = None
+    ) -> tuple:
+        """Queue a transfer job, or attach to the one already running for this repo.
 
-                async def relay_stream(stream, label: str):
-                    if not stream:
-                        return
-                    async for line in stream:
-                        text = line.decode().strip()
-                        if text:
-                            print(f"Git clone {label}: {text}")
+        Higher ``priority`` jobs are admitted to job and phase slots first and get a larger
+        share of limited bandwidth. ``rate_limits`` maps ``download``/``upload`` to a
+        per-job cap in bytes/s (``None`` lifts the default cap). ``upload_streams``
+        overrides ``UPLOAD_STREAMS`` for staged uploads. ``revision`` (branch, tag or commit
+        sha) replaces the Hub head, and a ``sync`` job updates an existing remote copy to
+        it. ``compression`` overrides ``UPLOAD_COMPRESSION``. Returns ``(job, created)``.
+        """
+        progress_key = f"{author}/{repo_name}"
 
-                stderr_task = asyncio.create_task(relay_stream(process.stderr, "stderr"))
-                stdout_task = asyncio.create_task(relay_stream(process.stdout, "stdout"))
+        existing_id = self.active_jobs.get(progress_key)
+        if existing_id is not None:
+            return self.jobs[existing_id], False
 
-                await process.wait()
-                success = process.returncode == 0
+        # Forget finished jobs past their retention window
+        current_time = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.get("finished_at") and current_time - job["finished_at"] > self.job_retention:
+                del self.jobs[job_id]
+                self.timelines.pop(job_id, None)
 
-            finally:
-                stop_event.set()
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "key": progress_key,
+            "author": author,
+            "repo_name": repo_name,
+            "mode": mode,
+            "selection": selection,
+            "priority": priority,
+            "rate_limits": rate_limits or {},
+            "upload_streams": upload_streams,
+            "sync": sync,
+            "revision": revision,
+            "compression": compression,
+            "report": {},
+            "status": "queued",
+            "created_at": current_time,
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+        }
+        self.jobs[job["id"]] = job
+        self.active_jobs[progress_key] = job["id"]
 
-                for task in (stderr_task, stdout_task):
-                    if task:
-                        task.cancel()
-                await asyncio.gather(
-                    *(task for task in (stderr_task, stdout_task) if task),
-                    return_exceptions=True
-                )
+        # Reuse the checkpoint of an interrupted or failed attempt at this repo
+        manifest = self.manifests.get(progress_key)
+        if manifest is None:
+            manifest = JobManifest(self.manifest_dir / f"{urllib.parse.quote(progress_key, safe='')}.json")
+            self.manifests[progress_key] = manifest
+        manifest.begin(job)
+        job["attempt"] = manifest.data["attempts"]
+        job["bandwidth"] = self.bandwidth.register(progress_key, priority, rate_limits)
+
+        # A new job starts from a clean progress entry
+        if progress_key in self.download_progress:
+            print(f"Resetting existing progress entry for {progress_key}")
+            self.progress_store.delete(progress_key)
+        self.update_progress(progress_key, "queued", f"Queued as job {job['id']}", 0)
 
+        task = asyncio.create_task(self.run_job(job))
+        self.job_tasks.add(task)
+        task.add_done_callback(self.job_tasks.discard)
+        return job, True
+
+    async def run_job(self, job: dict):
+        """Run a queued job once a global job slot is free."""
+        timeline = JobTimeline(job["id"], job["key"], job["created_at"])
+        self.timelines[job["id"]] = timeline
+        JobTimeline.current.set(timeline)
+        try:
+            async with self.job_slots.slot(job["priority"]):
+                job["status"] = "running"
+                job["started_at"] = time.time()
+                timeline.add("queued", "wait", 0.0, timeline.now())
+                print(f"Job {job['id']} started: {job['key']} ({job['mode']})")
+                with self.metrics.phase("job"):
+                    job["local_path"] = await self.transfer_repo(
+                        job["author"], job["repo_name"], job["mode"], job["selection"], job["report"], job["sync"]
+                    )
+                job["status"] = "completed"
+            manifest = self.manifests.pop(job["key"], None)
+            if manifest is not None:
+                manifest.delete()
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            print(f"Job {job['id']} failed: {e}")
+            # Kept for a retry, which resumes instead of starting over
+            manifest = self.manifests.get(job["key"])
+            if manifest is not None:
+                manifest.set_state("failed")
+        finally:
+            job["finished_at"] = time.time()
+            timeline.finished_at = job["finished_at"]
+            if job["status"] in ("completed", "failed"):
+                self.metrics.inc("jobs_finished_total", status=job["status"])
+            if self.active_jobs.get(job["key"]) == job["id"]:
+                del self.active_jobs[job["key"]]
+                self.bandwidth.unregister(job["key"])
+            if self.timeline_retention:
                 try:
-                    await monitor_task
-                except asyncio.CancelledError:
-                    pass
+                    await asyncio.to_thread(self.save_timeline, timeline.to_dict())
+                except Exception as e:
+                    print(f"Failed to save timeline of job {job['id']}: {e}")
 
-            if not success:
-                raise Exception("Git clone failed")
+    def save_timeline(self, data: dict):
+        """Write a finished job's timeline, keeping only the newest ``TIMELINE_RETENTION`` files."""
+        path = self.timeline_dir / f"{data['job_id']}.json"
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data))
+        os.replace(tmp_path, path)
 
-            final_size = await asyncio.to_thread(self.get_directory_size, local_repo_path)
-            current_entry = self.download_progress.get(progress_key, {})
-            total_bytes = current_entry.get("total_bytes")
+        saved = sorted(self.timeline_dir.glob("*.json"), key=lambda item: item.stat().st_mtime)
+        for old in saved[:max(0, len(saved) - self.timeline_retention)]:
+            old.unlink(missing_ok=True)
 
-            effective_final = final_size
-            if total_bytes and total_bytes > 0:
-                clamped = min(final_size, total_bytes)
-                final_message = (
-                    f"Clone complete: {self.format_bytes(clamped)} / {self.format_bytes(total_bytes)}"
-                )
-                effective_final = clamped
-            else:
-                final_message = f"Clone complete: {self.format_bytes(final_size)}"
+    def job_timeline(self, job_id: str) -> Optional[dict]:
+        """A job's timeline: live while it is retained in memory, otherwise from disk."""
+        timeline = self.timelines.get(job_id)
+        if timeline is not None:
+            return timeline.to_dict()
+        if not re.fullmatch(r"[0-9a-f]+", job_id):
+            return None
+        path = self.timeline_dir / f"{job_id}.json"
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
 
-            print(f"Git clone completed successfully: {local_repo_path}")
-            self.update_progress(
-                progress_key,
-                "clone_complete",
-                final_message,
-                100,
-                downloaded_bytes=effective_final
-            )
-            return str(local_repo_path)
-        except Exception as e:
-            print(f"Git clone error: {e}")
-            self.update_progress(progress_key, "error", f"Git clone failed: {str(e)}", 0)
-            raise Exception(f"Failed to clone repository: {e}")
+    def collect_metrics(self) -> List[tuple]:
+        """Scrape-time gauges and counters mirrored from server state (see ``MetricsRegistry``)."""
+        samples = []
+        job_counts = {"queued": 0, "running": 0}
+        for job in self.jobs.values():
+            if job["status"] in job_counts:
+                job_counts[job["status"]] += 1
+        for status, count in job_counts.items():
+            samples.append(("jobs", "gauge", "Jobs queued or running", {"status": status}, count))
 
-    async def create_remote_directory(self, author: str, repo_name: str):
-        """Create directory structure on supercomputer"""
-        remote_path = f"{self.supercomputer_path}/{author}"
+        for name, slots in (
+            ("job", self.job_slots), ("download", self.download_slots),
+            ("upload", self.upload_slots), ("range", self.range_slots),
+        ):
+            samples.append(("queue_depth", "gauge", "Waiters queued for a slot", {"slot": name}, slots.waiting()))
+        samples.append((
+            "queue_depth", "gauge", "Waiters queued for a slot", {"slot": "staging_disk"}, self.staging_disk.waiting()
+        ))
 
-        try:
-            cmd = [
-                "ssh",
-                f"{self.supercomputer_user}@{self.supercomputer_host}",
-                f"mkdir -p {remote_path}"
-            ]
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            await process.communicate()
+        # Download rate is what the governor measured on the HTTP readers; upload rate sums
+        # the upload meters, which also cover unpaced scp transfers
+        upload_rate = sum(meter.smoothed_rate or 0.0 for meter in self.upload_meters.values())
+        for phase, rate in (("download", self.bandwidth.global_rates["download"]), ("upload", upload_rate)):
+            samples.append((
+                "throughput_bytes_per_second", "gauge", "Current transfer rate per phase", {"phase": phase}, rate
+            ))
+        for direction, moved in self.bandwidth.global_bytes.items():
+            samples.append((
+                "transferred_bytes_total", "counter", "Bytes moved through the bandwidth governor",
+                {"direction": direction}, moved
+            ))
 
-            if process.returncode != 0:
-                raise Exception("Failed to create remote directory")
-        except Exception as e:
-            raise Exception(f"Failed to create remote directory: {e}")
+        for pool_name, pool in (("control", self.ssh_pool), ("upload", self.upload_pool)):
+            healthy = sum(1 for slot in pool.slots if slot["healthy"])
+            for state, count in (("healthy", healthy), ("unhealthy", pool.size - healthy)):
+                samples.append((
+                    "ssh_connections", "gauge", "Pooled SSH master connections",
+                    {"pool": pool_name, "state": state}, count
+                ))
+            samples.append((
+                "ssh_reconnects_total", "counter", "SSH master reconnects",
+                {"pool": pool_name}, sum(slot["reconnects"] for slot in pool.slots)
+            ))
 
-    async def scp_transfer(self, local_path: str, author: str, repo_name: str):
-        """Transfer files to supercomputer using scp"""
-        remote_path = f"{self.supercomputer_user}@{self.supercomputer_host}:{self.supercomputer_path}/{author}/"
-        progress_key = f"{author}/{repo_name}"
+        blob_stats = self.blob_cache.stats
+        metadata_stats = self.hub_metadata.stats
+        for cache, hits, misses in (
+            ("blob", blob_stats["hits"], blob_stats["misses"]),
+            ("hub_metadata", metadata_stats["hits"] + metadata_stats["stale_hits"], metadata_stats["fetches"]),
+        ):
+            for result, count in (("hit", hits), ("miss", misses)):
+                samples.append((
+                    "cache_requests_total", "counter", "Cache lookups by result",
+                    {"cache": cache, "result": result}, count
+                ))
+            if hits + misses:
+                samples.append((
+                    "cache_hit_ratio", "gauge", "Cache hits over lookups", {"cache": cache}, hits / (hits + misses)
+                ))
 
-        try:
-            # Create remote directory first
-            await self.create_remote_directory(author, repo_name)
+        disk = self.staging_disk.status()
+        for state in ("free", "reserved", "outstanding"):
+            samples.append((
+                "staging_disk_bytes", "gauge", "Staging disk free space and job reservations",
+                {"state": state}, disk[f"{state}_bytes"]
+            ))
+        gc = self.staging_gc.status()
+        samples.append(("gc_queued_trees", "gauge", "Staging trees waiting to be deleted", {}, gc["queued"]))
+        samples.append(("gc_pending_bytes", "gauge", "Bytes left to delete in sized trees", {}, gc["pending_bytes"]))
+        samples.append((
+            "gc_deleted_bytes_total", "counter", "Bytes deleted by the staging GC", {}, gc["deleted_bytes"]
+        ))
 
-            self.update_progress(progress_key, "transferring", "Starting SCP transfer to supercomputer...", 0)
+        if self.loop_lag:
+            lags = sorted(self.loop_lag)
+            for quantile, label in ((0.5, "0.5"), (0.99, "0.99"), (1.0, "1")):
+                samples.append((
+                    "event_loop_lag_seconds", "gauge", "Event-loop timer lag over the last 600 samples",
+                    {"quantile": label}, lags[min(len(lags) - 1, int(quantile * len(lags)))]
+                ))
+        return samples
 
-            removed_git = self.remove_git_directory(local_path)
-            if removed_git:
-                self.update_progress(progress_key, "transferring", "Removed .git directory before transfer")
+    def create_batch(self, entries: List[dict]) -> dict:
+        """Group already-submitted jobs under one batch id (see ``batch_status``)."""
+        current_time = time.time()
+        for batch_id, batch in list(self.batches.items()):
+            if batch.get("finished_at") and current_time - batch["finished_at"] > self.job_retention:
+                del self.batches[batch_id]
 
-            cmd = [
-                "scp", "-r",
-                local_path,
-                f"{remote_path}{repo_name}"
-            ]
+        batch = {
+            "id": uuid.uuid4().hex[:12],
+            "created_at": current_time,
+            "finished_at": None,
+            "items": entries,
+        }
+        self.batches[batch["id"]] = batch
+        return batch
 
-            master_fd, slave_fd = os.openpty()
-            captured_logs: List[str] = []
+    def batch_status(self, batch: dict) -> dict:
+        """Aggregate the batch's jobs: status counts, bytes moved and throughput."""
+        counts: dict = {}
+        totals = {"total_bytes": 0, "downloaded_bytes": 0, "uploaded_bytes": 0}
+        rates = {"download": 0.0, "upload": 0.0}
+        unknown_sizes = 0
 
-            async def read_pty_output():
-                buffer = ""
-                loop = asyncio.get_running_loop()
+        for item in batch["items"]:
+            job = self.jobs.get(item["job_id"]) if item["job_id"] else None
+            if job is not None:
+                item["status"] = job["status"]
+                item["error"] = job["error"]
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+            if item["status"] == "exists":
+                continue
 
-                try:
-                    while True:
-                        chunk = await loop.run_in_executor(None, os.read, master_fd, 1024)
-                        if not chunk:
-                            break
+            total = item["total_bytes"]
+            if total is None:
+                unknown_sizes += 1
+                total = 0
+            totals["total_bytes"] += total
+            if item["status"] == "completed":
+                downloaded = uploaded = total
+            else:
+                progress = self.download_progress.get(f"{item['author']}/{item['repo_name']}") or {}
+                downloaded = progress.get("downloaded_bytes") or 0
+                uploaded = progress.get("uploaded_bytes") or 0
+            item["downloaded_bytes"] = downloaded
+            item["uploaded_bytes"] = uploaded
+            totals["downloaded_bytes"] += downloaded
+            totals["uploaded_bytes"] += uploaded
 
-                        decoded = chunk.decode(errors="ignore")
-                        buffer += decoded
+            if job is not None and job["status"] == "running":
+                for direction in rates:
+                    rates[direction] += job["bandwidth"][direction]["rate"]
 
-                        while True:
-                            candidates = [idx for idx in (
-                                buffer.find("\n"),
-                                buffer.find("\r")
-                            ) if idx != -1]
+        active = counts.get("queued", 0) + counts.get("running", 0)
+        failed = counts.get("failed", 0)
+        if active:
+            status = "running"
+        elif failed == len(batch["items"]):
+            status = "failed"
+        else:
+            status = "partial" if failed else "completed"
+        if not active and batch["finished_at"] is None:
+            batch["finished_at"] = time.time()
 
-                            if not candidates:
-                                break
+        elapsed = (batch["finished_at"] or time.time()) - batch["created_at"]
+        remaining = totals["total_bytes"] - totals["uploaded_bytes"]
+        return {
+            "id": batch["id"],
+            "status": status,
+            "created_at": batch["created_at"],
+            "finished_at": batch["finished_at"],
+            "counts": counts,
+            **totals,
+            "unknown_sizes": unknown_sizes,
+            "progress": int(totals["uploaded_bytes"] / totals["total_bytes"] * 100) if totals["total_bytes"] else None,
+            "download_rate": rates["download"],
+            "upload_rate": rates["upload"],
+            "average_throughput": totals["uploaded_bytes"] / elapsed if elapsed > 0 else 0.0,
+            "eta_seconds": remaining / rates["upload"] if active and rates["upload"] > 0 else None,
+            "items": batch["items"],
+        }
 
-                            split_index = min(candidates)
-                            line = buffer[:split_index]
-                            buffer = buffer[split_index + 1:]
-
-                            clean_line = line.strip()
-                            if clean_line:
-                                print(f"SCP PTY: {clean_line}")
-                                captured_logs.append(clean_line)
-                                self.update_progress(
-                                    progress_key,
-                                    "transferring",
-                                    clean_line,
-                                    log_type="info"
-                                )
-
-                    if buffer.strip():
-                        clean_line = buffer.strip()
-                        print(f"SCP PTY: {clean_line}")
-                        captured_logs.append(clean_line)
-                        self.update_progress(
-                            progress_key,
-                            "transferring",
-                            clean_line,
-                            log_type="info"
-                        )
-                finally:
-                    os.close(master_fd)
+proxy_server = DownloadProxyServer()
 
-            try:
-                process = await asyncio.create_subprocess_exec(
-                    *cmd,
-                    stdin=slave_fd,
-                    stdout=slave_fd,
-                    stderr=slave_fd
-                )
-            except Exception:
-                os.close(master_fd)
-                raise
-            finally:
-                os.close(slave_fd)
+def resolve_download_options(request: DownloadRequest) -> tuple:
+    """Validate a download request; returns ``(mode, selection)`` or raises a 400."""
+    mode = request.mode or proxy_server.transfer_mode
+    if mode not in ("staged", "pipelined", "relay"):
+        raise HTTPException(status_code=400, detail=f"Unknown transfer mode: {mode}")
 
-            reader_task = asyncio.create_task(read_pty_output())
-            return_code = await process.wait()
-            await reader_task
+    if request.upload_streams is not None and request.upload_streams < 1:
+        raise HTTPException(status_code=400, detail="upload_streams must be at least 1")
 
-            if return_code != 0:
-                self.update_progress(progress_key, "error", "SCP transfer failed", 0)
-                combined_logs = "\n".join(captured_logs)
-                raise Exception(f"SCP transfer failed with exit code {return_code}: {combined_logs}")
+    if request.compression is not None and request.compression not in ("off", "auto"):
+        raise HTTPException(status_code=400, detail=f"Unknown compression mode: {request.compression}")
 
-            self.update_progress(progress_key, "transfer_complete", "SCP transfer completed", 100)
-            self.cleanup_completed_progress(progress_key)
-        except Exception as e:
-            self.update_progress(progress_key, "error", f"SCP transfer failed: {str(e)}", 0)
-            self.cleanup_completed_progress(progress_key)
-            raise Exception(f"Failed to transfer files: {e}")
+    format_policy = request.format_policy or proxy_server.format_policy
+    if format_policy not in ("all", "prefer_safetensors"):
+        raise HTTPException(status_code=400, detail=f"Unknown format policy: {format_policy}")
 
-    def cleanup_local_files(self, local_path: str):
-        """Remove local files after successful transfer"""
-        try:
-            if os.path.exists(local_path):
-                shutil.rmtree(local_path)
-        except Exception as e:
-            print(f"Warning: Failed to cleanup local files: {e}")
+    selection = None
+    if request.include or request.exclude or format_policy != "all":
+        selection = {
+            "include": request.include or [],
+            "exclude": request.exclude or [],
+            "format_policy": format_policy,
+        }
+    return mode, selection
 
-    def remove_git_directory(self, repo_path: str):
-        """Delete the .git directory before transfer to reduce payload size."""
-        try:
-            git_dir = Path(repo_path) / ".git"
-            # Only delete if the path lives under our managed download root
-            if git_dir.exists() and git_dir.is_dir():
-                git_dir_relative = git_dir.resolve().relative_to(self.local_download_path.resolve())
-                print(f"Removing git metadata: {git_dir}")
-                shutil.rmtree(git_dir)
-                return str(git_dir_relative)
-        except ValueError:
-            # Path is outside our managed download directory; skip removal for safety
-            print(f"Skipping .git removal for unmanaged path: {repo_path}")
-        except Exception as e:
-            print(f"Warning: Failed to remove .git directory: {e}")
-        return None
+async def enqueue_download(request: DownloadRequest, mode: str, selection: Optional[dict]) -> DownloadResponse:
+    """Queue one validated request, unless the model is already on the supercomputer."""
+    # Check if model already exists on supercomputer (a sync request updates it instead)
+    print(f"Checking if model exists on supercomputer...")
+    if not request.sync and await proxy_server.check_if_exists_on_supercomputer(request.author, request.repo_name):
+        print(f"Model already exists on supercomputer")
+        return DownloadResponse(
+            status="exists",
+            message=f"Model {request.author}/{request.repo_name} already exists on supercomputer",
+            supercomputer_path=f"{proxy_server.supercomputer_path}/{request.author}/{request.repo_name}"
+        )
 
-proxy_server = DownloadProxyServer()
+    job, created = proxy_server.submit_job(
+        request.author, request.repo_name, mode, selection,
+        request.priority, requested_rate_limits(request), request.upload_streams, request.sync,
+        request.revision, request.compression
+    )
+    if created:
+        message = f"Queued {request.author}/{request.repo_name} as job {job['id']}"
+    else:
+        message = f"Attached to in-flight job {job['id']} for {request.author}/{request.repo_name}"
+
+    return DownloadResponse(
+        status=job["status"],
+        message=message,
+        job_id=job["id"],
+        supercomputer_path=f"{proxy_server.supercomputer_path}/{request.author}/{request.repo_name}"
+    )
 
 @app.post("/download", response_model=DownloadResponse)
 async def download_model(request: DownloadRequest):
@@ -601,54 +5778,150 @@ async def download_model(request: DownloadRequest):
     print(f"URL: {request.url}")
     print(f"=====================================\n")
 
-    # Check if model already exists on supercomputer
-    print(f"Checking if model exists on supercomputer...")
-    if proxy_server.check_if_exists_on_supercomputer(request.author, request.repo_name):
-        print(f"Model already exists on supercomputer")
-        return DownloadResponse(
-            status="exists",
-            message=f"Model {request.author}/{request.repo_name} already exists on supercomputer",
-            supercomputer_path=f"{proxy_server.supercomputer_path}/{request.author}/{request.repo_name}"
-        )
+    mode, selection = resolve_download_options(request)
+    return await enqueue_download(request, mode, selection)
 
-    try:
-        # Step 1: Clone repository
-        local_path = await proxy_server.git_clone_repo(request.author, request.repo_name)
+@app.post("/batch")
+async def batch_download(request: BatchRequest):
+    """Queue a set of repos as one batch and return its aggregate status"""
+    if not request.repos:
+        raise HTTPException(status_code=400, detail="A batch needs at least one repo")
+    options = [resolve_download_options(item) for item in request.repos]
+    print(f"\n=== BATCH REQUEST RECEIVED: {len(request.repos)} repos ===\n")
 
-        # Step 2: Transfer to supercomputer
-        await proxy_server.scp_transfer(local_path, request.author, request.repo_name)
+    # Resolve every Hub listing at once; the jobs then find them in the metadata cache
+    listings = await asyncio.gather(*(
+        proxy_server.get_repo_metadata(item.author, item.repo_name, item.revision) for item in request.repos
+    ))
 
-        # Step 3: Cleanup local files
-        proxy_server.cleanup_local_files(local_path)
+    entries = []
+    for item, (mode, selection), metadata in zip(request.repos, options, listings):
+        response = await enqueue_download(item, mode, selection)
+        selected = proxy_server.select_repo_files(metadata["files"], selection) if metadata else None
+        entries.append({
+            "author": item.author,
+            "repo_name": item.repo_name,
+            "revision": metadata["sha"] if metadata else item.revision,
+            "job_id": response.job_id,
+            "status": response.status,
+            "message": response.message,
+            "total_bytes": sum(entry["size"] or 0 for entry in selected) if selected is not None else None,
+        })
 
-        return DownloadResponse(
-            status="success",
-            message=f"Successfully downloaded and transferred {request.author}/{request.repo_name}",
-            local_path=local_path,
-            supercomputer_path=f"{proxy_server.supercomputer_path}/{request.author}/{request.repo_name}"
-        )
+    batch = proxy_server.create_batch(entries)
+    return proxy_server.batch_status(batch)
+
+@app.get("/batches")
+async def list_batches():
+    """List batches with their aggregate progress"""
+    batches = sorted(proxy_server.batches.values(), key=lambda batch: batch["created_at"])
+    return {"batches": [proxy_server.batch_status(batch) for batch in batches], "count": len(batches)}
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Aggregate byte and throughput progress of one batch"""
+    batch = proxy_server.batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Unknown batch: {batch_id}")
+    return proxy_server.batch_status(batch)
+
+def requested_rate_limits(settings) -> dict:
+    """Map the ``*_rate_limit_mb`` fields that were set to bytes/s (``0`` means unlimited)."""
+    limits = {}
+    for direction in BandwidthGovernor.DIRECTIONS:
+        value = getattr(settings, f"{direction}_rate_limit_mb")
+        if value is not None:
+            limits[direction] = BandwidthGovernor.mb_to_rate(value)
+    return limits
 
-    except Exception as e:
-        # Cleanup on error
-        if 'local_path' in locals():
-            proxy_server.cleanup_local_files(local_path)
+@app.get("/jobs")
+async def list_jobs():
+    """List queued, running and recently finished jobs"""
+    jobs = sorted(proxy_server.jobs.values(), key=lambda job: job["created_at"])
+    return {"jobs": jobs, "count": len(jobs)}
 
-        raise HTTPException(status_code=500, detail=str(e))
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get a job with its current progress"""
+    job = proxy_server.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return {**job, "progress": proxy_server.download_progress.get(job["key"])}
+
+@app.get("/jobs/{job_id}/timeline")
+async def get_job_timeline(job_id: str, format: str = "json"):
+    """Get a job's phase/file/range spans with a summary, or as a Chrome trace (format=chrome)"""
+    if format not in ("json", "chrome"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'chrome'")
+    data = await asyncio.to_thread(proxy_server.job_timeline, job_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"No timeline for job: {job_id}")
+    return JobTimeline.chrome_trace(data) if format == "chrome" else data
+
+@app.put("/jobs/{job_id}/bandwidth")
+async def update_job_bandwidth(job_id: str, settings: JobBandwidthSettings):
+    """Change a queued or running job's priority and per-job rate limits"""
+    job = proxy_server.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if proxy_server.active_jobs.get(job["key"]) != job_id:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is no longer active")
+    limits = requested_rate_limits(settings)
+    proxy_server.bandwidth.update_job(job["key"], settings.priority, limits)
+    if settings.priority is not None:
+        job["priority"] = settings.priority
+    job["rate_limits"] = {**job["rate_limits"], **limits}
+    return job
+
+@app.get("/bandwidth")
+async def get_bandwidth():
+    """Global and per-job bandwidth limits with effective and measured rates (bytes/s)"""
+    return proxy_server.bandwidth.status()
+
+@app.put("/bandwidth")
+async def update_bandwidth(settings: BandwidthSettings):
+    """Change the global rate limits and the time-of-day schedule at runtime"""
+    if settings.schedule is not None:
+        try:
+            proxy_server.bandwidth.set_schedule(settings.schedule)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    for direction, rate in requested_rate_limits(settings).items():
+        proxy_server.bandwidth.set_limit(direction, rate)
+    return proxy_server.bandwidth.status()
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "message": "Download proxy server is running"}
+    return {
+        "status": "healthy",
+        "message": "Download proxy server is running",
+        "ssh_pool": proxy_server.ssh_pool.status(),
+        "upload_pool": proxy_server.upload_pool.status(),
+        "blob_cache": proxy_server.blob_cache.status(),
+        "hub_metadata": proxy_server.hub_metadata.status(),
+        "staging_disk": {**proxy_server.staging_disk.status(), "gc": proxy_server.staging_gc.status()}
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: phase timings, throughput, queues, SSH pools and caches"""
+    return PlainTextResponse(
+        proxy_server.metrics.render(proxy_server.collect_metrics()),
+        media_type="text/plain; version=0.0.4"
+    )
 
 @app.get("/status/{author}/{repo_name}")
 async def check_status(author: str, repo_name: str):
     """Check if model exists on supercomputer"""
-    exists = proxy_server.check_if_exists_on_supercomputer(author, repo_name)
+    exists = await proxy_server.check_if_exists_on_supercomputer(author, repo_name)
+    delivered = proxy_server.revision_ledger.lookup(f"{author}/{repo_name}") if exists else None
     return {
         "author": author,
         "repo_name": repo_name,
         "exists_on_supercomputer": exists,
-        "path": f"{proxy_server.supercomputer_path}/{author}/{repo_name}" if exists else None
+        "path": f"{proxy_server.supercomputer_path}/{author}/{repo_name}" if exists else None,
+        "delivered_revision": delivered["sha"] if delivered else None
     }
 
 @app.get("/progress/{author}/{repo_name}")
@@ -672,6 +5945,35 @@ async def get_progress(author: str, repo_name: str):
         **progress
     }
 
+@app.get("/events/{author}/{repo_name}")
+async def stream_progress(author: str, repo_name: str, request: Request):
+    """Stream progress for a specific repository as Server-Sent Events"""
+    progress_key = f"{author}/{repo_name}"
+    progress = proxy_server.download_progress.get(progress_key)
+    initial = {progress_key: progress} if progress else {}
+
+    return StreamingResponse(
+        proxy_server.progress_broker.stream(request, initial, keys={progress_key}),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/events")
+async def stream_all_progress(request: Request):
+    """Stream progress for all downloads as Server-Sent Events"""
+    current_time = time.time()
+    initial = {
+        key: progress for key, progress in proxy_server.download_progress.items()
+        if progress.get('status') not in ['transfer_complete', 'error'] and
+        current_time - progress.get('timestamp', 0) < 3600
+    }
+
+    return StreamingResponse(
+        proxy_server.progress_broker.stream(request, initial),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/downloads/active")
 async def get_active_downloads():
     """Get all active downloads"""
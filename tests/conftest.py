@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# server.py builds its DownloadProxyServer on import; keep its state out of the real download path
+os.environ["LOCAL_DOWNLOAD_PATH"] = tempfile.mkdtemp(prefix="hf_proxy_tests_")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
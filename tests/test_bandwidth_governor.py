@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from server import BandwidthGovernor
+
+MB = 1024 * 1024
+
+
+def rates(governor, direction="download"):
+    return {key: job["view"][direction]["effective_rate"] for key, job in governor.jobs.items()}
+
+
+def test_water_fill_splits_by_weight():
+    shares = BandwidthGovernor.water_fill(3 * MB, {"a": 1.0, "b": 2.0}, {"a": None, "b": None})
+    assert shares == pytest.approx({"a": 1 * MB, "b": 2 * MB})
+
+
+def test_water_fill_hands_capped_share_to_the_rest():
+    shares = BandwidthGovernor.water_fill(
+        10 * MB, {"a": 1.0, "b": 1.0, "c": 1.0}, {"a": 1 * MB, "b": None, "c": None}
+    )
+    assert shares == pytest.approx({"a": 1 * MB, "b": 4.5 * MB, "c": 4.5 * MB})
+
+
+def test_water_fill_leaves_limit_unused_when_every_job_is_capped():
+    shares = BandwidthGovernor.water_fill(10 * MB, {"a": 1.0, "b": 4.0}, {"a": 1 * MB, "b": 2 * MB})
+    assert shares == {"a": 1 * MB, "b": 2 * MB}
+
+
+def test_water_fill_without_global_limit_uses_job_caps():
+    assert BandwidthGovernor.water_fill(None, {"a": 1.0, "b": 1.0}, {"a": 1 * MB, "b": None}) == {
+        "a": 1 * MB, "b": None
+    }
+
+
+def test_active_jobs_share_global_limit_by_priority():
+    governor = BandwidthGovernor({"download": 3 * MB}, {})
+    governor.register("a", priority=0)
+    governor.register("b", priority=1)
+    governor.reserve("a", "download", 1)
+    governor.reserve("b", "download", 1)
+    governor.rebalance()
+    assert rates(governor) == pytest.approx({"a": 1 * MB, "b": 2 * MB})
+    assert rates(governor, "upload") == {"a": None, "b": None}
+
+
+def test_idle_job_is_offered_the_share_it_would_get():
+    governor = BandwidthGovernor({"download": 3 * MB}, {})
+    governor.register("a", priority=0)
+    governor.register("b", priority=1)
+    governor.reserve("a", "download", 1)
+    governor.rebalance()
+    # Only "a" is moving bytes, so it gets the whole limit; "b" would get 2/3 on waking
+    assert rates(governor) == pytest.approx({"a": 3 * MB, "b": 2 * MB})
+
+
+def test_job_limit_caps_share_and_frees_the_rest():
+    governor = BandwidthGovernor({"upload": 4 * MB}, {"upload": 1 * MB})
+    governor.register("a")
+    governor.register("b", limits={"upload": None})
+    governor.reserve("a", "upload", 1)
+    governor.reserve("b", "upload", 1)
+    governor.rebalance()
+    assert rates(governor, "upload") == pytest.approx({"a": 1 * MB, "b": 3 * MB})
+
+
+def test_update_job_priority_rebalances():
+    governor = BandwidthGovernor({"download": 4 * MB}, {})
+    governor.register("a")
+    governor.register("b")
+    governor.reserve("a", "download", 1)
+    governor.reserve("b", "download", 1)
+    governor.rebalance()
+    assert rates(governor) == pytest.approx({"a": 2 * MB, "b": 2 * MB})
+
+    assert governor.update_job("b", priority=1)
+    assert rates(governor) == pytest.approx({"a": 4 * MB / 3, "b": 8 * MB / 3})
+    assert not governor.update_job("missing", priority=1)
+
+
+def test_hold_counts_job_as_active():
+    async def scenario():
+        governor = BandwidthGovernor({"upload": 2 * MB}, {})
+        governor.register("a")
+        governor.register("b")
+        governor.reserve("a", "upload", 1)
+        async with governor.hold("b", "upload"):
+            assert rates(governor, "upload") == pytest.approx({"a": 1 * MB, "b": 1 * MB})
+        assert governor.jobs["b"]["holds"]["upload"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_unregister_returns_share_to_remaining_jobs():
+    governor = BandwidthGovernor({"download": 2 * MB}, {})
+    governor.register("a")
+    governor.register("b")
+    governor.reserve("a", "download", 1)
+    governor.reserve("b", "download", 1)
+    governor.unregister("b")
+    assert rates(governor) == pytest.approx({"a": 2 * MB})
+
+
+def test_schedule_window_overrides_base_limit():
+    # Two windows covering the whole day, the second wrapping past midnight
+    schedule = "00:00-12:00 download=1; 12:00-00:00 download=1,upload=0"
+    governor = BandwidthGovernor({"download": 8 * MB, "upload": 8 * MB}, {}, schedule)
+    assert governor.active_window() is not None
+    assert governor.global_limit("download") == 1 * MB
+    if governor.active_window()["start"] == 12 * 60:
+        assert governor.global_limit("upload") is None
+    else:
+        assert governor.global_limit("upload") == 8 * MB
+
+
+def test_parse_schedule_rejects_bad_windows():
+    with pytest.raises(ValueError, match="unknown direction"):
+        BandwidthGovernor.parse_schedule("01:00-02:00 sideways=5")
+    with pytest.raises(ValueError, match="bad schedule window"):
+        BandwidthGovernor.parse_schedule("0100-0200 download=5")
+    with pytest.raises(ValueError, match="time out of range"):
+        BandwidthGovernor.parse_schedule("22:00-25:00 upload=5")
+    assert BandwidthGovernor.parse_schedule("18:00-24:00 upload=5")[0]["end"] == 24 * 60
+    assert BandwidthGovernor.parse_schedule("") == []
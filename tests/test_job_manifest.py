@@ -0,0 +1,97 @@
+from server import JobManifest
+
+
+def test_advance_records_offset_per_range(tmp_path):
+    manifest = JobManifest(tmp_path / "job.json")
+    manifest.start_file("model.bin", 3000, 1000)
+    manifest.advance("model.bin", 0, 400, tmp_path / "model.bin.incomplete")
+    manifest.advance("model.bin", 1000, 1000, tmp_path / "model.bin.incomplete")
+    manifest.advance("model.bin", 0, 900, tmp_path / "model.bin.incomplete")
+
+    state = manifest.file_state("model.bin")
+    assert state["size"] == 3000
+    assert state["chunk"] == 1000
+    assert state["ranges"] == {"0": 900, "1000": 1000}
+
+
+def test_advance_ignores_files_not_started(tmp_path):
+    manifest = JobManifest(tmp_path / "job.json")
+    manifest.advance("missing.bin", 0, 100, tmp_path / "missing.bin.incomplete")
+    assert manifest.file_state("missing.bin") == {}
+
+
+def test_file_state_is_a_copy(tmp_path):
+    manifest = JobManifest(tmp_path / "job.json")
+    manifest.start_file("a.txt", 10, 1000)
+    manifest.file_state("a.txt")["size"] = 99
+    assert manifest.file_state("a.txt")["size"] == 10
+
+
+def test_bind_revision_forgets_progress_when_revision_moves(tmp_path):
+    manifest = JobManifest(tmp_path / "job.json")
+    assert manifest.bind_revision("abc") is False
+    manifest.start_file("a.txt", 10, 1000)
+    manifest.advance("a.txt", 0, 5, tmp_path / "a.txt.incomplete")
+
+    assert manifest.bind_revision("abc") is True
+    assert manifest.file_state("a.txt")["ranges"] == {"0": 5}
+
+    assert manifest.bind_revision("def") is False
+    assert manifest.file_state("a.txt") == {}
+    assert manifest.data["revision"] == "def"
+
+
+def test_paths_with_flag(tmp_path):
+    manifest = JobManifest(tmp_path / "job.json")
+    manifest.start_file("a.txt", 10, 1000)
+    manifest.mark("a.txt", "downloaded")
+    manifest.mark("b.txt", "downloaded")
+    manifest.mark("b.txt", "uploaded")
+
+    assert manifest.paths_with("downloaded") == {"a.txt", "b.txt"}
+    assert manifest.paths_with("uploaded") == {"b.txt"}
+    # Marking keeps the range checkpoint of a started file
+    assert manifest.file_state("a.txt")["size"] == 10
+
+
+def test_save_and_load_keep_resume_offsets(tmp_path):
+    path = tmp_path / "job.json"
+    partial = tmp_path / "model.bin.incomplete"
+    partial.write_bytes(b"\0" * 3000)
+
+    manifest = JobManifest(path)
+    manifest.bind_revision("abc")
+    manifest.start_file("model.bin", 3000, 1000)
+    manifest.advance("model.bin", 0, 1000, partial)
+    manifest.advance("model.bin", 2000, 2500, partial)
+    manifest.mark("config.json", "uploaded")
+    manifest.save()
+
+    loaded = JobManifest.load(path)
+    assert loaded is not None
+    assert loaded.data["revision"] == "abc"
+    state = loaded.file_state("model.bin")
+    assert {int(start): offset for start, offset in state["ranges"].items()} == {0: 1000, 2000: 2500}
+    assert loaded.paths_with("uploaded") == {"config.json"}
+    assert not path.with_suffix(".tmp").exists()
+
+
+def test_save_skips_unchanged_and_deleted_manifests(tmp_path):
+    path = tmp_path / "job.json"
+    manifest = JobManifest(path)
+    manifest.save()
+
+    path.write_text("{}")
+    manifest.save()
+    assert path.read_text() == "{}"
+
+    manifest.delete()
+    manifest.mark("a.txt", "uploaded")
+    manifest.save()
+    assert not path.exists()
+
+
+def test_load_returns_none_for_corrupt_manifest(tmp_path):
+    path = tmp_path / "job.json"
+    path.write_text("{not json")
+    assert JobManifest.load(path) is None
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+import server
+from server import RemoteHashIndex, RevisionLedger
+
+
+def entry(path: str, sha256: str = None, blob_id: str = None, size: int = 10) -> dict:
+    return {"path": path, "size": size, "sha256": sha256, "blob_id": blob_id}
+
+
+@pytest.fixture
+def proxy(tmp_path, monkeypatch):
+    """The module's DownloadProxyServer with the Hub and the supercomputer faked out."""
+    proxy = server.proxy_server
+    monkeypatch.setattr(proxy, "revision_ledger", RevisionLedger(tmp_path / "delivered_revisions.json"))
+    monkeypatch.setattr(proxy, "remote_hash_index", RemoteHashIndex(tmp_path / "remote_hash_index.json"))
+    monkeypatch.setattr(proxy, "remote_dedup", False)
+    monkeypatch.setattr(proxy, "verify_remote", False)
+
+    proxy.hub = {}
+    proxy.removed_calls = []
+    proxy.sent = []
+
+    async def get_repo_metadata(author, repo_name, revision=None):
+        return proxy.hub
+
+    async def verify_remote_files(author, repo_name, files):
+        return {entry["path"] for entry in files}
+
+    async def run_transfer_mode(author, repo_name, mode, selection, skip, verify):
+        selected = proxy.select_repo_files(proxy.hub["files"], selection)
+        proxy.sent.append(sorted(entry["path"] for entry in selected if entry["path"] not in skip))
+        return None
+
+    async def remove_remote_files(author, repo_name, paths):
+        proxy.removed_calls.append(list(paths))
+
+    monkeypatch.setattr(proxy, "get_repo_metadata", get_repo_metadata)
+    monkeypatch.setattr(proxy, "verify_remote_files", verify_remote_files)
+    monkeypatch.setattr(proxy, "run_transfer_mode", run_transfer_mode)
+    monkeypatch.setattr(proxy, "remove_remote_files", remove_remote_files)
+    yield proxy
+    for name in ("hub", "removed_calls", "sent"):
+        delattr(proxy, name)
+
+
+def test_narrower_sync_only_removes_files_gone_upstream(proxy):
+    proxy.hub = {
+        "sha": "a" * 40,
+        "files": [
+            entry("config.json", blob_id="c1"),
+            entry("model.safetensors", sha256="m1"),
+            entry("tokenizer.json", blob_id="t1"),
+            entry("old.bin", sha256="o1"),
+        ],
+    }
+    asyncio.run(proxy.transfer_repo("org", "model", "staged", None, sync=True))
+    assert proxy.removed_calls == []
+
+    proxy.hub = {
+        "sha": "b" * 40,
+        "files": [
+            entry("config.json", blob_id="c1"),
+            entry("model.safetensors", sha256="m2"),
+            entry("tokenizer.json", blob_id="t2"),
+        ],
+    }
+    selection = {"include": ["*.safetensors"]}
+    asyncio.run(proxy.transfer_repo("org", "model", "staged", selection, sync=True))
+
+    assert proxy.removed_calls == [["old.bin"]]
+    assert proxy.sent[-1] == ["model.safetensors"]
+    delivered = proxy.revision_ledger.lookup("org/model")["files"]
+    assert sorted(delivered) == ["config.json", "model.safetensors", "tokenizer.json"]
+    assert delivered["model.safetensors"][0] == "sha256/m2"
+    # Left out of the selection, tokenizer.json still holds the delivered content
+    assert delivered["tokenizer.json"][0] == "sha1/t1"
+
+
+def test_narrower_sync_with_nothing_gone_upstream_deletes_nothing(proxy):
+    files = [entry("config.json", blob_id="c1"), entry("model.safetensors", sha256="m1")]
+    proxy.hub = {"sha": "a" * 40, "files": files}
+    asyncio.run(proxy.transfer_repo("org", "model", "staged", None, sync=True))
+
+    proxy.hub = {"sha": "b" * 40, "files": files}
+    asyncio.run(proxy.transfer_repo("org", "model", "staged", {"include": ["config.json"]}, sync=True))
+
+    assert proxy.removed_calls == []
+    assert sorted(proxy.revision_ledger.lookup("org/model")["files"]) == ["config.json", "model.safetensors"]
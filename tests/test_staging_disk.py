@@ -0,0 +1,178 @@
+import asyncio
+from collections import namedtuple
+
+import pytest
+
+from server import ByteCounter, StagingDisk, StagingWindow
+
+DiskUsage = namedtuple("DiskUsage", "total used free")
+
+
+class FakeDisk(StagingDisk):
+    """StagingDisk over a fixed-size disk whose free space the test sets."""
+
+    def __init__(self, total: int, free: int, floor_bytes: int = 0):
+        super().__init__(None, floor_bytes, poll_interval=0.01)
+        self.total = total
+        self.free = free
+
+    def usage(self):
+        return DiskUsage(self.total, self.total - self.free, self.free)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_outstanding_counts_written_bytes_against_reservation():
+    async def scenario():
+        disk = FakeDisk(1000, 1000)
+        await disk.reserve("a", 400)
+        assert disk.outstanding() == 400
+
+        counter = ByteCounter()
+        disk.track("a", counter)
+        counter.add(150)
+        assert disk.outstanding() == 250
+        assert disk.available() == 750
+
+        counter.add(500)
+        assert disk.outstanding() == 0
+
+    asyncio.run(scenario())
+
+
+def test_freed_bytes_do_not_count_as_written():
+    async def scenario():
+        disk = FakeDisk(1000, 1000)
+        await disk.reserve("a", 600)
+        counter = ByteCounter()
+        disk.track("a", counter)
+        # A resumed job reports bytes that were already on disk before it started
+        counter.add(600)
+        disk.freed("a", 600)
+        assert disk.outstanding() == 600
+
+        waiter = asyncio.ensure_future(disk.reserve("b", 600))
+        await settle()
+        assert not waiter.done()
+
+        disk.release("a")
+        await asyncio.wait_for(waiter, 1)
+        assert set(disk.reservations) == {"b"}
+
+    asyncio.run(scenario())
+
+
+def test_admit_follows_priority_then_arrival():
+    async def scenario():
+        disk = FakeDisk(1000, 1000)
+        await disk.reserve("first", 800)
+        low = asyncio.ensure_future(disk.reserve("low", 500, priority=0))
+        await settle()
+        high = asyncio.ensure_future(disk.reserve("high", 500, priority=5))
+        later = asyncio.ensure_future(disk.reserve("later", 500, priority=5))
+        await settle()
+        assert [waiter["key"] for waiter in disk.status()["waiting"]] == ["high", "later", "low"]
+
+        disk.release("first")
+        await settle()
+        assert high.done() and later.done() and not low.done()
+        assert set(disk.reservations) == {"high", "later"}
+
+        disk.release("high")
+        await asyncio.wait_for(low, 1)
+
+    asyncio.run(scenario())
+
+
+def test_admit_does_not_let_small_jobs_jump_the_queue():
+    async def scenario():
+        disk = FakeDisk(1000, 1000)
+        await disk.reserve("first", 600)
+        big = asyncio.ensure_future(disk.reserve("big", 900))
+        await settle()
+        small = asyncio.ensure_future(disk.reserve("small", 100))
+        await settle()
+        assert not small.done()
+        assert not disk.fits(100)
+
+        disk.release("first")
+        await asyncio.wait_for(big, 1)
+        await asyncio.wait_for(small, 1)
+
+    asyncio.run(scenario())
+
+
+def test_reserve_fails_when_job_can_never_fit():
+    async def scenario():
+        disk = FakeDisk(1000, 1000, floor_bytes=200)
+        with pytest.raises(Exception, match="holds at most"):
+            await disk.reserve("huge", 900)
+
+        # Fits the disk, but nothing admitted or being deleted will free the space
+        disk.free = 500
+        with pytest.raises(Exception, match="Not enough staging space"):
+            await disk.reserve("stuck", 400)
+        assert disk.reservations == {}
+        assert disk.waiting() == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        disk = FakeDisk(1000, 1000)
+        await disk.reserve("first", 900)
+        waiter = asyncio.ensure_future(disk.reserve("b", 500))
+        await settle()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert disk.waiting() == 0
+
+        disk.release("first")
+        assert disk.reservations == {}
+
+    asyncio.run(scenario())
+
+
+def test_disabled_admission_reserves_nothing():
+    async def scenario():
+        disk = FakeDisk(1000, 0)
+        disk.enabled = False
+        await disk.reserve("a", 10 ** 12)
+        assert disk.reservations == {}
+        assert disk.fits(10 ** 12)
+
+    asyncio.run(scenario())
+
+
+def test_staging_window_holds_files_up_to_limit():
+    async def scenario():
+        window = StagingWindow(10)
+        await window.acquire(6)
+        second = asyncio.ensure_future(window.acquire(6))
+        await settle()
+        assert not second.done()
+
+        await window.release(6)
+        await asyncio.wait_for(second, 1)
+        assert window.held == 6
+
+    asyncio.run(scenario())
+
+
+def test_staging_window_lets_an_oversized_file_through_alone():
+    async def scenario():
+        window = StagingWindow(10)
+        await window.acquire(25)
+        small = asyncio.ensure_future(window.acquire(1))
+        await settle()
+        assert not small.done()
+
+        await window.release(25)
+        await asyncio.wait_for(small, 1)
+
+    asyncio.run(scenario())
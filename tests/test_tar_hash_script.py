@@ -0,0 +1,65 @@
+import hashlib
+import shlex
+import shutil
+import subprocess
+
+import pytest
+
+from server import DownloadProxyServer
+
+pytestmark = pytest.mark.skipif(shutil.which("tar") is None, reason="needs tar")
+
+
+def git_blob_id(data: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def extract(tmp_path, contents: dict, sha256_paths: list, check_size: bool = False):
+    source = tmp_path / "source"
+    members = []
+    for path, data in contents.items():
+        local = source / path
+        local.parent.mkdir(parents=True, exist_ok=True)
+        local.write_bytes(data)
+        members.append((path, local, len(data)))
+    stream = b"".join(data for data, _, _ in DownloadProxyServer.tar_segments(members))
+
+    script = tmp_path / "hash.sh"
+    script.write_text(DownloadProxyServer.tar_hash_script(sha256_paths, check_size))
+    target = tmp_path / "target"
+    target.mkdir()
+    result = subprocess.run(
+        ["tar", "-xf", "-", f"--to-command=sh {shlex.quote(str(script))}"],
+        input=stream, cwd=target, capture_output=True
+    )
+    return result, target
+
+
+def test_members_are_written_and_hashed_in_order(tmp_path):
+    contents = {
+        "config.json": b'{"a": 1}',
+        "model.safetensors": b"\x00\x01" * 5000,
+        "tokenizer/vocab.txt": b"hello\nworld\n",
+        "nested dir/it's [odd].bin": b"x" * 3,
+        "empty.txt": b"",
+    }
+    sha256_paths = ["model.safetensors", "nested dir/it's [odd].bin"]
+    result, target = extract(tmp_path, contents, sha256_paths, check_size=True)
+    assert result.returncode == 0, result.stderr
+
+    digests = [line.split()[0] for line in result.stdout.decode().splitlines()]
+    expected = [
+        hashlib.sha256(data).hexdigest() if path in sha256_paths else git_blob_id(data)
+        for path, data in contents.items()
+    ]
+    assert digests == expected
+    for path, data in contents.items():
+        assert (target / path).read_bytes() == data
+
+
+def test_glob_characters_in_paths_match_literally(tmp_path):
+    contents = {"a*.bin": b"star", "ab.bin": b"plain"}
+    result, _ = extract(tmp_path, contents, ["a*.bin"])
+    assert result.returncode == 0, result.stderr
+    digests = [line.split()[0] for line in result.stdout.decode().splitlines()]
+    assert digests == [hashlib.sha256(b"star").hexdigest(), git_blob_id(b"plain")]